@@ -0,0 +1,61 @@
+# Compares palette index lookup using the linear scan formerly used by the Blender export script (palette[start:].index(colour))
+# with the vectorised lookups in maxis_mesh.palette.
+
+# Usage: python benchmark-palette.py [--palette <.gpl or sim3d1.max path>] [--faces <count>]
+# Without --palette, a random palette is used.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# The maxis_mesh package is in the parent folder.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from maxis_mesh.palette import Palette, load_palette
+
+parser = argparse.ArgumentParser(description="Benchmark palette index lookup.")
+parser.add_argument('--palette', help="Path to a GIMP palette (.gpl) or a mesh file (sim3d1.max).")
+parser.add_argument('--faces', type=int, default=50000, help="Number of face colours to look up.")
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+rng = random.Random(args.seed)
+
+if args.palette:
+    palette = load_palette(args.palette)
+else:
+    palette = Palette([[rng.randrange(256) for _ in range(3)] for _ in range(256)])
+
+paletteList = palette.colors.tolist()
+
+# Colours taken from the palette (so the linear scan succeeds), a third of them restricted to the unshaded range.
+starts = [246 if rng.random() < 1/3 else 0 for _ in range(args.faces)]
+colors = [paletteList[rng.randrange(start, 256)] for start in starts]
+
+begin = time.perf_counter()
+linear = [start + paletteList[start:].index(color) for start, color in zip(starts, colors)]
+linearTime = time.perf_counter() - begin
+
+begin = time.perf_counter()
+startArray = np.array(starts)
+colorArray = np.array(colors)
+tabulated = np.empty(len(colors), dtype=np.int64)
+for start in (0, 246):
+    subset = startArray == start
+    tabulated[subset], _ = palette.lookup(colorArray[subset], start)
+tableTime = time.perf_counter() - begin
+
+assert tabulated.tolist() == linear, "Lookup results differ."
+
+begin = time.perf_counter()
+palette.nearest_indices(np.array([[rng.randrange(256) for _ in range(3)] for _ in range(args.faces)]))
+nearestTime = time.perf_counter() - begin
+
+print(f"Faces: {args.faces}")
+print(f"Linear scan:              {linearTime*1000:.1f} ms")
+print(f"Exact table lookup:       {tableTime*1000:.1f} ms ({linearTime/tableTime:.1f}x faster)")
+print(f"Nearest lookup:           {nearestTime*1000:.1f} ms")
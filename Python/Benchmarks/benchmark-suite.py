@@ -0,0 +1,202 @@
+# Times the main operations of the maxis_mesh package on synthetic mesh files of increasing size and saves the results as JSON.
+
+# Mesh files are generated by maxis_mesh.synthetic, with the given number of objects multiplied by each scale (the real files
+# contain around 400 objects each). For each file, the following stages are timed:
+#   parse:          reading every object header, vertex and face with MaxFile
+#   parse-arrays:   decoding the whole file into NumPy arrays with maxis_mesh.arrays.decode_file
+#   tabulate:       writing all the tables with maxis_mesh.batch.tabulate_files
+#   extract:        writing every object to its own .bin file (like mesh-extract)
+#   replace:        replacing every 10th object with maxis_mesh.replace.replace_objects
+#   encode:         re-encoding every object from the decoded arrays as a MaxObject
+#   export:         exporting every object to OBJ and binary glTF with maxis_mesh.export.export_files
+# Each stage runs in a fresh process so its peak resident set size (RSS) can be measured. Peak RSS isn't available on Windows.
+
+# Usage: python benchmark-suite.py [--scales <scale> [...]] [--objects <count>] [--stages <stage> [...]] [--repeat <count>]
+#                                  [--output <.json path>] [--baseline <.json path>] [--work-dir <path>]
+# With --baseline, each result is compared with the matching result in a previously saved file.
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# The maxis_mesh package is in the parent folder.
+PACKAGE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PACKAGE_FOLDER)
+
+import numpy as np
+
+from maxis_mesh import MaxFile, MaxObject
+from maxis_mesh.arrays import decode_arrays, decode_file
+from maxis_mesh.batch import tabulate_files
+from maxis_mesh.export import export_files
+from maxis_mesh.instrument import peak_rss
+from maxis_mesh.replace import replace_objects
+from maxis_mesh.synthetic import DEFAULT_OBJECT_COUNT, synthetic_object, write_synthetic_mesh_file
+
+
+def stage_parse(path, workDir):
+    with MaxFile(path) as maxFile:
+        for header in maxFile.object_headers():
+            maxFile.vertices(header)
+            for face in maxFile.faces(header):
+                pass
+
+
+def stage_parse_arrays(path, workDir):
+    decode_file(path)
+
+
+def stage_tabulate(path, workDir):
+    tabulate_files([path], os.path.join(workDir, 'tables'), jobs=1)
+
+
+def stage_extract(path, workDir):
+    outputDir = os.path.join(workDir, 'extracted')
+    os.makedirs(outputDir, exist_ok=True)
+    with MaxFile(path) as maxFile:
+        for index in range(maxFile.object_count):
+            with open(os.path.join(outputDir, f"{index}.bin"), 'wb') as out:
+                out.write(maxFile.object_bytes(index))
+
+
+def stage_replace(path, workDir):
+    with MaxFile(path) as maxFile:
+        objectCount = maxFile.object_count
+    replacement = bytes(synthetic_object(np.random.default_rng(0), 0, 30, 25))
+    replace_objects(path, {index: replacement for index in range(0, objectCount, 10)}, os.path.join(workDir, 'replaced.max'))
+
+
+def stage_encode(path, workDir):
+    with MaxFile(path) as maxFile:
+        arrays = decode_arrays(maxFile)
+        for index in range(maxFile.object_count):
+            MaxObject.from_mesh_arrays(arrays, index).to_bytes()
+
+
+def stage_export(path, workDir):
+    export_files([path], os.path.join(workDir, 'exported'), jobs=1)
+
+
+STAGES = {
+    'parse': stage_parse,
+    'parse-arrays': stage_parse_arrays,
+    'tabulate': stage_tabulate,
+    'extract': stage_extract,
+    'replace': stage_replace,
+    'encode': stage_encode,
+    'export': stage_export,
+}
+
+
+def run_stage(stage, path, workDir, repeat):
+    """Run a stage repeat times (in a worker process) and return (best time in seconds, peak RSS in bytes)."""
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        STAGES[stage](path, workDir)
+        times.append(time.perf_counter() - begin)
+    return min(times), peak_rss()
+
+
+def measure(stage, path, workDir, repeat):
+    # Spawned rather than forked so the worker's peak RSS doesn't include memory inherited from this process.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_stage, stage, path, workDir, repeat).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PACKAGE_FOLDER, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baselinePath):
+    with open(baselinePath, 'r') as file:
+        baseline = {(r['scale'], r['stage']): r for r in json.load(file)['results']}
+
+    print(f"\nCompared with {baselinePath} (time ratio; below 1 is faster):")
+    for result in results:
+        previous = baseline.get((result['scale'], result['stage']))
+        if previous is None:
+            continue
+        print(f"  {result['scale']:>5}x {result['stage']:<13} {result['seconds']/previous['seconds']:6.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the maxis_mesh package on synthetic mesh files.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help="Multiples of --objects to generate (default: 1 10 100).")
+    parser.add_argument('--objects', type=int, default=DEFAULT_OBJECT_COUNT, help=f"Number of objects at scale 1 (default: {DEFAULT_OBJECT_COUNT}).")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help="Stages to time (default: all).")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the fastest is reported (default: 3).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json', help="Path of the JSON results file.")
+    parser.add_argument('--baseline', help="Previously saved results to compare with.")
+    parser.add_argument('--work-dir', help="Folder for generated and output files (default: a temporary folder). Generated mesh files are reused.")
+    args = parser.parse_args()
+
+    temporaryDir = None
+    if args.work_dir:
+        workDir = args.work_dir
+        os.makedirs(workDir, exist_ok=True)
+    else:
+        temporaryDir = tempfile.TemporaryDirectory()
+        workDir = temporaryDir.name
+
+    results = []
+    try:
+        for scale in args.scales:
+            objectCount = args.objects*scale
+            path = os.path.join(workDir, f"synthetic-{objectCount}-{args.seed}.max")
+            if not os.path.exists(path):
+                write_synthetic_mesh_file(path, objectCount, args.seed)
+
+            fileSize = os.path.getsize(path)
+            with MaxFile(path) as maxFile:
+                faceCount = sum(header.face_count for header in maxFile.object_headers())
+
+            print(f"Scale {scale}x: {objectCount} objects, {faceCount} faces, {fileSize/1e6:.1f} MB")
+
+            for stage in args.stages:
+                seconds, peakRss = measure(stage, path, workDir, args.repeat)
+                results.append({
+                    'scale': scale,
+                    'objects': objectCount,
+                    'faces': faceCount,
+                    'file_bytes': fileSize,
+                    'stage': stage,
+                    'seconds': seconds,
+                    'mb_per_s': fileSize/1e6/seconds,
+                    'faces_per_s': faceCount/seconds,
+                    'peak_rss_bytes': peakRss,
+                })
+                rssText = f"{peakRss/2**20:8.1f} MiB" if peakRss is not None else ''
+                print(f"  {stage:<13} {seconds*1000:10.1f} ms {fileSize/1e6/seconds:9.1f} MB/s {faceCount/seconds:12.0f} faces/s {rssText}")
+    finally:
+        if temporaryDir is not None:
+            temporaryDir.cleanup()
+
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent=2)
+    print(f"\nSaved results to {args.output}.")
+
+    if args.baseline:
+        print_comparison(results, args.baseline)
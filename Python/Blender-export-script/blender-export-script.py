@@ -10,6 +10,8 @@
 # Set the parameters in the PARAMETERS section below before exporting.
 # Run the script to export the model.
 
+# The script uses the maxis_mesh package in the Python folder of this repository (set packagePath below) and NumPy (bundled with Blender).
+
 # Ensure any changes to rotation or scale made in object mode are applied (Ctrl+A) before exporting.
 
 # For simplicity, this script only exports the currently-selected object.
@@ -18,7 +20,7 @@
 
 # --- TEXTURE OR COLOUR ASSIGNMENT: VERTEX GROUPS AND SPECIAL GROUP NAMES ---
 
-# The "specialGroups" dictionary (line 138) is used to specify textures or colours for vertex groups.
+# The "specialGroups" dictionary (below the face type definitions) is used to specify textures or colours for vertex groups.
 #   Key: name of vertex group
 #   Value: anonymous dictionary with the following key/value pairs:
 #       faceType: one of the FACE_TYPE_[...] strings defined below
@@ -42,6 +44,7 @@
 
 # Use only colours that appear in the game's palette.
 # The index will be chosen automatically, but may be incorrect if a colour appears multiple times in the palette.
+# Colours that don't appear in the palette are replaced with the nearest palette colour (a warning is printed).
 # For best results, use a special group name instead (see above).
 
 # To export a palette, use the Maxis Texture Tool (https://github.com/CahootsMalone/maxis-texture-tool/releases).
@@ -63,6 +66,9 @@
 # === END INSTRUCTIONS ===
 # ========================
 
+import contextlib
+import sys
+
 import bpy
 
 # ========================
@@ -72,10 +78,14 @@ import bpy
 # PLEASE NOTE: if desired, also add entries to the specialGroups dictionary below for texture assignment.
 
 # This should point to a palette in GIMP palette format exported by the Maxis Texture Tool (https://github.com/CahootsMalone/maxis-texture-tool/releases).
+# Alternatively, it can point to the game's sim3d1.max file, in which case its colour map is used.
 palettePath = 'C:/[...]/palette.gpl'
 
 outPath = 'C:/[...]/output-folder/'
 
+# The Python folder of this repository (the folder containing the maxis_mesh package).
+packagePath = 'C:/[...]/maxis-mesh-stuff/Python'
+
 # Bytes (max value 255) that affect collision detection.
 # Unclear how they're used. They don't specify the dimensions of the collision volume (at least not directly).
 col1 = 100
@@ -88,6 +98,14 @@ originX = 0
 originY = 0
 originZ = 0
 
+# Set to True to reduce the number of vertices and faces before exporting: duplicate vertices are welded, faces with no area
+# are dropped and coplanar faces with the same attributes are merged (see maxis_mesh/optimize.py).
+optimizeMesh = False
+
+# Set to a folder path to record how long each stage of the export takes, along with a cProfile profile (see
+# maxis_mesh/instrument.py). The trace (<object name>.json), profile (<object name>.prof) and summary.json are written there.
+profilePath = None
+
 # ======================
 # === END PARAMETERS ===
 # ======================
@@ -146,18 +164,58 @@ specialGroups = {
     "gFlat96": {"faceType": FACE_TYPE_FACE_COLOR_FLAT_SHADED, "texFile": 0, "texIndex": 96},
 }
 
-def write_vertex(file, x, y, z):
-    # Blender: +Z = up, RHR.
-    # SC: +X = right, +Y = up, +Z = forward, LHR.
-    file.write(round(CONST_SCALE_FACTOR*x).to_bytes(4, byteorder='little', signed=True))
-    file.write(round(CONST_SCALE_FACTOR*z).to_bytes(4, byteorder='little', signed=True))
-    file.write(round(CONST_SCALE_FACTOR*y).to_bytes(4, byteorder='little', signed=True))
-
-palette = []
-with open(palettePath, 'r') as pf:
-    lines = pf.readlines()
-    for i in range(3, len(lines)):
-        palette.append([int(c) for c in lines[i].split()])
+if packagePath not in sys.path:
+    sys.path.append(packagePath)
+
+import numpy as np
+
+from maxis_mesh import instrument
+from maxis_mesh.arrays import csr_offsets
+from maxis_mesh.model import MaxObject
+from maxis_mesh.optimize import optimize_mesh
+from maxis_mesh.palette import load_palette, PALETTE_RANGE_LIGHTS
+from maxis_mesh.writer import PLACEHOLDER_SIGNATURE, write_object
+
+def get_attribute(collection, attribute, dtype, width=1):
+    values = np.empty(len(collection)*width, dtype=dtype)
+    collection.foreach_get(attribute, values)
+    return values.reshape(-1, width) if width > 1 else values
+
+def scale_and_round(values, scaleFactor):
+    # Equivalent to Python's round(scaleFactor*value) (round half to even, double precision) for every element.
+    scaled = np.rint(scaleFactor*np.asarray(values, dtype=np.float64)).astype(np.int64)
+    if scaled.size and (scaled.min() < -2**31 or scaled.max() >= 2**31):
+        raise OverflowError("Coordinates are too large to store as 32-bit integers.")
+    return scaled
+
+def check_byte_values(values, description):
+    # Texture files and texture/colour indices are stored as single bytes.
+    if values.size and (values.min() < 0 or values.max() > 255):
+        raise OverflowError(f"{description} must be between 0 and 255 (check specialGroups).")
+    return values
+
+def resolve_vertex_groups(vertex):
+    # Face attributes are determined by the groups of the face's first vertex.
+    # Returns (face type, flag value, palette search start index, name of the vertex's last group).
+    faceType = 15 # This matters, if it's not compatible with the flag value the game crashes when the mesh is spawned.
+    flagValue = 3
+    paletteSearchStartIndex = 0
+    groupName = ""
+    for curGroup in vertex.groups:
+        groupName = theObject.vertex_groups[curGroup.group].name
+        if groupName in faceTypeNameToNumber:
+            faceType = faceTypeNameToNumber[groupName]
+            flagValue = faceTypeToFlagValue[faceType]
+        elif groupName in specialGroups:
+            faceType = faceTypeNameToNumber[specialGroups[groupName]["faceType"]]
+            flagValue = faceTypeToFlagValue[faceType]
+
+        # SimCopter has colours at the end of the palette that are used without shading
+        if (groupName == 'unshaded'):
+            paletteSearchStartIndex = 246
+    return faceType, flagValue, paletteSearchStartIndex, groupName
+
+palette = load_palette(palettePath) # Reused between exports in the same Blender session.
 
 class RENDER_OT_test(bpy.types.Operator):
     bl_idname = 'render.oha_test'
@@ -178,122 +236,101 @@ theMesh = theObject.data
 meshName = theObject.name
 outFile = outPath + meshName + '.bin'
 
-vertexCount = len(theMesh.vertices) + 1 # Add one for origin.
-faceCount = len(theMesh.polygons)
+# The export is recorded (if profilePath is set) in a with block so profiling stops even if the export fails.
+recording = instrument.recording(profilePath, cprofile=True, command=['blender-export-script.py', meshName]) if profilePath else contextlib.nullcontext()
+with recording, instrument.archive(meshName):
+    # Vertices
 
-with open(outFile, 'wb') as file:
-    
-    # Object header
-    
-    file.write(b'OBJX')
-    file.write(b'DEAD') # Size-12, updated below.
-    file.write(vertexCount.to_bytes(2, byteorder='little'))
-    file.write(faceCount.to_bytes(2, byteorder='little'))
-    file.write((0).to_bytes(4, byteorder='little')) # Always zero.
-    
-    file.write(col1.to_bytes(1, byteorder='little'))
-    file.write(col2.to_bytes(1, byteorder='little'))
-    file.write(col3.to_bytes(1, byteorder='little'))
-    file.write((0).to_bytes(1, byteorder='little')) # Almost always zero (in SimCopter, 4 of the 400 meshes have it set to 1 instead).
-    
-    file.write((0).to_bytes(4, byteorder='little')) # Always zero.
-    nameBytes = bytearray(meshName.encode('ASCII') + b'\0')
-    nameBytes.extend((88-len(nameBytes))*[0])
-    file.write(nameBytes)    
-    file.write(b'DEADDEADDEAD') # Mystery 12-byte sequence; must be replaced on import with the 12-byte sequence of the mesh being replaced.
+    # Blender: +Z = up, RHR.
+    # SC: +X = right, +Y = up, +Z = forward, LHR.
+    # Note that these coordinates are expressed in the object's local coordinate system.
+    coordinates = np.empty((len(theMesh.vertices) + 1, 3), dtype=np.float64)
+    coordinates[0] = (originX, originY, originZ) # Origin (always the first vertex).
+    coordinates[1:] = get_attribute(theMesh.vertices, 'co', np.float32, 3)
+    vertices = scale_and_round(coordinates[:, [0, 2, 1]], CONST_SCALE_FACTOR)
 
-    # Vertices
-    write_vertex(file, originX, originY, originZ) # Origin (always the first vertex).
-    for vertex in theMesh.vertices:
-        # Note that these coordinates are expressed in the object's local coordinate system.
-        write_vertex(file, vertex.co.x, vertex.co.y, vertex.co.z)
-    
     # Faces
-    for face in theMesh.polygons:
-        
-        # SimCopter's winding order is opposite Blender's.
-        # This is a little fiddly to manage with the coordinate swapping.
-        reversedListOfVertexIndices = list(reversed(face.vertices))
-        reversedListOfLoopIndices = list(reversed(face.loop_indices))
-        
-        fVertexCount = len(face.vertices)
-        fSizeBytes = 4+4+2+2+2+4+3+fVertexCount*2+fVertexCount*8
-        flagValue = 3
-        isLight = 0
-        texFile = 0
-        faceType = 15; # This matters, if it's not compatible with the flag value the game crashes when the mesh is spawned.
-        
-        paletteSearchStartIndex = 0
-        
-        groupName = ""
-        
-        # Check if first vertex in this face belongs to a group.
-        indexFirstVertex = reversedListOfVertexIndices[0]
-        if (len(theMesh.vertices[indexFirstVertex].groups) > 0):
-            for curGroup in theMesh.vertices[indexFirstVertex].groups:
-                groupName = theObject.vertex_groups[curGroup.group].name
-                print(groupName)
-                if groupName in faceTypeNameToNumber:
-                    faceType = faceTypeNameToNumber[groupName]
-                    flagValue = faceTypeToFlagValue[faceType]
-                elif groupName in specialGroups:
-                    faceType = faceTypeNameToNumber[specialGroups[groupName]["faceType"]]
-                    flagValue = faceTypeToFlagValue[faceType]
-                    
-                # SimCopter has colours at the end of the palette that are used without shading
-                if (groupName == 'unshaded'):
-                    paletteSearchStartIndex = 246
-        
-        if (groupName in specialGroups):
-            texFile = specialGroups[groupName]["texFile"]
-            colorIndex = specialGroups[groupName]["texIndex"]
-        else:
-            # If colour isn't in the palette, this just crashes rather than trying to find the nearest match.
-            color = theMesh.vertex_colors[0].data[reversedListOfLoopIndices[0]].color[0:3]
-            color = [round(255*c) for c in color]
-            colorIndex = paletteSearchStartIndex + palette[paletteSearchStartIndex:].index(color)
-        
-        file.write(b'FACE')
-        file.write(fSizeBytes.to_bytes(4, byteorder='little'))
-        file.write(fVertexCount.to_bytes(2, byteorder='little'))
-        file.write(flagValue.to_bytes(2, byteorder='little'))
-        file.write(isLight.to_bytes(2, byteorder='little'))
-        file.write(colorIndex.to_bytes(4, byteorder='little')) # "Group" TODO sometimes face index
-        file.write(faceType.to_bytes(1, byteorder='little')) # Face type
-        file.write(colorIndex.to_bytes(1, byteorder='little')) # Color
-        file.write(texFile.to_bytes(1, byteorder='little'))
-        
-        for vertIndex in reversedListOfVertexIndices:
-            # Add one to index since first vertex in table is origin.
-            file.write((vertIndex+1).to_bytes(2, byteorder='little'))
-        
-        # Texture coordinates
-        
-        faceVertexCount = len(reversedListOfVertexIndices)
-        
-        for i in range(faceVertexCount):
-            vertIndex = reversedListOfVertexIndices[i]
-            print("i=" + str(i) + " vertIndex=" + str(vertIndex))
-            if faceType == 13 or faceType == 18:
-                
-                loopIndex = reversedListOfLoopIndices[i]
-                
-                # This should - and does - equal the value of vertIndex.
-                #vertIndexFromLoop = theMesh.loops[loopIndex].vertex_index
-                
-                # https://docs.blender.org/api/current/bpy.types.MeshUVLoopLayer.html#bpy.types.MeshUVLoopLayer
-                uv = theMesh.uv_layers.active.data[loopIndex].uv
-                u = uv[0]
-                v = uv[1]
-                
-                file.write(round(CONST_UV_SCALE_FACTOR*u).to_bytes(4, byteorder='little', signed=True))
-                file.write(round(CONST_UV_SCALE_FACTOR*v).to_bytes(4, byteorder='little', signed=True))
-            else:
-                file.write((0).to_bytes(4, byteorder='little', signed=True))
-                file.write((0).to_bytes(4, byteorder='little', signed=True))
-    
-    # Set size
-    fileSize = file.tell() - 12 # Subtract 12 for mysterious 12-byte sequence that isn't counted.
-    file.seek(4, 0)
-    file.write(fileSize.to_bytes(4, byteorder='little'))
-    
\ No newline at end of file
+
+    loopStarts = get_attribute(theMesh.polygons, 'loop_start', np.int32).astype(np.int64)
+    loopTotals = get_attribute(theMesh.polygons, 'loop_total', np.int32).astype(np.int64)
+    loopVertexIndices = get_attribute(theMesh.loops, 'vertex_index', np.int32).astype(np.int64)
+
+    # SimCopter's winding order is opposite Blender's, so each face's loops are reversed.
+    faceVertexOffsets = csr_offsets(loopTotals)
+    localIndices = np.arange(faceVertexOffsets[-1], dtype=np.int64) - np.repeat(faceVertexOffsets[:-1], loopTotals)
+    reversedLoopIndices = np.repeat(loopStarts + loopTotals - 1, loopTotals) - localIndices
+    firstLoopIndices = loopStarts + loopTotals - 1
+
+    # Resolve vertex groups once per distinct first vertex rather than once per face.
+    firstVertexIndices = loopVertexIndices[firstLoopIndices]
+    uniqueFirstVertices, faceToUnique = np.unique(firstVertexIndices, return_inverse=True)
+    resolved = [resolve_vertex_groups(theMesh.vertices[int(v)]) for v in uniqueFirstVertices]
+
+    faceTypes = np.array([r[0] for r in resolved], dtype=np.int64)[faceToUnique]
+    flagValues = np.array([r[1] for r in resolved], dtype=np.int64)[faceToUnique]
+    searchStartIndices = np.array([r[2] for r in resolved], dtype=np.int64)[faceToUnique]
+    specialNames = [r[3] if r[3] in specialGroups else None for r in resolved]
+    isSpecial = np.array([name is not None for name in specialNames], dtype=bool)[faceToUnique]
+    texFiles = check_byte_values(np.array([specialGroups[name]["texFile"] if name else 0 for name in specialNames], dtype=np.int64)[faceToUnique], "texFile values")
+    colorIndices = check_byte_values(np.array([specialGroups[name]["texIndex"] if name else 0 for name in specialNames], dtype=np.int64)[faceToUnique], "texIndex values")
+
+    needsColor = ~isSpecial
+    with instrument.stage('match_colours'):
+        if needsColor.any():
+            loopColors = get_attribute(theMesh.vertex_colors[0].data, 'color', np.float32, 4)
+            rgb = np.clip(scale_and_round(loopColors[firstLoopIndices[needsColor], 0:3], 255), 0, 255)
+
+            # Exact matches are used if present (the first match at or after the search start index).
+            # Otherwise, the nearest colour is used: within the unshaded range for "unshaded" faces, within the light range for
+            # translucent faces (light beams), and within the whole palette for other faces.
+            lookedUp = np.empty(len(rgb), dtype=np.int64)
+            isExact = np.empty(len(rgb), dtype=bool)
+            searchStarts = searchStartIndices[needsColor]
+            isTranslucent = faceTypes[needsColor] == faceTypeNameToNumber[FACE_TYPE_FACE_TRANSLUCENT]
+            for startIndex in np.unique(searchStarts):
+                for translucent in (False, True):
+                    subset = (searchStarts == startIndex) & (isTranslucent == translucent)
+                    if not subset.any():
+                        continue
+                    paletteRange = PALETTE_RANGE_LIGHTS if (translucent and startIndex == 0) else None
+                    lookedUp[subset], isExact[subset] = palette.lookup(rgb[subset], int(startIndex), paletteRange)
+
+            if not isExact.all():
+                print(f"WARNING: {int((~isExact).sum())} faces use colours that aren't in the palette; the nearest palette colours were used instead.")
+
+            colorIndices[needsColor] = lookedUp
+
+    # Add one to index since first vertex in table is origin.
+    faceVertexIndices = loopVertexIndices[reversedLoopIndices] + 1
+
+    # Texture coordinates (only for textured faces; zero otherwise).
+    uvs = np.zeros((len(reversedLoopIndices), 2), dtype=np.int64)
+    isTextured = (faceTypes == 13) | (faceTypes == 18)
+    if isTextured.any():
+        # https://docs.blender.org/api/current/bpy.types.MeshUVLoopLayer.html#bpy.types.MeshUVLoopLayer
+        loopUVs = get_attribute(theMesh.uv_layers.active.data, 'uv', np.float32, 2)
+        texturedLoops = np.repeat(isTextured, loopTotals)
+        uvs[texturedLoops] = scale_and_round(loopUVs[reversedLoopIndices[texturedLoops]], CONST_UV_SCALE_FACTOR)
+
+    mesh = MaxObject.from_geometry(
+        vertices, loopTotals, faceVertexIndices, uvs,
+        faceTypes, flagValues, colorIndices, texFiles,
+        0, colorIndices, # isLight, "Group" TODO sometimes face index
+        name=meshName)
+    mesh.collision_bytes = (col1, col2, col3, 0) # Last byte almost always zero (in SimCopter, 4 of the 400 meshes have it set to 1 instead).
+    mesh.signature = PLACEHOLDER_SIGNATURE # Replaced by mesh-replace.
+
+    if optimizeMesh:
+        with instrument.stage('optimize'):
+            mesh, report = optimize_mesh(mesh)
+        print(f"Optimised {meshName}: {report}")
+
+    with instrument.stage('pack'):
+        objectBytes = mesh.to_bytes()
+
+    with instrument.stage('write'):
+        write_object(outFile, objectBytes)
+    instrument.count('bytes_written', len(objectBytes))
+    instrument.count('faces', mesh.face_count)
+
+print(f"Exported {meshName} ({mesh.vertex_count} vertices, {mesh.face_count} faces) to {outFile}")
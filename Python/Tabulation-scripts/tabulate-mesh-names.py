@@ -1,3 +1,11 @@
+import os
+import sys
+
+# The maxis_mesh package is in the parent folder.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from maxis_mesh import MaxFile
+
 keys = [
     'SimCopter sim3d1.max',
     'SimCopter sim3d2.max',
@@ -17,49 +25,15 @@ filePaths = {
     keys[5]: "C:/Maxis/Streets/GEO/SIM3D3.max"
 }
 
-offsetGeomTableStart = 829 # This is stored earlier in the file, but it's always 829.
-lengthGeomTableEntry = 53 # 17 + 9*4
-
 nameTableHeadings = ["Name from Geometry Table", "Name from Object Block"]
-nameTables = {}
-
-for key in keys:
-
-    filePath = filePaths[key]
-
-    nameTable = []
-
-    with open(filePath, "rb") as file:
-        data = file.read()
 
-        pos = offsetGeomTableStart
+def name_table(filePath):
+    with MaxFile(filePath) as maxFile:
+        for i in range(maxFile.object_count):
+            nameFromTable = maxFile.geom_table_entry(i).name
+            nameFromObjectBlock = maxFile.object_header(i).name
 
-        # Skip "GEOM".
-        pos += 4
-        
-        # Skip size of geometry table.
-        pos += 4
-        
-        # Skip number of entries in geometry table (one more than number of objects).
-        pos +=4
-        
-        objectCount = int.from_bytes(data[pos:pos+4], byteorder='little')
-        pos += 4
-
-        for i in range(objectCount):
-
-            entryStartOffset = 853 + lengthGeomTableEntry + i*lengthGeomTableEntry;
-
-            # Names are null-terminated. Subsequent bytes within the range allocated for the name are garbage.
-            nameFromTable = data[entryStartOffset:entryStartOffset+17].partition(b'\0')[0].decode("ascii", "ignore")
-
-            offsetIntoMeshTable = int.from_bytes(data[entryStartOffset+17:entryStartOffset+17+4], byteorder='little')
-
-            nameFromObjectBlock = data[offsetIntoMeshTable+24:offsetIntoMeshTable+24+88].partition(b'\0')[0].decode("ascii", "ignore")
-
-            nameTable.append([nameFromTable, nameFromObjectBlock])
-    
-    nameTables[key] = nameTable
+            yield [nameFromTable, nameFromObjectBlock]
 
 outPath = 'mesh-names.md'
 
@@ -74,7 +48,5 @@ with open(outPath, 'w') as out:
         out.write(" | ".join(nameTableHeadings) + '\n')
         out.write("--- | ---" + '\n')
 
-        nameTable = nameTables[key]
-
-        for entry in nameTable:
+        for entry in name_table(filePaths[key]):
             out.write(f"{entry[0]} | {entry[1]}\n")
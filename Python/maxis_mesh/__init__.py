@@ -0,0 +1,7 @@
+# Python tools for Maxis mesh files (sim3d#.max) used by SimCopter and Streets of SimCity.
+# See https://github.com/CahootsMalone/maxis-mesh-stuff/blob/master/Info/Maxis-Mesh-Format.md
+
+from .max_file import MaxFile, ObjectHeader, Face, GeomTableEntry, DuplicateGeomTableEntry, face_size
+from .cache import MeshIndex, ObjectEntry, load_index, build_index
+from .model import MaxObject, MaxFace
+from .archive import MeshArchive
@@ -0,0 +1,113 @@
+# Lazy access to individual objects within a Maxis mesh file.
+
+# MeshArchive is the Python counterpart to Mesh.loadMesh in the viewer: archive[i] or archive["name"] decodes only that object
+# (directly from the memory-mapped file) rather than the whole file. Objects are decoded into MaxObjects (see maxis_mesh.model),
+# which take little more memory than the objects' size in the file. Decoded objects are kept in a least recently used (LRU)
+# cache limited to an approximate number of bytes, so repeatedly accessing the same few objects doesn't decode them again.
+
+from collections import OrderedDict
+
+from .max_file import MaxFile
+from .model import MaxObject
+
+DEFAULT_CACHE_BUDGET = 64*2**20
+
+
+class MeshArchive:
+    """A mesh file whose objects are decoded on demand.
+
+    archive[i] returns the object (a MaxObject) at index i (in geometry table order; negative indices count from the end) and archive["name"]
+    returns the object with that name (from either the geometry table or the object header, ignoring case).
+    Decoded objects are cached until their total approximate size exceeds cacheBudget bytes, at which point the least recently
+    used ones are discarded. Use as a context manager or call close() when finished.
+    """
+
+    def __init__(self, path, cacheBudget=DEFAULT_CACHE_BUDGET):
+        self.file = MaxFile(path)
+        self.path = path
+        self.cache_budget = cacheBudget
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._names = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._cache.clear()
+        self.cached_bytes = 0
+        self.file.close()
+
+    def __len__(self):
+        return self.file.object_count
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __contains__(self, key):
+        try:
+            self.index_of(key)
+        except (IndexError, KeyError):
+            return False
+        return True
+
+    def __getitem__(self, key):
+        index = self.index_of(key)
+
+        cached = self._cache.get(index)
+        if cached is not None:
+            self._cache.move_to_end(index)
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        meshObject = self._decode(index)
+        self._store(index, meshObject)
+        return meshObject
+
+    def _names_to_indices(self):
+        if self._names is None:
+            self._names = {}
+            for index in range(len(self)):
+                names = {self.file.geom_table_entry(index).name.casefold(), self.file.object_header(index).name.casefold()}
+                for name in names:
+                    self._names.setdefault(name, []).append(index)
+        return self._names
+
+    def index_of(self, key):
+        """Object index for an integer index (negative indices count from the end) or an object name."""
+        if isinstance(key, int):
+            index = key + len(self) if key < 0 else key
+            if index < 0 or index >= len(self):
+                raise IndexError(f"Index {key} is invalid: there are only {len(self)} meshes in {self.path}.")
+            return index
+
+        matches = self._names_to_indices().get(key.casefold(), [])
+        if len(matches) != 1:
+            raise KeyError(f"Name {key!r} matches {len(matches)} meshes in {self.path}; use an index instead.")
+        return matches[0]
+
+    def _decode(self, index):
+        return MaxObject.from_file(self.file, index)
+
+    def _store(self, index, meshObject):
+        size = meshObject.decoded_size
+        if size > self.cache_budget:
+            return
+
+        self._cache[index] = (meshObject, size)
+        self.cached_bytes += size
+
+        while self.cached_bytes > self.cache_budget:
+            _, (_, evictedSize) = self._cache.popitem(last=False)
+            self.cached_bytes -= evictedSize
+
+    def clear_cache(self):
+        self._cache.clear()
+        self.cached_bytes = 0
@@ -0,0 +1,241 @@
+# Bulk decoding of Maxis mesh files into NumPy arrays (struct-of-arrays rather than one Python object per face).
+# Requires NumPy.
+
+# Variable-length data (faces per object, vertices per object, vertex indices and UVs per face) is stored in flat arrays
+# with CSR-style offset arrays: the items belonging to element i are items[offsets[i]:offsets[i+1]].
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from .max_file import MaxFile, LENGTH_OBJECT_HEADER, LENGTH_FACE_HEADER
+from . import instrument
+
+# Packed (unaligned) dtypes matching the on-disk layout.
+OBJECT_HEADER_DTYPE = np.dtype([
+    ('signature', 'S4'),
+    ('size', '<u4'),
+    ('vertex_count', '<u2'),
+    ('face_count', '<u2'),
+    ('attributes', '<u4'),
+    ('radius', '<u4'),
+    ('y_radius', '<u4'),
+    ('name', 'S24'),
+    ('texture_file', 'S64'),
+    ('anim_count', '<u4'),
+    ('anim_pointer', '<u4'),
+    ('id', '<i4'),
+])
+
+FACE_HEADER_DTYPE = np.dtype([
+    ('signature', 'S4'),
+    ('size', '<u4'),
+    ('vertex_count', '<u2'),
+    ('flags', '<u2'),
+    ('is_light', '<u2'),
+    ('group', '<u4'),
+    ('face_type', 'u1'),
+    ('tex_index', 'u1'),
+    ('tex_file', 'u1'),
+])
+
+assert OBJECT_HEADER_DTYPE.itemsize == LENGTH_OBJECT_HEADER
+assert FACE_HEADER_DTYPE.itemsize == LENGTH_FACE_HEADER
+
+# Faces whose vertex indices (or UVs) are gathered at a time (see _gather_runs).
+GATHER_CHUNK_RUNS = 65536
+
+
+class MeshArrays(namedtuple('MeshArrays', [
+        'path',
+        'objects', # OBJECT_HEADER_DTYPE, one per object
+        'object_offsets', # int64, file offset of each object
+        'vertices', # int32 (N, 3), all objects' vertices (including origin vertices) in file order
+        'object_vertex_offsets', # int64 CSR offsets into vertices
+        'faces', # FACE_HEADER_DTYPE, all faces in file order
+        'face_offsets', # int64, file offset of each face
+        'object_face_offsets', # int64 CSR offsets into faces
+        'vertex_indices', # uint16, object-local vertex indices of all faces
+        'uvs', # int32 (M, 2), UV coordinates of all faces (divide by 65536)
+        'face_vertex_offsets', # int64 CSR offsets into vertex_indices and uvs
+        ])):
+
+    __slots__ = ()
+
+    @property
+    def object_count(self):
+        return len(self.objects)
+
+    @property
+    def face_object_indices(self):
+        """Index of the object each face belongs to."""
+        return np.repeat(np.arange(self.object_count), np.diff(self.object_face_offsets))
+
+    def object_vertices(self, index):
+        return self.vertices[self.object_vertex_offsets[index]:self.object_vertex_offsets[index+1]]
+
+    def object_faces(self, index):
+        return self.faces[self.object_face_offsets[index]:self.object_face_offsets[index+1]]
+
+    def face_vertex_indices(self, faceIndex):
+        return self.vertex_indices[self.face_vertex_offsets[faceIndex]:self.face_vertex_offsets[faceIndex+1]]
+
+    def face_uvs(self, faceIndex):
+        return self.uvs[self.face_vertex_offsets[faceIndex]:self.face_vertex_offsets[faceIndex+1]]
+
+
+def csr_offsets(counts):
+    """CSR-style offsets of runs with the given lengths: run i is [offsets[i], offsets[i+1]) (len(counts) + 1 int64 values)."""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _record_view(data, dtype):
+    # Every byte offset of data viewed as the start of a record of the given dtype (overlapping and zero-copy), so records at
+    # arbitrary offsets can be gathered by indexing with their offsets, without an index per byte.
+    count = max(len(data) - dtype.itemsize + 1, 0)
+    return np.ndarray((count,), dtype=dtype, buffer=data, strides=(1,))
+
+
+def _gather(data, starts, dtype):
+    # Copy fixed-length records at arbitrary byte offsets into a contiguous array of the given dtype.
+    return _record_view(data, dtype)[np.asarray(starts, dtype=np.int64)]
+
+
+def _gather_runs(data, starts, counts, itemSize):
+    # Copy runs of counts[i] items of itemSize bytes starting at starts[i] into one flat byte array. Runs are handled
+    # GATHER_CHUNK_RUNS at a time, which bounds the size of the temporary item positions.
+    items = _record_view(data, np.dtype(f'V{itemSize}'))
+    offsets = csr_offsets(counts)
+    result = np.empty(int(offsets[-1]), dtype=items.dtype)
+    for first in range(0, len(counts), GATHER_CHUNK_RUNS):
+        last = min(first + GATHER_CHUNK_RUNS, len(counts))
+        chunkCounts = counts[first:last]
+        local = np.arange(offsets[first], offsets[last], dtype=np.int64) - np.repeat(offsets[first:last], chunkCounts)
+        positions = np.repeat(np.asarray(starts[first:last], dtype=np.int64), chunkCounts) + itemSize*local
+        result[offsets[first]:offsets[last]] = items[positions]
+    return result.view(np.uint8)
+
+
+class MeshHeaders(namedtuple('MeshHeaders', [
+        'path',
+        'table_names', # Object names from the geometry table
+        'objects', # OBJECT_HEADER_DTYPE, one per object
+        'object_offsets', # int64, file offset of each object
+        'faces', # FACE_HEADER_DTYPE, all faces in file order
+        'face_offsets', # int64, file offset of each face
+        'object_face_offsets', # int64 CSR offsets into faces
+        ])):
+    """Object and face headers only (no vertices, vertex indices or UVs)."""
+
+    __slots__ = ()
+
+
+def _walk_faces(data, faceStarts, faceCounts, faceOffsets):
+    # Each face's offset depends on the size of the previous one, so the walk itself is sequential.
+    unpackSize = struct.Struct('<I').unpack_from
+    f = 0
+    for start, count in zip(faceStarts.tolist(), faceCounts.tolist()):
+        pos = start
+        for _ in range(count):
+            faceOffsets[f] = pos
+            pos += unpackSize(data, pos + 4)[0]
+            f += 1
+
+
+def _decode_headers(data, path, objectOffsets, tableNames, includeFaces=True, objectIndices=None):
+    objects = _gather(data, objectOffsets, OBJECT_HEADER_DTYPE)
+
+    if objects.size and np.any(objects['signature'] != b'OBJX'):
+        bad = int(np.flatnonzero(objects['signature'] != b'OBJX')[0])
+        index = bad if objectIndices is None else objectIndices[bad]
+        raise ValueError(f"{path}: object {index} at offset {objectOffsets[bad]} doesn't start with OBJX.")
+
+    vertexCounts = objects['vertex_count'].astype(np.int64)
+    faceCounts = objects['face_count'].astype(np.int64) if includeFaces else np.zeros(len(objects), dtype=np.int64)
+    objectFaceOffsets = csr_offsets(faceCounts)
+
+    faceOffsets = np.empty(int(objectFaceOffsets[-1]), dtype=np.int64)
+    _walk_faces(data, objectOffsets + LENGTH_OBJECT_HEADER + 12*vertexCounts, faceCounts, faceOffsets)
+
+    faces = _gather(data, faceOffsets, FACE_HEADER_DTYPE)
+
+    if faces.size and np.any(faces['signature'] != b'FACE'):
+        bad = int(np.flatnonzero(faces['signature'] != b'FACE')[0])
+        raise ValueError(f"{path}: expected FACE at offset {faceOffsets[bad]}.")
+
+    return MeshHeaders(path, tableNames, objects, objectOffsets, faces, faceOffsets, objectFaceOffsets)
+
+
+def decode_headers(maxFile, indices=None, includeFaces=True):
+    """Decode the object and face headers of every object in an open MaxFile into a MeshHeaders.
+
+    If indices is specified, only the objects at those indices are decoded (in the given order). If includeFaces is False, only
+    the object headers are decoded; the returned faces and face_offsets are empty and every object has no faces.
+    """
+    isWholeFile = indices is None
+    with instrument.stage('decode_headers'):
+        indices = np.arange(maxFile.object_count) if indices is None else np.asarray(indices, dtype=np.int64)
+        tableNames = [maxFile.geom_table_entry(i).name for i in indices.tolist()]
+        objectOffsets = np.array(maxFile.object_offsets, dtype=np.int64)[indices]
+        headers = _decode_headers(maxFile.data, maxFile.path, objectOffsets, tableNames, includeFaces, indices)
+    if isWholeFile:
+        instrument.count('bytes_read', len(maxFile.data))
+    instrument.count('objects', len(headers.objects))
+    instrument.count('faces', len(headers.faces))
+    return headers
+
+
+def _decode_arrays(data, path, headers):
+    objects = headers.objects
+    objectOffsets = headers.object_offsets
+    faces = headers.faces
+    faceOffsets = headers.face_offsets
+
+    vertexCounts = objects['vertex_count'].astype(np.int64)
+    objectVertexOffsets = csr_offsets(vertexCounts)
+
+    # Vertex blocks are contiguous within each object, so they're copied with one view of the file per object (joined by
+    # np.concatenate) rather than gathered item by item.
+    vertexStarts = objectOffsets + LENGTH_OBJECT_HEADER
+    vertexBlocks = [np.frombuffer(data, dtype='<i4', count=3*int(count), offset=int(start))
+                    for start, count in zip(vertexStarts, vertexCounts)]
+    vertices = (np.concatenate(vertexBlocks) if vertexBlocks else np.zeros(0, dtype='<i4')).reshape(-1, 3)
+
+    faceVertexCounts = faces['vertex_count'].astype(np.int64)
+    faceVertexOffsets = csr_offsets(faceVertexCounts)
+
+    indexStarts = faceOffsets + LENGTH_FACE_HEADER
+    vertexIndices = _gather_runs(data, indexStarts, faceVertexCounts, 2).view('<u2')
+    uvs = _gather_runs(data, indexStarts + 2*faceVertexCounts, faceVertexCounts, 8).view('<i4').reshape(-1, 2)
+
+    return MeshArrays(path, objects, objectOffsets, vertices, objectVertexOffsets,
+                      faces, faceOffsets, headers.object_face_offsets, vertexIndices, uvs, faceVertexOffsets)
+
+
+def decode_arrays(maxFile, headers=None):
+    """Decode every object in an open MaxFile into a MeshArrays.
+
+    If the file's headers have already been decoded with decode_headers, they can be passed in to avoid decoding them again.
+    """
+    if headers is None:
+        headers = decode_headers(maxFile)
+    with instrument.stage('decode_geometry'):
+        return _decode_arrays(maxFile.data, maxFile.path, headers)
+
+
+def decode_object_bytes(data, path=None):
+    """Decode a single object (e.g., the contents of a .bin file written by the Blender export script) into a MeshArrays.
+
+    Offsets are relative to the start of data.
+    """
+    headers = _decode_headers(data, path, np.zeros(1, dtype=np.int64), [''])
+    return _decode_arrays(data, path, headers)
+
+
+def decode_file(path):
+    """Open, decode and close a mesh file. The returned arrays don't reference the file."""
+    with MaxFile(path) as maxFile:
+        return decode_arrays(maxFile)
@@ -0,0 +1,505 @@
+# Tabulate many mesh files at once, decoding them in parallel.
+# Requires NumPy.
+
+# Each mesh file is decoded by a worker process, which returns its object and face headers as NumPy arrays (compact to transfer
+# between processes). The main process writes the rows of each table in the order the files were specified, producing the
+# same formats as the scripts in the Tabulation-scripts folder. Only a few files per worker are decoded ahead of the one being
+# written (see decode_all), so memory use is bounded by the largest files rather than the total.
+
+# Optionally, the object header and face tables are also written in a columnar format (see maxis_mesh.columnar).
+
+# Incremental tabulation (--incremental) records a SHA-1 digest of each object (its geometry table name and OBJX block) and the
+# length of each object's rows in each table. On the next run, only the objects whose digests changed are decoded again (objects
+# that only moved, e.g. because an earlier object was replaced with a larger one, just have their object headers reread); the
+# rows of every other object are copied from the previous outputs. Files whose size and modification time are unchanged aren't
+# read at all.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.batch <directory, file or glob pattern> [...] [--output-dir <path>] [--jobs <count>] [--tables <name> [...]]
+#       [--columnar [parquet|arrow|npz] | --incremental]
+
+import argparse
+import glob
+import hashlib
+import locale
+import itertools
+import os
+import struct
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .arrays import decode_headers
+from .max_file import MaxFile, LENGTH_GEOM_TABLE_ENTRY, OBJECT_SIZE_DEFICIT
+from . import columnar, instrument, tabulate
+
+MESH_FILE_EXTENSION = '.max'
+
+# Files decoded ahead of the one being handled, per worker process (see decode_all).
+DECODE_AHEAD_PER_JOB = 2
+
+
+def find_mesh_files(inputs):
+    """Mesh files in the given directories (searched recursively), glob patterns and paths, without duplicates."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for folder, subfolders, files in os.walk(item):
+                subfolders.sort()
+                paths.extend(os.path.join(folder, f) for f in sorted(files) if f.lower().endswith(MESH_FILE_EXTENSION))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            paths.append(item)
+
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def decode_mesh_file_headers(path):
+    with MaxFile(path) as maxFile:
+        return decode_headers(maxFile)
+
+
+def decode_all(paths, jobs=None, decode=decode_mesh_file_headers):
+    """Yield the headers of each mesh file (as returned by decode_headers) in order, decoding them in parallel.
+
+    jobs is the number of worker processes (default: one per CPU). With jobs=1, files are decoded in this process.
+    decode is the function applied to each item of paths; it must be defined at module level so worker processes can use it.
+    At most DECODE_AHEAD_PER_JOB files per worker are decoded (or waiting to be yielded) at a time, so results don't accumulate
+    while the caller handles earlier files.
+    """
+    if jobs == 1 or len(paths) <= 1:
+        for path in paths:
+            yield decode(path)
+        return
+
+    workerCount = jobs or os.cpu_count() or 1
+    remaining = iter(paths)
+    with ProcessPoolExecutor(max_workers=workerCount) as executor:
+        pending = deque(executor.submit(decode, path) for path in itertools.islice(remaining, DECODE_AHEAD_PER_JOB*workerCount))
+        while pending:
+            result = pending.popleft().result()
+            for path in itertools.islice(remaining, 1):
+                pending.append(executor.submit(decode, path))
+            yield result
+
+
+# Tables that can also be written in a columnar format, and the functions returning their columns.
+COLUMNAR_TABLES = {
+    tabulate.OBJECT_HEADER_TABLE: tabulate.object_header_columns,
+    tabulate.FACE_TABLE: tabulate.face_columns,
+}
+
+
+def table_path(outputDir, table):
+    extension = '.md' if table == tabulate.MESH_NAME_TABLE else '.csv'
+    return os.path.join(outputDir, table + extension)
+
+
+def tabulate_files(paths, outputDir='.', tables=tabulate.TABLES, jobs=None, columnarFormat=None):
+    """Write the specified tables (see tabulate.TABLES) for all the mesh files to outputDir.
+
+    If columnarFormat is specified (one of columnar.FORMATS), the object header and face tables (if included in tables) are also
+    written in that format.
+    """
+    os.makedirs(outputDir, exist_ok=True)
+
+    outputs = {}
+    columnarOutputs = {}
+    try:
+        for table in tables:
+            outputs[table] = open(table_path(outputDir, table), 'w')
+
+        if columnarFormat is not None:
+            for table in COLUMNAR_TABLES:
+                if table in tables:
+                    columnarOutputs[table] = columnar.ColumnarWriter(os.path.join(outputDir, table), columnarFormat)
+
+        if tabulate.OBJECT_HEADER_TABLE in outputs:
+            tabulate.write_csv_rows(outputs[tabulate.OBJECT_HEADER_TABLE], [tabulate.OBJECT_HEADER_HEADINGS])
+        if tabulate.COLLISION_TABLE in outputs:
+            tabulate.write_csv_rows(outputs[tabulate.COLLISION_TABLE], [tabulate.COLLISION_HEADINGS])
+        if tabulate.FACE_TABLE in outputs:
+            tabulate.write_csv_rows(outputs[tabulate.FACE_TABLE], [tabulate.FACE_HEADINGS])
+        if tabulate.MESH_NAME_TABLE in outputs:
+            tabulate.write_mesh_names_title(outputs[tabulate.MESH_NAME_TABLE], 'python -m maxis_mesh.batch')
+
+        decoded = decode_all(paths, jobs)
+        for path in paths:
+            with instrument.archive(path):
+                # With worker processes, this is the time spent waiting for them.
+                with instrument.stage('decode'):
+                    headers = next(decoded)
+                if tabulate.OBJECT_HEADER_TABLE in outputs:
+                    with instrument.stage(tabulate.OBJECT_HEADER_TABLE):
+                        tabulate.write_csv_rows(outputs[tabulate.OBJECT_HEADER_TABLE], tabulate.object_header_rows(headers, path))
+                if tabulate.COLLISION_TABLE in outputs:
+                    with instrument.stage(tabulate.COLLISION_TABLE):
+                        outputs[tabulate.COLLISION_TABLE].write(tabulate.collision_csv_text(headers, path))
+                if tabulate.FACE_TABLE in outputs:
+                    with instrument.stage(tabulate.FACE_TABLE):
+                        outputs[tabulate.FACE_TABLE].writelines(tabulate.face_csv_chunks(headers))
+                if tabulate.MESH_NAME_TABLE in outputs:
+                    with instrument.stage(tabulate.MESH_NAME_TABLE):
+                        tabulate.write_mesh_names_section(outputs[tabulate.MESH_NAME_TABLE], path, tabulate.mesh_name_rows(headers))
+                for table, writer in columnarOutputs.items():
+                    with instrument.stage(f"{table} ({writer.format})"):
+                        writer.write(COLUMNAR_TABLES[table](headers), path)
+    finally:
+        for out in outputs.values():
+            out.close()
+        for writer in columnarOutputs.values():
+            writer.close()
+
+
+TABULATION_STATE_NAME = 'tabulation-state.npz'
+TABULATION_STATE_VERSION = 1
+
+# tabulate_files writes the tables in text mode; incremental tabulation writes the same bytes in binary mode so it can copy
+# unchanged parts of the previous outputs.
+OUTPUT_ENCODING = locale.getpreferredencoding(False)
+
+
+def _encode(text):
+    return text.replace('\n', os.linesep).encode(OUTPUT_ENCODING)
+
+
+def table_heading(table):
+    """Text at the start of a table, before the rows of the first file."""
+    if table == tabulate.OBJECT_HEADER_TABLE:
+        return tabulate.format_csv_row(tabulate.OBJECT_HEADER_HEADINGS)
+    if table == tabulate.COLLISION_TABLE:
+        return tabulate.format_csv_row(tabulate.COLLISION_HEADINGS)
+    if table == tabulate.FACE_TABLE:
+        return tabulate.format_csv_row(tabulate.FACE_HEADINGS)
+    return tabulate.mesh_names_title('python -m maxis_mesh.batch')
+
+
+def object_digests(maxFile):
+    """File offset (int64) and SHA-1 digest ((N, 20) uint8) of each object in an open MaxFile.
+
+    Each digest covers the object's name in the geometry table and its OBJX block.
+    """
+    data = maxFile.data
+    offsets = np.array(maxFile.object_offsets, dtype=np.int64)
+    digests = np.empty((len(offsets), 20), dtype=np.uint8)
+
+    for index, offset in enumerate(maxFile.object_offsets):
+        nameAddress = maxFile.geom_table_address + (index + 1)*LENGTH_GEOM_TABLE_ENTRY
+        size = struct.unpack_from('<I', data, offset + 4)[0] + OBJECT_SIZE_DEFICIT
+        digest = hashlib.sha1(data[nameAddress:nameAddress + 17])
+        digest.update(data[offset:offset + size])
+        digests[index] = np.frombuffer(digest.digest(), dtype=np.uint8)
+
+    return offsets, digests
+
+
+class TabulatedFile(namedtuple('TabulatedFile', [
+        'label',
+        'size', # File size and modification time (ns) when it was tabulated
+        'mtime',
+        'object_offsets', # int64, file offset of each object
+        'object_digests', # uint8 (N, 20), see object_digests
+        'segment_lengths', # Dict of table name to int64 array: bytes of the file's section heading, then of each object's rows
+        ])):
+
+    __slots__ = ()
+
+
+def _retabulate_file(job):
+    # Encoded rows of the objects in one mesh file that changed or moved since it was last tabulated.
+    # job is (path, tables, previous TabulatedFile or None). Returns (TabulatedFile without segment_lengths, segments, number of
+    # changed objects), where segments[table][i] is the encoded text of object i's rows, or None if the previous text is still valid.
+    path, tables, previous = job
+    stat = os.stat(path)
+
+    with MaxFile(path) as maxFile:
+        offsets, digests = object_digests(maxFile)
+
+        changed = np.ones(len(offsets), dtype=bool)
+        moved = np.zeros(len(offsets), dtype=bool)
+        if previous is not None:
+            common = min(len(offsets), len(previous.object_offsets))
+            changed[:common] = np.any(digests[:common] != previous.object_digests[:common], axis=1)
+            moved[:common] = offsets[:common] != previous.object_offsets[:common]
+
+        changedIndices = np.flatnonzero(changed)
+        movedIndices = np.flatnonzero(moved & ~changed)
+        headers = decode_headers(maxFile, changedIndices)
+        # Only the object header and collision tables include object offsets.
+        movedHeaders = decode_headers(maxFile, movedIndices, includeFaces=False)
+
+    segments = {table: [None]*len(offsets) for table in tables}
+
+    for table, rowFunction in [(tabulate.OBJECT_HEADER_TABLE, tabulate.object_header_rows), (tabulate.COLLISION_TABLE, tabulate.collision_rows)]:
+        if table not in segments:
+            continue
+        for subset, indices in [(headers, changedIndices), (movedHeaders, movedIndices)]:
+            for index, row in zip(indices.tolist(), rowFunction(subset, path)):
+                row[1] = index # Rows are numbered within the subset.
+                segments[table][index] = _encode(tabulate.format_csv_row(row))
+
+    if tabulate.FACE_TABLE in segments:
+        lines = tabulate.face_csv_text(headers).splitlines(keepends=True)
+        faceOffsets = headers.object_face_offsets.tolist()
+        for i, index in enumerate(changedIndices.tolist()):
+            segments[tabulate.FACE_TABLE][index] = _encode(''.join(lines[faceOffsets[i]:faceOffsets[i + 1]]))
+
+    if tabulate.MESH_NAME_TABLE in segments:
+        for index, entry in zip(changedIndices.tolist(), tabulate.mesh_name_rows(headers)):
+            segments[tabulate.MESH_NAME_TABLE][index] = _encode(tabulate.format_mesh_name_row(entry))
+
+    return TabulatedFile(path, stat.st_size, stat.st_mtime_ns, offsets, digests, None), segments, len(changedIndices)
+
+
+def save_tabulation_state(path, tables, files):
+    objectCounts = [len(f.object_offsets) for f in files]
+    arrays = {
+        'version': TABULATION_STATE_VERSION,
+        'tables': np.array(tables, dtype=str),
+        'files': np.array([f.label for f in files], dtype=str),
+        'file_sizes': np.array([f.size for f in files], dtype=np.int64),
+        'file_mtimes': np.array([f.mtime for f in files], dtype=np.int64),
+        'object_counts': np.array(objectCounts, dtype=np.int64),
+        'object_offsets': np.concatenate([np.zeros(0, dtype=np.int64)] + [f.object_offsets for f in files]),
+        'object_digests': np.concatenate([np.zeros((0, 20), dtype=np.uint8)] + [f.object_digests for f in files]),
+    }
+    for table in tables:
+        arrays['segments_' + table] = np.concatenate([np.zeros(0, dtype=np.int64)] + [f.segment_lengths[table] for f in files])
+
+    # Write to a temporary file first so a partially-written state is never read.
+    tempPath = path + '.tmp'
+    with open(tempPath, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tempPath, path)
+
+
+def load_tabulation_state(path, tables):
+    """The files recorded by the previous incremental tabulation, or None if there's no state for the given tables."""
+    try:
+        with np.load(path) as npz:
+            if int(npz['version']) != TABULATION_STATE_VERSION or sorted(npz['tables'].tolist()) != sorted(tables):
+                return None
+
+            objectCounts = npz['object_counts'].tolist()
+            objectStarts = np.concatenate([[0], np.cumsum(objectCounts, dtype=np.int64)]).tolist()
+            offsets = npz['object_offsets']
+            digests = npz['object_digests']
+            segments = {table: npz['segments_' + table] for table in tables}
+
+            files = []
+            for i, (label, size, mtime) in enumerate(zip(npz['files'].tolist(), npz['file_sizes'].tolist(), npz['file_mtimes'].tolist())):
+                start, end = objectStarts[i], objectStarts[i + 1]
+                # Each file has one segment for its section heading, then one per object.
+                segmentLengths = {table: lengths[start + i:end + i + 1] for table, lengths in segments.items()}
+                files.append(TabulatedFile(label, size, mtime, offsets[start:end], digests[start:end], segmentLengths))
+            return files
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class _PatchedOutput:
+    # Updates an output file in place from new text and ranges of its previous version. Ranges that are already in the right
+    # place aren't written again, so nothing before the first change is rewritten. The part of the previous version after the
+    # first change is read into memory before it's overwritten.
+
+    def __init__(self, path, reuse):
+        self.file = open(path, 'r+b' if reuse else 'w+b')
+        self.position = 0
+        self.pending = None # (start, length) of the range of the previous version waiting to be copied
+        self.previousStart = None # Position of the first change, and the previous version from there
+        self.previous = None
+
+    def write(self, data):
+        self._flush()
+        self._overwrite(data)
+
+    def copy(self, start, length):
+        if self.pending is not None and self.pending[0] + self.pending[1] == start:
+            self.pending = (self.pending[0], self.pending[1] + length)
+            return
+        self._flush()
+        self.pending = (start, length)
+
+    def _flush(self):
+        if self.pending is None:
+            return
+        start, length = self.pending
+        self.pending = None
+
+        if start == self.position:
+            self.position += length
+            return
+
+        if self.previous is None:
+            self._read_previous()
+        if start >= self.previousStart:
+            data = self.previous[start - self.previousStart:start - self.previousStart + length]
+        else:
+            # Nothing before the first change has been overwritten.
+            self.file.seek(start)
+            data = self.file.read(length)
+        if len(data) != length:
+            raise ValueError(f"{self.file.name} is shorter than when it was tabulated.")
+        self._overwrite(data)
+
+    def _read_previous(self):
+        self.previousStart = self.position
+        self.file.seek(self.position)
+        self.previous = self.file.read()
+
+    def _overwrite(self, data):
+        if self.previous is None:
+            # Text that's the same as before (e.g., the headings) isn't a change.
+            self.file.seek(self.position)
+            if self.file.read(len(data)) == data:
+                self.position += len(data)
+                return
+            self._read_previous()
+        self.file.seek(self.position)
+        self.file.write(data)
+        self.position += len(data)
+
+    def close(self):
+        try:
+            self._flush()
+            self.file.truncate(self.position)
+        finally:
+            self.file.close()
+
+
+def tabulate_files_incremental(paths, outputDir='.', tables=tabulate.TABLES, jobs=None):
+    """Write the same tables as tabulate_files, decoding only the objects that changed since the previous call.
+
+    The digests of each object and the layout of each table are stored in outputDir (see TABULATION_STATE_NAME). If there's no
+    valid state (e.g., the first time, or if the tables were written by tabulate_files), every object is decoded.
+    Returns the number of objects that were decoded again because they changed (or were added).
+    """
+    os.makedirs(outputDir, exist_ok=True)
+    statePath = os.path.join(outputDir, TABULATION_STATE_NAME)
+    outputPaths = {table: table_path(outputDir, table) for table in tables}
+
+    previousFiles = load_tabulation_state(statePath, tables)
+    # The previous outputs can only be reused if they're exactly as the state describes them.
+    if previousFiles is not None:
+        for table, outputPath in outputPaths.items():
+            expectedSize = len(_encode(table_heading(table))) + sum(int(f.segment_lengths[table].sum()) for f in previousFiles)
+            if not os.path.isfile(outputPath) or os.path.getsize(outputPath) != expectedSize:
+                previousFiles = None
+                break
+
+    # Start of each previous file's section in each table.
+    previous = {}
+    for table in tables:
+        position = len(_encode(table_heading(table)))
+        for f in previousFiles or []:
+            previous.setdefault(f.label, (f, {}))[1][table] = position
+            position += int(f.segment_lengths[table].sum())
+
+    # Files whose size and modification time haven't changed are reused without reading them.
+    retabulated = []
+    for path in paths:
+        stat = os.stat(path)
+        previousFile = previous[path][0] if path in previous else None
+        if previousFile is None or previousFile.size != stat.st_size or previousFile.mtime != stat.st_mtime_ns:
+            retabulated.append((path, tables, previousFile))
+    results = decode_all(retabulated, jobs, _retabulate_file)
+
+    # Remove the state before changing the outputs so they're never mistaken for the ones the state describes.
+    if os.path.exists(statePath):
+        os.remove(statePath)
+
+    outputs = {table: _PatchedOutput(outputPath, previousFiles is not None) for table, outputPath in outputPaths.items()}
+    files = []
+    changedTotal = 0
+    try:
+        for table, output in outputs.items():
+            output.write(_encode(table_heading(table)))
+
+        retabulatedPaths = {job[0] for job in retabulated}
+        for path in paths:
+            with instrument.archive(path):
+                if path not in retabulatedPaths:
+                    previousFile, starts = previous[path]
+                    with instrument.stage('copy'):
+                        for table, output in outputs.items():
+                            output.copy(starts[table], int(previousFile.segment_lengths[table].sum()))
+                    files.append(previousFile)
+                    continue
+
+                with instrument.stage('decode'):
+                    tabulatedFile, segments, changedCount = next(results)
+                previousFile, starts = previous.get(path, (None, None))
+                segmentLengths = {}
+                for table, output in outputs.items():
+                    lengths = np.zeros(len(segments[table]) + 1, dtype=np.int64)
+
+                    section = _encode(tabulate.mesh_names_section_heading(path)) if table == tabulate.MESH_NAME_TABLE else b''
+                    output.write(section)
+                    lengths[0] = len(section)
+
+                    if previousFile is not None:
+                        previousLengths = previousFile.segment_lengths[table]
+                        previousStarts = (starts[table] + np.concatenate([[0], np.cumsum(previousLengths)])).tolist()
+                    for index, segment in enumerate(segments[table]):
+                        if segment is None:
+                            # Segment 0 is the section heading, so object i is segment i + 1.
+                            output.copy(previousStarts[index + 1], int(previousLengths[index + 1]))
+                            lengths[index + 1] = previousLengths[index + 1]
+                        else:
+                            output.write(segment)
+                            lengths[index + 1] = len(segment)
+                    segmentLengths[table] = lengths
+
+                changedTotal += changedCount
+                files.append(tabulatedFile._replace(segment_lengths=segmentLengths))
+    finally:
+        for output in outputs.values():
+            output.close()
+
+    save_tabulation_state(statePath, tables, files)
+    return changedTotal
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.batch', description="Tabulate details from many Maxis mesh files in parallel.")
+    parser.add_argument('inputs', nargs='+', help="Mesh files, directories (searched recursively for .max files) or glob patterns.")
+    parser.add_argument('-o', '--output-dir', default='.', help="Folder for the output tables (default: current folder).")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: one per CPU).")
+    parser.add_argument('-t', '--tables', nargs='+', choices=tabulate.TABLES, default=tabulate.TABLES, help="Tables to write (default: all).")
+    parser.add_argument('-c', '--columnar', nargs='?', const='auto', choices=['auto', *columnar.FORMATS],
+                        help="Also write the object header and face tables in a columnar format (default: parquet if pyarrow is installed, otherwise npz).")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help="Only decode the objects that changed since the previous incremental run, updating the existing tables.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.incremental and args.columnar:
+        parser.error("--incremental can't be used with --columnar.")
+
+    paths = find_mesh_files(args.inputs)
+    if not paths:
+        parser.error("No mesh files found.")
+
+    jobs = 1 if args.profile else args.jobs
+    with instrument.recording_from_arguments(args):
+        if args.incremental:
+            changedCount = tabulate_files_incremental(paths, args.output_dir, args.tables, jobs)
+            print(f"Tabulated {len(paths)} mesh files ({changedCount} objects changed).")
+            return
+
+        columnarFormat = columnar.default_format() if args.columnar == 'auto' else args.columnar
+        tabulate_files(paths, args.output_dir, args.tables, jobs, columnarFormat)
+        print(f"Tabulated {len(paths)} mesh files.")
+
+
+if __name__ == '__main__':
+    main()
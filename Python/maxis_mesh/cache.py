@@ -0,0 +1,176 @@
+# Persistent index of the objects in a Maxis mesh file.
+
+# The index is stored in a small sidecar file (by default next to the mesh file, e.g. sim3d1.max.mmidx) so listing meshes or
+# looking one up by name doesn't require parsing the mesh file again.
+# The index records the size, modification time and SHA-1 digest of the mesh file it was built from:
+#   * If the size and modification time match, the index is used without reading the mesh file at all.
+#   * If only the modification time differs, the mesh file is hashed; if the digest matches, the index is still used.
+#   * Otherwise (e.g., the file was modified by mesh-replace), the index is rebuilt.
+
+import hashlib
+import os
+import struct
+from collections import namedtuple
+
+from .max_file import MaxFile
+
+INDEX_EXTENSION = '.mmidx'
+INDEX_MAGIC = b'MMIX'
+INDEX_VERSION = 1
+
+# Magic, version, file size, mtime (ns), SHA-1 digest, object count.
+STRUCT_INDEX_HEADER = struct.Struct('<4sIQQ20sI')
+# Offset, total size, vertex count, face count, rendered vertex count, radius, ID, geometry table name length, object name length.
+STRUCT_INDEX_RECORD = struct.Struct('<IIHHIIiBB')
+
+ObjectEntry = namedtuple('ObjectEntry', [
+    'index', 'offset', 'total_size', 'vertex_count', 'face_count',
+    'rendered_vertex_count', 'radius', 'id', 'table_name', 'name'])
+
+
+class MeshIndex:
+    """The object table of a mesh file: names, offsets, sizes, counts, radii and IDs."""
+
+    def __init__(self, path, fileSize, mtime, digest, objects):
+        self.path = path
+        self.file_size = fileSize
+        self.mtime = mtime
+        self.digest = digest
+        self.objects = objects
+        self._byName = None
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __getitem__(self, index):
+        return self.objects[index]
+
+    def find(self, name):
+        """All objects whose geometry table name or object name matches (case-insensitive)."""
+        if self._byName is None:
+            self._byName = {}
+            for entry in self.objects:
+                for key in {entry.table_name.casefold(), entry.name.casefold()}:
+                    self._byName.setdefault(key, []).append(entry)
+        return list(self._byName.get(name.casefold(), []))
+
+    def to_bytes(self):
+        records = bytearray()
+        names = bytearray()
+        for entry in self.objects:
+            tableName = entry.table_name.encode('ascii')
+            name = entry.name.encode('ascii')
+            records += STRUCT_INDEX_RECORD.pack(
+                entry.offset, entry.total_size, entry.vertex_count, entry.face_count,
+                entry.rendered_vertex_count, entry.radius, entry.id, len(tableName), len(name))
+            names += tableName + name
+
+        header = STRUCT_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.file_size, self.mtime, self.digest, len(self.objects))
+        return header + records + names
+
+    @classmethod
+    def from_bytes(cls, path, data):
+        magic, version, fileSize, mtime, digest, count = STRUCT_INDEX_HEADER.unpack_from(data, 0)
+
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Unrecognized index format.")
+
+        objects = []
+        pos = STRUCT_INDEX_HEADER.size
+        namePos = pos + count*STRUCT_INDEX_RECORD.size
+
+        for index, values in enumerate(STRUCT_INDEX_RECORD.iter_unpack(data[pos:namePos])):
+            *fields, tableNameLength, nameLength = values
+            tableName = data[namePos:namePos+tableNameLength].decode('ascii')
+            namePos += tableNameLength
+            name = data[namePos:namePos+nameLength].decode('ascii')
+            namePos += nameLength
+            objects.append(ObjectEntry(index, *fields, tableName, name))
+
+        if namePos != len(data):
+            raise ValueError("Index is truncated or has trailing data.")
+
+        return cls(path, fileSize, mtime, digest, objects)
+
+
+def file_digest(data):
+    return hashlib.sha1(data).digest()
+
+
+def build_index(maxFile):
+    """Build an index from an open MaxFile."""
+    stat = os.stat(maxFile.path)
+
+    objects = []
+    for header in maxFile.object_headers():
+        tableEntry = maxFile.geom_table_entry(header.index)
+        objects.append(ObjectEntry(
+            header.index, header.offset, header.total_size, header.vertex_count, header.face_count,
+            tableEntry.rendered_vertex_count, header.radius, header.id, tableEntry.name, header.name))
+
+    return MeshIndex(maxFile.path, stat.st_size, stat.st_mtime_ns, file_digest(maxFile.data), objects)
+
+
+def index_path(path, cacheDir=None):
+    """Path of the index file for a mesh file. If cacheDir is given, the index is stored there instead of next to the mesh file."""
+    if cacheDir is None:
+        return path + INDEX_EXTENSION
+
+    # Include a digest of the absolute path so files with the same name (e.g., sim3d1.max from each game) don't collide.
+    absolutePath = os.path.abspath(path)
+    pathDigest = hashlib.sha1(absolutePath.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cacheDir, f"{os.path.basename(path)}.{pathDigest}{INDEX_EXTENSION}")
+
+
+def _read_index(path, cachePath):
+    try:
+        with open(cachePath, 'rb') as file:
+            return MeshIndex.from_bytes(path, file.read())
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def _write_index(index, cachePath):
+    # Write to a temporary file first so a partially-written index is never read.
+    tempPath = cachePath + '.tmp'
+    try:
+        directory = os.path.dirname(cachePath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tempPath, 'wb') as file:
+            file.write(index.to_bytes())
+        os.replace(tempPath, cachePath)
+    except OSError:
+        # The index is only a cache; failing to write it (e.g., read-only game folder) isn't an error.
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+
+
+def load_index(path, cacheDir=None):
+    """Load the index for a mesh file, building (and saving) it if there's no valid cached index."""
+    cachePath = index_path(path, cacheDir)
+    stat = os.stat(path)
+    cached = _read_index(path, cachePath)
+
+    if cached is not None and cached.file_size == stat.st_size:
+        if cached.mtime == stat.st_mtime_ns:
+            return cached
+
+        with open(path, 'rb') as file:
+            digest = file_digest(file.read())
+
+        if digest == cached.digest:
+            cached.mtime = stat.st_mtime_ns
+            _write_index(cached, cachePath)
+            return cached
+
+    with MaxFile(path) as maxFile:
+        index = build_index(maxFile)
+
+    _write_index(index, cachePath)
+    return index
@@ -0,0 +1,172 @@
+# Command-line client for the mesh service (see maxis_mesh.service).
+
+# Each command is a single HTTP request to a running service, which already has the mesh files open and parsed, so commands
+# return in milliseconds rather than paying for decoding (and importing NumPy) every time. Doesn't require NumPy.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.client [--host <host>] [--port <port>] <command> ...
+# Commands:
+#   archives                                          List the mesh files held by the service.
+#   list <mesh file>                                  List the objects in a mesh file (CSV).
+#   obj <mesh file> <object> [-o <.obj path>]         Export an object to OBJ (and MTL, when writing to a file).
+#   bin <mesh file> <object> -o <.bin path>           Extract an object.
+#   replace <mesh file> <objects> <.bin path> [-o <output path>] [--validate]
+#   tabulate [<mesh file> ...] -o <folder> [--tables <name> [...]]
+#   stop                                              Stop the service.
+# Mesh files can be paths or, if they're already held by the service, file names (e.g., sim3d1.max). Objects are indices or names.
+
+import argparse
+import json
+import os
+import socket
+import sys
+import urllib.parse
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7315
+
+
+def request(method, path, params=(), body=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Send a request to the service and return the body of the response (bytes).
+
+    params is a sequence of (name, value) pairs. Raises RuntimeError with the service's message if the request fails.
+    """
+    # The service closes the connection after each response, so the response is simply read to the end. (http.client would take
+    # longer to import than the request takes.)
+    target = path + ('?' + urllib.parse.urlencode(list(params)) if params else '')
+    body = body or b''
+    head = f"{method} {target} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(head.encode('ascii') + body)
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    responseHead, _, content = b''.join(chunks).partition(b'\r\n\r\n')
+    statusLine = responseHead.split(b'\r\n', 1)[0].decode('latin-1')
+    _, status, reason = (statusLine.split(' ', 2) + ['', ''])[:3]
+
+    if status != '200':
+        try:
+            message = json.loads(content)['error']
+        except (ValueError, KeyError, TypeError):
+            message = content.decode('utf-8', 'replace') or reason or "The service didn't respond."
+        raise RuntimeError(message)
+    return content
+
+
+def request_json(method, path, params=(), body=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return json.loads(request(method, path, params, body, host, port))
+
+
+def archive_parameter(archive):
+    # Existing files are sent as absolute paths (the service may have a different working folder); anything else is sent as is
+    # so the service can match it against the file names of the archives it holds.
+    return os.path.abspath(archive) if os.path.isfile(archive) else archive
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.client', description="Send requests to a running mesh service (python -m maxis_mesh.service).")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('archives', help="List the mesh files held by the service.")
+
+    listParser = commands.add_parser('list', help="List the objects in a mesh file.")
+    listParser.add_argument('archive')
+
+    objParser = commands.add_parser('obj', help="Export an object to OBJ.")
+    objParser.add_argument('archive')
+    objParser.add_argument('object', help="Object index or name.")
+    objParser.add_argument('-o', '--output', help="Path of the .obj file (an .mtl file is written alongside it). Default: print the OBJ text.")
+    objParser.add_argument('--unscaled', action='store_true', help="Keep the games' coordinates instead of dividing them by 2^18.")
+
+    binParser = commands.add_parser('bin', help="Extract an object.")
+    binParser.add_argument('archive')
+    binParser.add_argument('object', help="Object index or name.")
+    binParser.add_argument('-o', '--output', required=True, help="Path of the .bin file.")
+
+    replaceParser = commands.add_parser('replace', help="Replace objects with a .bin file.")
+    replaceParser.add_argument('archive')
+    replaceParser.add_argument('objects', help="Indices (or names) of the objects to replace, separated by commas.")
+    replaceParser.add_argument('replacement', help="Path to replacement object data.")
+    replaceParser.add_argument('-o', '--output', help="Output path (default: replace the objects in place).")
+    replaceParser.add_argument('--validate', action='store_true', help="Check the replacement first (see maxis_mesh.validate) and don't replace anything if it has errors.")
+
+    tabulateParser = commands.add_parser('tabulate', help="Update tables incrementally (like python -m maxis_mesh.batch --incremental).")
+    tabulateParser.add_argument('archives', nargs='*', help="Mesh files (default: every mesh file held by the service).")
+    tabulateParser.add_argument('-o', '--output-dir', required=True, help="Folder for the output tables.")
+    tabulateParser.add_argument('-t', '--tables', nargs='+', help="Tables to write (default: all).")
+
+    commands.add_parser('stop', help="Stop the service.")
+
+    args = parser.parse_args(argv)
+    address = {'host': args.host, 'port': args.port}
+
+    try:
+        if args.command == 'archives':
+            for archive in request_json('GET', '/archives', **address):
+                print(f"{archive['path']}: {archive['object_count']} objects, reloaded {archive['reloads']} times")
+
+        elif args.command == 'list':
+            objects = request_json('GET', '/objects', [('archive', archive_parameter(args.archive))], **address)
+            print("Index,Table Name,Name,Vertex Count,Face Count,Radius")
+            for entry in objects:
+                print(f"{entry['index']},{entry['table_name']},{entry['name']},{entry['vertex_count']},{entry['face_count']},{entry['radius']}")
+
+        elif args.command == 'obj':
+            params = [('archive', archive_parameter(args.archive)), ('object', args.object)]
+            if args.unscaled:
+                params.append(('unscaled', '1'))
+            if args.output is None:
+                sys.stdout.write(request('GET', '/object', params + [('format', 'obj')], **address).decode('utf-8'))
+            else:
+                mtlPath = os.path.splitext(args.output)[0] + '.mtl'
+                objText = request('GET', '/object', params + [('format', 'obj'), ('mtl', os.path.basename(mtlPath))], **address)
+                mtlText = request('GET', '/object', params + [('format', 'mtl')], **address)
+                with open(args.output, 'wb') as out:
+                    out.write(objText)
+                with open(mtlPath, 'wb') as out:
+                    out.write(mtlText)
+
+        elif args.command == 'bin':
+            params = [('archive', archive_parameter(args.archive)), ('object', args.object), ('format', 'bin')]
+            with open(args.output, 'wb') as out:
+                out.write(request('GET', '/object', params, **address))
+
+        elif args.command == 'replace':
+            params = [('archive', archive_parameter(args.archive))]
+            params += [('object', key.strip()) for key in args.objects.split(',')]
+            if args.output:
+                params.append(('output', os.path.abspath(args.output)))
+            if args.validate:
+                params.append(('validate', '1'))
+            with open(args.replacement, 'rb') as file:
+                result = request_json('POST', '/replace', params, file.read(), **address)
+            print(f"Replaced objects {', '.join(map(str, result['replaced']))} in {result['output']}.")
+
+        elif args.command == 'tabulate':
+            params = [('archive', archive_parameter(archive)) for archive in args.archives]
+            params.append(('output-dir', os.path.abspath(args.output_dir)))
+            params += [('table', table) for table in args.tables or []]
+            result = request_json('POST', '/tabulate', params, **address)
+            print(f"Tabulated {result['file_count']} mesh files ({result['changed_count']} objects changed).")
+            for skipped in result['skipped']:
+                print(f"Skipped {skipped['path']}: {skipped['error']}")
+
+        elif args.command == 'stop':
+            request('POST', '/shutdown', **address)
+
+    except ConnectionRefusedError:
+        sys.exit(f"No mesh service is running on {args.host}:{args.port} (start one with python -m maxis_mesh.service).")
+    except RuntimeError as e:
+        sys.exit(f"error: {e}")
+
+
+if __name__ == '__main__':
+    main()
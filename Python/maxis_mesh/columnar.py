@@ -0,0 +1,188 @@
+# Columnar output of tables (Parquet, Arrow IPC or NumPy .npz) so they can be loaded for analysis without parsing CSV.
+# Requires NumPy. Parquet and Arrow IPC output also require pyarrow (optional).
+
+# Tables are written in chunks (one per mesh file), each a dict mapping column names to equal-length arrays.
+# Parquet and Arrow IPC files are written incrementally (one row group/record batch per chunk), so only one chunk is held in
+# memory at a time. An .npz file is a zip archive with one .npy member per column, and each member's header holds the column's
+# length, so each column is appended to a temporary file as chunks are written. When the file is closed, each column is copied
+# into its member one chunk at a time after a header for the total length.
+
+# Each chunk also has a file label (typically the path of the mesh file), stored in the "file" column. In Parquet and Arrow IPC
+# files, it's dictionary-encoded. In .npz files, the "file_index" column holds indices into the "files" array instead.
+
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMAT_NPZ = 'npz'
+
+FORMATS = [FORMAT_PARQUET, FORMAT_ARROW, FORMAT_NPZ]
+
+EXTENSIONS = {
+    FORMAT_PARQUET: '.parquet',
+    FORMAT_ARROW: '.arrow',
+    FORMAT_NPZ: '.npz',
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+class _NpzColumn:
+    # A column of an .npz table being written: its chunks' raw data (in a temporary file next to the output), dtypes and lengths.
+
+    def __init__(self, directory):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.chunks = [] # (dtype, row count)
+        self.shape = None # Shape of each row
+
+    def append(self, values):
+        values = np.ascontiguousarray(values)
+        if values.dtype.hasobject:
+            raise ValueError("Object columns can't be written to .npz files.")
+        if self.shape is None:
+            self.shape = values.shape[1:]
+        elif values.shape[1:] != self.shape:
+            raise ValueError(f"Chunks have rows of different shapes ({self.shape} and {values.shape[1:]}).")
+        self.file.write(values.data)
+        self.chunks.append((values.dtype, len(values)))
+
+    def copy_to(self, out):
+        # Write the column as a .npy file. Like np.concatenate, chunks of different dtypes (e.g., strings of different lengths)
+        # are converted to a common one.
+        dtype = np.result_type(*[dtype for dtype, _ in self.chunks])
+        rowCount = sum(count for _, count in self.chunks)
+        header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (rowCount, *self.shape)}
+        np.lib.format.write_array_header_1_0(out, header)
+
+        self.file.seek(0)
+        for chunkType, count in self.chunks:
+            shape = (count, *self.shape)
+            data = self.file.read(chunkType.itemsize*int(np.prod(shape, dtype=np.int64)))
+            out.write(np.frombuffer(data, dtype=chunkType).reshape(shape).astype(dtype, copy=False).data)
+
+    def close(self):
+        self.file.close()
+
+
+def default_format():
+    """Parquet if pyarrow is installed, otherwise .npz."""
+    return FORMAT_PARQUET if _import_pyarrow() is not None else FORMAT_NPZ
+
+
+class ColumnarWriter:
+    """Writes a table to a columnar file one chunk at a time.
+
+    format is one of FORMATS (default: default_format()). If path has no extension, the one for the format is added; the
+    resulting path is available as the path attribute.
+    """
+
+    def __init__(self, path, format=None):
+        if format is None:
+            format = default_format()
+        if format not in FORMATS:
+            raise ValueError(f"Unknown columnar format {format!r} (expected one of {', '.join(FORMATS)}).")
+
+        if format != FORMAT_NPZ:
+            self._pyarrow = _import_pyarrow()
+            if self._pyarrow is None:
+                raise ImportError(f"Writing {format} files requires pyarrow; install it or use the {FORMAT_NPZ} format.")
+
+        if not os.path.splitext(path)[1]:
+            path += EXTENSIONS[format]
+
+        self.path = path
+        self.format = format
+        self.row_count = 0
+        self._writer = None
+        self._columns = {} # Column name to _NpzColumn
+        self._files = []
+        self._fileIndices = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, columns, fileLabel):
+        """Append a chunk of rows. columns maps column names to equal-length arrays; every chunk must have the same columns."""
+        rowCount = len(next(iter(columns.values())))
+
+        if fileLabel not in self._fileIndices:
+            self._fileIndices[fileLabel] = len(self._files)
+            self._files.append(fileLabel)
+        fileIndices = np.full(rowCount, self._fileIndices[fileLabel], dtype=np.int32)
+
+        if self.format == FORMAT_NPZ:
+            self._write_npz({'file_index': fileIndices, **columns})
+        else:
+            self._write_arrow(columns, fileIndices)
+
+        self.row_count += rowCount
+
+    def _write_npz(self, columns):
+        if self._columns is None:
+            raise ValueError(f"{self.path} has already been closed.")
+        for name, values in columns.items():
+            if name not in self._columns:
+                self._columns[name] = _NpzColumn(os.path.dirname(os.path.abspath(self.path)))
+            self._columns[name].append(values)
+
+    def _write_arrow(self, columns, fileIndices):
+        pa = self._pyarrow
+        # The dictionary holds every label seen so far; Arrow IPC files can only extend it (as a delta), not replace it.
+        fileColumn = pa.DictionaryArray.from_arrays(pa.array(fileIndices), pa.array(self._files, type=pa.string()))
+        arrays = [fileColumn] + [pa.array(np.asarray(values)) for values in columns.values()]
+        batch = pa.RecordBatch.from_arrays(arrays, names=['file', *columns.keys()])
+
+        if self._writer is None:
+            if self.format == FORMAT_PARQUET:
+                import pyarrow.parquet
+                self._writer = pyarrow.parquet.ParquetWriter(self.path, batch.schema)
+            else:
+                import pyarrow.ipc
+                self._writer = pyarrow.ipc.new_file(self.path, batch.schema, options=pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+        if self.format == FORMAT_PARQUET:
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def close(self):
+        if self.format == FORMAT_NPZ:
+            if self._columns is None:
+                return
+            try:
+                # Members are stored uncompressed, as by np.savez.
+                with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+                    for name, column in self._columns.items():
+                        with archive.open(name + '.npy', 'w', force_zip64=True) as out:
+                            column.copy_to(out)
+                    with archive.open('files.npy', 'w', force_zip64=True) as out:
+                        np.lib.format.write_array(out, np.array(self._files, dtype=str))
+            finally:
+                for column in self._columns.values():
+                    column.close()
+                self._columns = None
+        elif self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def read_npz_table(path):
+    """Columns of an .npz table as a dict, with a "file" column of file labels in place of the "file_index" column."""
+    with np.load(path) as npz:
+        columns = {name: npz[name] for name in npz.files if name not in ('files', 'file_index')}
+        if 'file_index' in npz.files:
+            columns = {'file': npz['files'][npz['file_index']], **columns}
+    return columns
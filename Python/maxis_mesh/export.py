@@ -0,0 +1,445 @@
+# Export of every object in Maxis mesh files to Wavefront OBJ (with MTL materials) and binary glTF (.glb).
+# Requires NumPy.
+
+# Conventions match the OBJ export in the viewer (Processing/maxis_mesh_viewer/functions_export.pde):
+#   * Z is negated and the winding order of each face is reversed, since the games use a left-handed coordinate system.
+#   * UV coordinates are divided by 2^16 and exported with V negated (after flipping it for the viewer's top-left origin).
+#   * Textured faces (types 2, 13 and 18) use a material named "mat<texFile>-<tex/colour>" referencing the texture
+#     "tex<texFile>-<tex/colour>.png" (as exported by the viewer); other faces use "matcolour-<colour index>" with that colour.
+# Unlike the viewer, coordinates are divided by 2^18 (roughly converting them to metres) unless scaling is disabled, and lines
+# and points are written as OBJ "l" and "p" elements rather than faces.
+
+# For each mesh file, one OBJ file is written per object, all of them sharing a single MTL file, and a single .glb file
+# containing every object (as a separate node and mesh, sharing one list of materials) is written alongside them.
+# Geometry is transformed and formatted with array operations, and files are exported in parallel by worker processes (each file
+# is decoded once, by the worker exporting all of its objects).
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.export <directory, file or glob pattern> [...] [--output-dir <path>] [--formats obj glb] [--jobs <count>] [--unscaled]
+
+import argparse
+import json
+import os
+import re
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from .arrays import csr_offsets, decode_file
+from .batch import decode_all, find_mesh_files
+from .max_file import MaxFile, PALETTE_SIZE, decode_name
+from . import instrument
+
+SPATIAL_SCALE = 2.0**18
+UV_SCALE = 2.0**16
+
+TEXTURED_FACE_TYPES = [2, 13, 18]
+
+# Material IDs below this are colour indices; IDs from it upwards encode (texFile, tex/colour) of textured faces.
+MATERIAL_ID_TEXTURE_BASE = PALETTE_SIZE
+
+FORMAT_OBJ = 'obj'
+FORMAT_GLB = 'glb'
+FORMATS = [FORMAT_OBJ, FORMAT_GLB]
+
+# glTF constants.
+GLTF_MODE_POINTS = 0
+GLTF_MODE_LINES = 1
+GLTF_MODE_TRIANGLES = 4
+GLTF_FLOAT = 5126
+GLTF_UNSIGNED_INT = 5125
+GLTF_ARRAY_BUFFER = 34962
+GLTF_ELEMENT_ARRAY_BUFFER = 34963
+GLTF_NEAREST = 9728
+
+
+def texture_key(texFile, texIndex):
+    return f"{texFile}-{texIndex}"
+
+
+def face_material_ids(faces):
+    """Material ID of each face (see MATERIAL_ID_TEXTURE_BASE)."""
+    isTexturedType = np.zeros(256, dtype=bool)
+    isTexturedType[TEXTURED_FACE_TYPES] = True
+    textureIds = MATERIAL_ID_TEXTURE_BASE + faces['tex_file'].astype(np.int64)*PALETTE_SIZE + faces['tex_index']
+    return np.where(isTexturedType[faces['face_type']], textureIds, faces['tex_index'].astype(np.int64))
+
+
+def material_texture_key(materialId):
+    """Texture key of a textured material, or None for a colour material."""
+    if materialId < MATERIAL_ID_TEXTURE_BASE:
+        return None
+    return texture_key(*divmod(materialId - MATERIAL_ID_TEXTURE_BASE, PALETTE_SIZE))
+
+
+def material_name(materialId):
+    key = material_texture_key(materialId)
+    return f"matcolour-{materialId}" if key is None else "mat" + key
+
+
+class ExportGeometry(namedtuple('ExportGeometry', [
+        'positions', # float64 (V, 3), with Z negated (and scaled unless exporting unscaled)
+        'vertex_indices', # int64, object-local vertex indices of all faces, with each face's winding reversed
+        'uvs', # float64 (M, 2), UV coordinates divided by 2^16 (in the same order as vertex_indices)
+        'material_ids', # int64, one per face
+        ])):
+    """Transformed geometry of every object in a MeshArrays (using its CSR offsets)."""
+
+    __slots__ = ()
+
+
+def export_geometry(arrays, scale=True):
+    """Transform the geometry of a whole file at once."""
+    counts = arrays.faces['vertex_count'].astype(np.int64)
+    offsets = arrays.face_vertex_offsets
+
+    # Reverse the order of each face's vertices: the ith vertex of a face with n vertices becomes the (n - 1 - i)th.
+    position = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1], counts)
+    reversedOrder = np.repeat(offsets[1:] - 1, counts) - position
+
+    vertexIndices = arrays.vertex_indices[reversedOrder].astype(np.int64)
+    uvs = arrays.uvs[reversedOrder]/UV_SCALE
+
+    # Adding 0.0 turns the -0.0 produced by negating zero into 0.0.
+    positions = arrays.vertices*np.array([1.0, 1.0, -1.0]) + 0.0
+    if scale:
+        positions /= SPATIAL_SCALE
+
+    objectVertexCounts = np.diff(arrays.object_vertex_offsets)
+    objectCornerCounts = np.diff(offsets[arrays.object_face_offsets])
+    isOutOfRange = vertexIndices >= np.repeat(objectVertexCounts, objectCornerCounts)
+    if isOutOfRange.any():
+        corner = int(np.flatnonzero(isOutOfRange)[0])
+        index = int(np.searchsorted(offsets[arrays.object_face_offsets], corner, side='right')) - 1
+        raise ValueError(f"{arrays.path}: object {index} has a face referencing vertex {vertexIndices[corner]} but only {objectVertexCounts[index]} vertices.")
+
+    return ExportGeometry(positions, vertexIndices, uvs, face_material_ids(arrays.faces))
+
+
+class ObjectGeometry(namedtuple('ObjectGeometry', [
+        'index',
+        'name',
+        'positions',
+        'face_vertex_counts', # int64, one per face
+        'face_vertex_offsets', # int64 CSR offsets into vertex_indices and uvs
+        'vertex_indices',
+        'uvs',
+        'material_ids',
+        ])):
+    """Transformed geometry of one object (fields as in ExportGeometry)."""
+
+    __slots__ = ()
+
+
+def object_geometry(arrays, geometry, index):
+    """Geometry of one object, sliced from the MeshArrays and ExportGeometry of its file."""
+    faceStart, faceEnd = arrays.object_face_offsets[index:index + 2]
+    faceVertexOffsets = arrays.face_vertex_offsets[faceStart:faceEnd + 1]
+    cornerStart, cornerEnd = faceVertexOffsets[0], faceVertexOffsets[-1]
+    vertexStart, vertexEnd = arrays.object_vertex_offsets[index:index + 2]
+
+    name = decode_name(arrays.objects[index]['name'].tobytes())
+    return ObjectGeometry(index, name, geometry.positions[vertexStart:vertexEnd],
+                          np.diff(faceVertexOffsets), faceVertexOffsets - cornerStart,
+                          geometry.vertex_indices[cornerStart:cornerEnd], geometry.uvs[cornerStart:cornerEnd],
+                          geometry.material_ids[faceStart:faceEnd])
+
+
+def obj_text(geometry, mtlFileName):
+    """An object as the text of an OBJ file."""
+    lines = [f"mtllib {mtlFileName}\n", f"o {geometry.name or 'mesh-' + str(geometry.index)}\n", "s off\n"]
+
+    if len(geometry.positions):
+        lines.append('v %.10g %.10g %.10g\n'*len(geometry.positions) % tuple(geometry.positions.ravel().tolist()))
+
+    cornerCount = len(geometry.vertex_indices)
+    if cornerCount == 0:
+        return ''.join(lines)
+
+    # V is negated after flipping it (v' = 1 - v) as the viewer does.
+    texcoords = np.column_stack([geometry.uvs[:, 0], geometry.uvs[:, 1] - 1])
+    lines.append('vt %.10g %.10g\n'*cornerCount % tuple(texcoords.ravel().tolist()))
+
+    # OBJ indices start at 1. Each corner has its own texture coordinate.
+    references = np.column_stack([geometry.vertex_indices + 1, np.arange(1, cornerCount + 1)])
+    corners = ('%d/%d\n'*cornerCount % tuple(references.ravel().tolist())).split('\n')
+    points = [str(i) for i in (geometry.vertex_indices + 1).tolist()]
+
+    currentMaterial = None
+    for count, start, materialId in zip(geometry.face_vertex_counts.tolist(), geometry.face_vertex_offsets.tolist(), geometry.material_ids.tolist()):
+        if materialId != currentMaterial:
+            lines.append(f"usemtl {material_name(materialId)}\n")
+            currentMaterial = materialId
+
+        if count >= 3:
+            lines.append("f " + ' '.join(corners[start:start + count]) + '\n')
+        elif count == 2:
+            lines.append("l " + ' '.join(corners[start:start + count]) + '\n')
+        elif count == 1:
+            lines.append("p " + points[start] + '\n')
+
+    return ''.join(lines)
+
+
+def mtl_text(materialIds, palette):
+    """MTL file defining the given materials. palette is a list of (r, g, b) tuples."""
+    lines = []
+    for materialId in sorted(materialIds):
+        key = material_texture_key(materialId)
+        lines.append(f"newmtl {material_name(materialId)}\n")
+        if key is None:
+            r, g, b = (c/255.0 for c in palette[materialId])
+            lines.append(f"Ka {r} {g} {b}\n")
+            lines.append(f"Kd {r} {g} {b}\n")
+            lines.append("Ks 0.0 0.0 0.0\n")
+            lines.append("Ns 0.0\n")
+        else:
+            lines.append("Ka 1.0 1.0 1.0\n")
+            lines.append("Kd 1.0 1.0 1.0\n")
+            lines.append("Ks 0.0 0.0 0.0\n")
+            lines.append("Ns 0.0\n")
+            lines.append(f"map_Ka tex{key}.png\n")
+            lines.append(f"map_Kd tex{key}.png\n")
+        lines.append("\n")
+    return ''.join(lines)
+
+
+# Geometry of one object prepared for glTF: one vertex per face corner (since each corner has its own UV coordinates).
+GlbObject = namedtuple('GlbObject', [
+    'name',
+    'positions', # float32 (N, 3)
+    'texcoords', # float32 (N, 2), with V measured from the top of the texture
+    'primitives', # List of (material ID, mode, uint32 indices into positions)
+])
+
+
+def glb_object(geometry):
+    counts = geometry.face_vertex_counts
+    starts = geometry.face_vertex_offsets[:-1]
+    positions = geometry.positions[geometry.vertex_indices].astype(np.float32)
+    texcoords = np.column_stack([geometry.uvs[:, 0], 1 - geometry.uvs[:, 1]]).astype(np.float32)
+
+    # Triangulate faces as fans: (0, k, k + 1) for k = 1 to n - 2.
+    polygonFaces = np.flatnonzero(counts >= 3)
+    triangleCounts = counts[polygonFaces] - 2
+    triangleFaces = np.repeat(polygonFaces, triangleCounts)
+    k = 1 + np.arange(int(triangleCounts.sum()), dtype=np.int64) - np.repeat(csr_offsets(triangleCounts)[:-1], triangleCounts)
+    triangleStarts = starts[triangleFaces]
+    triangles = np.column_stack([triangleStarts, triangleStarts + k, triangleStarts + k + 1])
+
+    lineFaces = np.flatnonzero(counts == 2)
+    lines = np.column_stack([starts[lineFaces], starts[lineFaces] + 1])
+
+    pointFaces = np.flatnonzero(counts == 1)
+    points = starts[pointFaces][:, None]
+
+    primitives = []
+    for mode, elementFaces, elements in ((GLTF_MODE_TRIANGLES, triangleFaces, triangles), (GLTF_MODE_LINES, lineFaces, lines), (GLTF_MODE_POINTS, pointFaces, points)):
+        materialIds = geometry.material_ids[elementFaces]
+        for materialId in np.unique(materialIds).tolist():
+            primitives.append((materialId, mode, elements[materialIds == materialId].astype(np.uint32).ravel()))
+
+    return GlbObject(geometry.name or f"mesh-{geometry.index}", positions, texcoords, primitives)
+
+
+def _srgb_to_linear(value):
+    return value/12.92 if value <= 0.04045 else ((value + 0.055)/1.055)**2.4
+
+
+def glb_bytes(glbObjects, palette):
+    """A binary glTF file containing each object as a separate node and mesh."""
+    materialIds = sorted({materialId for glbObject in glbObjects for materialId, _, _ in glbObject.primitives})
+    materialIndices = {materialId: i for i, materialId in enumerate(materialIds)}
+
+    materials = []
+    images = []
+    for materialId in materialIds:
+        key = material_texture_key(materialId)
+        if key is None:
+            r, g, b = (_srgb_to_linear(c/255.0) for c in palette[materialId])
+            pbr = {'baseColorFactor': [r, g, b, 1.0], 'metallicFactor': 0.0, 'roughnessFactor': 1.0}
+        else:
+            pbr = {'baseColorTexture': {'index': len(images)}, 'metallicFactor': 0.0, 'roughnessFactor': 1.0}
+            images.append({'uri': f"tex{key}.png"})
+        materials.append({'name': material_name(materialId), 'pbrMetallicRoughness': pbr, 'doubleSided': False})
+
+    chunks = []
+    bufferViews = []
+    accessors = []
+    byteLength = 0
+
+    def add_accessor(array, accessorType, componentType, target, bounds=False):
+        nonlocal byteLength
+        data = np.ascontiguousarray(array).tobytes()
+        bufferViews.append({'buffer': 0, 'byteOffset': byteLength, 'byteLength': len(data), 'target': target})
+        accessor = {'bufferView': len(bufferViews) - 1, 'componentType': componentType, 'count': len(array), 'type': accessorType}
+        if bounds:
+            accessor['min'] = array.min(axis=0).tolist()
+            accessor['max'] = array.max(axis=0).tolist()
+        accessors.append(accessor)
+        padding = -len(data) % 4
+        chunks.append(data + bytes(padding))
+        byteLength += len(data) + padding
+        return len(accessors) - 1
+
+    meshes = []
+    nodes = []
+    for glbObject in glbObjects:
+        node = {'name': glbObject.name}
+        if glbObject.primitives:
+            attributes = {
+                'POSITION': add_accessor(glbObject.positions, 'VEC3', GLTF_FLOAT, GLTF_ARRAY_BUFFER, bounds=True),
+                'TEXCOORD_0': add_accessor(glbObject.texcoords, 'VEC2', GLTF_FLOAT, GLTF_ARRAY_BUFFER),
+            }
+            primitives = [{'attributes': attributes, 'indices': add_accessor(indices, 'SCALAR', GLTF_UNSIGNED_INT, GLTF_ELEMENT_ARRAY_BUFFER),
+                           'material': materialIndices[materialId], 'mode': mode}
+                          for materialId, mode, indices in glbObject.primitives]
+            meshes.append({'name': glbObject.name, 'primitives': primitives})
+            node['mesh'] = len(meshes) - 1
+        nodes.append(node)
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'maxis_mesh.export'},
+        'scene': 0,
+        'scenes': [{'nodes': list(range(len(nodes)))}],
+        'nodes': nodes,
+        'meshes': meshes,
+        'materials': materials,
+        'accessors': accessors,
+        'bufferViews': bufferViews,
+        'buffers': [{'byteLength': byteLength}],
+    }
+    if images:
+        gltf['samplers'] = [{'magFilter': GLTF_NEAREST, 'minFilter': GLTF_NEAREST}]
+        gltf['images'] = images
+        gltf['textures'] = [{'source': i, 'sampler': 0} for i in range(len(images))]
+    if not accessors:
+        del gltf['accessors'], gltf['bufferViews'], gltf['buffers']
+
+    jsonBytes = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    jsonBytes += b' '*(-len(jsonBytes) % 4)
+    binBytes = b''.join(chunks)
+
+    output = [struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(jsonBytes) + (8 + len(binBytes) if binBytes else 0)),
+              struct.pack('<I4s', len(jsonBytes), b'JSON'), jsonBytes]
+    if binBytes:
+        output += [struct.pack('<I4s', len(binBytes), b'BIN\0'), binBytes]
+    return b''.join(output)
+
+
+def object_file_name(index, name):
+    safeName = re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')
+    return f"mesh-{index}-{safeName}" if safeName else f"mesh-{index}"
+
+
+def output_labels(paths):
+    """Folder name for each mesh file's exported objects: the file name without extension, made unique with a suffix."""
+    labels = []
+    seen = {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        count = seen.get(stem.casefold(), 0) + 1
+        seen[stem.casefold()] = count
+        labels.append(stem if count == 1 else f"{stem}-{count}")
+    return labels
+
+
+def export_objects(path, outputFolder, formats=FORMATS, scale=True):
+    """Export every object of a mesh file, writing OBJ files to outputFolder.
+
+    Returns (set of material IDs used, list of GlbObject or None if glb isn't in formats).
+    """
+    arrays = decode_file(path)
+    with instrument.stage('transform'):
+        exportGeometry = export_geometry(arrays, scale)
+    mtlFileName = os.path.basename(outputFolder) + '.mtl'
+
+    materialIds = set()
+    glbObjects = [] if FORMAT_GLB in formats else None
+
+    for index in range(arrays.object_count):
+        geometry = object_geometry(arrays, exportGeometry, index)
+        materialIds.update(geometry.material_ids.tolist())
+
+        if FORMAT_OBJ in formats:
+            with instrument.stage('obj'):
+                text = obj_text(geometry, mtlFileName)
+                with open(os.path.join(outputFolder, object_file_name(index, geometry.name) + '.obj'), 'w') as out:
+                    out.write(text)
+            instrument.count('bytes_written', len(text))
+
+        if glbObjects is not None:
+            with instrument.stage('glb_object'):
+                glbObjects.append(glb_object(geometry))
+
+    return materialIds, glbObjects
+
+
+def _export_task(task):
+    return export_objects(*task)
+
+
+def export_files(paths, outputDir='.', formats=FORMATS, jobs=None, scale=True):
+    """Export every object of each mesh file to a folder (named after the file) in outputDir.
+
+    jobs is the number of worker processes (default: one per CPU). With jobs=1, everything is done in this process.
+    """
+    tasks = []
+    files = []
+    for path, label in zip(paths, output_labels(paths)):
+        outputFolder = os.path.join(outputDir, label)
+        os.makedirs(outputFolder, exist_ok=True)
+        with MaxFile(path) as maxFile:
+            palette = maxFile.palette()
+        tasks.append((path, outputFolder, formats, scale))
+        files.append((path, outputFolder, palette))
+
+    # Like decoding for tabulation, only a few files per worker are exported (or waiting to be handled here) at a time, so their
+    # glTF geometry doesn't accumulate.
+    results = decode_all(tasks, jobs, _export_task)
+    try:
+        for path, outputFolder, palette in files:
+            with instrument.archive(path):
+                # With worker processes, this is the time spent waiting for them.
+                with instrument.stage('export_objects'):
+                    materialIds, glbObjects = next(results)
+
+                label = os.path.basename(outputFolder)
+                if FORMAT_OBJ in formats:
+                    with instrument.stage('mtl'):
+                        text = mtl_text(materialIds, palette)
+                        with open(os.path.join(outputFolder, label + '.mtl'), 'w') as out:
+                            out.write(text)
+                    instrument.count('bytes_written', len(text))
+                if FORMAT_GLB in formats:
+                    with instrument.stage('glb'):
+                        data = glb_bytes(glbObjects, palette)
+                        with open(os.path.join(outputFolder, label + '.glb'), 'wb') as out:
+                            out.write(data)
+                    instrument.count('bytes_written', len(data))
+    finally:
+        results.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.export', description="Export every object in Maxis mesh files to OBJ and binary glTF.")
+    parser.add_argument('inputs', nargs='+', help="Mesh files, directories (searched recursively for .max files) or glob patterns.")
+    parser.add_argument('-o', '--output-dir', default='.', help="Folder in which to create a folder for each mesh file (default: current folder).")
+    parser.add_argument('-f', '--formats', nargs='+', choices=FORMATS, default=FORMATS, help="Formats to write (default: all).")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: one per CPU).")
+    parser.add_argument('--unscaled', action='store_true', help="Write coordinates in the files' units rather than dividing them by 2^18.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    paths = find_mesh_files(args.inputs)
+    if not paths:
+        parser.error("No mesh files found.")
+
+    with instrument.recording_from_arguments(args):
+        export_files(paths, args.output_dir, args.formats, 1 if args.profile else args.jobs, not args.unscaled)
+    print(f"Exported {len(paths)} mesh files.")
+
+
+if __name__ == '__main__':
+    main()
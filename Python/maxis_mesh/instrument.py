@@ -0,0 +1,266 @@
+# Opt-in instrumentation of parsing, tabulation, export and replacement: stage timers, counters and peak memory use.
+
+# Instrumented code marks its stages with stage() and its work with count() (e.g., count('faces', n)). Both do nothing unless
+# a Recorder is active (see start() and recording()), so uninstrumented runs only pay for a function call per stage. While
+# recording, work on each mesh file is grouped with archive(), giving a trace per file:
+#   * Stages: total seconds and number of calls, keyed by the path of nested stages (e.g., "decode/decode_headers").
+#   * Counters: e.g., bytes_read, bytes_written, objects and faces, from which throughput (per second) is calculated.
+#   * Peak resident set size of the process (sampled at the end of each stage; not available on Windows).
+# The summary (every trace and their totals) is a JSON-compatible dict. If an output folder is given, it's written to
+# summary.json and each file's trace to <name>.json. If cProfile is enabled, each file is also profiled separately, and its
+# profile is written to <name>.prof (view with python -m pstats or snakeviz).
+
+# Command-line tools add --stats <folder> (traces and summary) and --profile <folder> (the same, plus profiles) with
+# add_arguments() and record with recording_from_arguments().
+
+# Work done by worker processes isn't recorded (stages in the main process that wait for it are), so use a single process
+# (e.g., --jobs 1) to see every stage.
+
+# Doesn't require NumPy.
+
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+
+SUMMARY_VERSION = 1
+SUMMARY_FILE_NAME = 'summary.json'
+
+# Counters used to calculate throughput.
+THROUGHPUT_COUNTERS = ['bytes_read', 'bytes_written', 'objects', 'faces']
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if it isn't available."""
+    if resource is None:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return maxRss if sys.platform == 'darwin' else maxRss*1024
+
+
+def _max_or_none(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+class Trace:
+    """Stage timings and counters for one mesh file (or for work outside any file)."""
+
+    def __init__(self, path=None, label=None):
+        self.path = path
+        self.label = label
+        self.stages = {} # Stage path: [seconds, calls]
+        self.counters = {}
+        self.seconds = 0.0
+        self.peak_rss_bytes = None
+
+    def add_stage(self, name, seconds):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+        self.peak_rss_bytes = _max_or_none(self.peak_rss_bytes, peak_rss())
+
+    def add(self, other):
+        for name, (seconds, calls) in other.stages.items():
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+        for name, amount in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        self.seconds += other.seconds
+        self.peak_rss_bytes = _max_or_none(self.peak_rss_bytes, other.peak_rss_bytes)
+
+    def to_dict(self):
+        result = {}
+        if self.path is not None:
+            result['path'] = self.path
+            result['label'] = self.label
+        result['seconds'] = self.seconds
+        result['stages'] = {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.stages.items()}
+        result['counters'] = dict(self.counters)
+        result['throughput'] = {f"{name}_per_second": self.counters[name]/self.seconds
+                                for name in THROUGHPUT_COUNTERS if name in self.counters and self.seconds > 0}
+        result['peak_rss_bytes'] = self.peak_rss_bytes
+        return result
+
+
+class Recorder:
+    """Records stages and counters, grouped into a Trace per mesh file.
+
+    If outputDir is given, the summary and each file's trace (and, with cprofile, its profile) are written there.
+    """
+
+    def __init__(self, outputDir=None, cprofile=False, command=None):
+        self.output_dir = outputDir
+        self.cprofile = cprofile
+        self.command = command if command is not None else sys.argv
+        self.root = Trace()
+        self.archives = []
+        self._trace = self.root
+        self._stagePath = []
+        self._labels = {}
+        self._profiler = None
+        self._archiveStart = None
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._stagePath.append(name)
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._trace.add_stage('/'.join(self._stagePath), time.perf_counter() - begin)
+            self._stagePath.pop()
+
+    def count(self, name, amount=1):
+        self._trace.counters[name] = self._trace.counters.get(name, 0) + amount
+
+    def _unique_label(self, path):
+        # The file name without its extension, made unique with a suffix (as for the folders written by maxis_mesh.export).
+        stem = os.path.splitext(os.path.basename(path))[0]
+        count = self._labels.get(stem.casefold(), 0) + 1
+        self._labels[stem.casefold()] = count
+        return stem if count == 1 else f"{stem}-{count}"
+
+    def begin_archive(self, path):
+        """Start the trace of a mesh file (or another input, such as an object exported from Blender)."""
+        if self._trace is not self.root:
+            raise RuntimeError(f"Can't start the trace of {path}: the trace of {self._trace.path} hasn't ended.")
+        self._trace = Trace(path, self._unique_label(path))
+        self._archiveStart = time.perf_counter()
+        if self.cprofile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def end_archive(self):
+        trace = self._trace
+        if self._profiler is not None:
+            self._profiler.disable()
+        trace.seconds = time.perf_counter() - self._archiveStart
+        trace.peak_rss_bytes = _max_or_none(trace.peak_rss_bytes, peak_rss())
+        self.archives.append(trace)
+        self._trace = self.root
+
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            basePath = os.path.join(self.output_dir, trace.label)
+            with open(basePath + '.json', 'w') as out:
+                json.dump(trace.to_dict(), out, indent=2)
+            if self._profiler is not None:
+                self._profiler.dump_stats(basePath + '.prof')
+        self._profiler = None
+
+    @contextlib.contextmanager
+    def archive(self, path):
+        self.begin_archive(path)
+        try:
+            yield
+        finally:
+            self.end_archive()
+
+    def summary(self):
+        """Totals over every trace (including work outside any mesh file), followed by each mesh file's trace."""
+        total = Trace()
+        total.add(self.root)
+        for trace in self.archives:
+            total.add(trace)
+        total.seconds = time.perf_counter() - self._start
+        total.peak_rss_bytes = _max_or_none(total.peak_rss_bytes, peak_rss())
+
+        summary = {
+            'version': SUMMARY_VERSION,
+            'command': list(self.command),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        summary.update(total.to_dict())
+        summary['archives'] = [trace.to_dict() for trace in self.archives]
+        return summary
+
+    def write_summary(self):
+        """Write the summary to summary.json in the output folder (if any) and return it."""
+        summary = self.summary()
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, SUMMARY_FILE_NAME), 'w') as out:
+                json.dump(summary, out, indent=2)
+        return summary
+
+
+_recorder = None
+_NO_STAGE = contextlib.nullcontext()
+
+
+def start(outputDir=None, cprofile=False, command=None):
+    """Start recording (replacing any active Recorder) and return the new Recorder."""
+    global _recorder
+    _recorder = Recorder(outputDir, cprofile, command)
+    return _recorder
+
+
+def stop():
+    """Stop recording, write the summary (see Recorder.write_summary) and return it (None if nothing was being recorded)."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder.write_summary() if recorder is not None else None
+
+
+@contextlib.contextmanager
+def recording(outputDir=None, cprofile=False, command=None):
+    """Record for the duration of a with block: start() on entry and stop() on exit. Yields the Recorder."""
+    recorder = start(outputDir, cprofile, command)
+    try:
+        yield recorder
+    finally:
+        stop()
+
+
+def active():
+    """The active Recorder, or None."""
+    return _recorder
+
+
+def stage(name):
+    """Context manager timing a stage (does nothing unless recording)."""
+    recorder = _recorder
+    return recorder.stage(name) if recorder is not None else _NO_STAGE
+
+
+def count(name, amount=1):
+    """Add to a counter (does nothing unless recording)."""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, amount)
+
+
+def archive(path):
+    """Context manager grouping the stages and counters within it into the trace of a mesh file (does nothing unless recording)."""
+    recorder = _recorder
+    return recorder.archive(path) if recorder is not None else _NO_STAGE
+
+
+def add_arguments(parser):
+    """Add --stats and --profile options to an argparse parser."""
+    parser.add_argument('--stats', metavar='FOLDER',
+                        help="Write stage timings, counters and peak memory use as JSON to this folder (a trace per mesh file and summary.json).")
+    parser.add_argument('--profile', metavar='FOLDER',
+                        help="Like --stats, but also profile each mesh file with cProfile (<name>.prof). Everything runs in this process.")
+
+
+def recording_from_arguments(args):
+    """Context manager recording as requested by the options added by add_arguments (or doing nothing)."""
+    if args.profile:
+        return recording(args.profile, cprofile=True)
+    if args.stats:
+        return recording(args.stats)
+    return contextlib.nullcontext()
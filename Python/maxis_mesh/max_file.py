@@ -0,0 +1,243 @@
+# Reader for Maxis mesh files (sim3d#.max) used by SimCopter and Streets of SimCity.
+# For a description of the format, see https://github.com/CahootsMalone/maxis-mesh-stuff/blob/master/Info/Maxis-Mesh-Format.md
+
+# The file is memory-mapped rather than read into memory, and objects are located using the addresses in the geometry table
+# rather than by scanning for "OBJX" (which is slow and can match bytes within vertex or UV data).
+# Faces are located using the size field at the start of each face.
+
+import mmap
+import struct
+from collections import namedtuple
+
+from . import instrument
+
+OFFSET_CMAP_ADDRESS = 16
+OFFSET_GEOM_ADDRESS = 24
+
+OFFSET_PALETTE = 61 # Always 61; see "Address of start of colour data" in the CMAP header.
+PALETTE_SIZE = 256
+
+LENGTH_GEOM_HEADER = 24
+LENGTH_GEOM_TABLE_ENTRY = 53 # 17 + 9*4
+LENGTH_DUPLICATE_GEOM_TABLE_ENTRY = 36
+LENGTH_OBJECT_HEADER = 124
+LENGTH_VERTEX = 12
+LENGTH_FACE_HEADER = 21
+
+# The size stored in an object's header is 12 bytes less than the object's actual size. Presumably a bug.
+OBJECT_SIZE_DEFICIT = 12
+
+# Offset of the 12 bytes within the object header that are preserved by mesh-replace (anim count, anim pointer, ID).
+OFFSET_OBJECT_SIGNATURE = 112
+LENGTH_OBJECT_SIGNATURE = 12
+
+# Dividing spatial coordinates (vertices and the bounding radius) by 2^18 roughly converts to metres.
+# See https://github.com/CahootsMalone/maxis-mesh-stuff/blob/master/Info/Maxis-Mesh-Format.md#scale
+RADIUS_SCALE_FACTOR = 2.0**18
+
+STRUCT_DIRC = struct.Struct('<4sII')
+STRUCT_GEOM_HEADER = struct.Struct('<4sIIIII')
+STRUCT_GEOM_TABLE_ENTRY = struct.Struct('<17sIIIIIIIII')
+STRUCT_DUPLICATE_GEOM_TABLE_ENTRY = struct.Struct('<iIIIIIIII')
+STRUCT_OBJECT_HEADER = struct.Struct('<4sIHHIII88sIIi')
+STRUCT_VERTEX = struct.Struct('<iii')
+STRUCT_FACE_HEADER = struct.Struct('<4sIHHHIBBB')
+
+GeomTableEntry = namedtuple('GeomTableEntry', [
+    'name', 'address', 'object_count', 'unknown1', 'rendered_vertex_count',
+    'unknown2', 'unknown3', 'face_count', 'unique_vertex_count', 'unknown4'])
+
+DuplicateGeomTableEntry = namedtuple('DuplicateGeomTableEntry', [
+    'id', 'address', 'unknown1', 'rendered_vertex_count',
+    'unknown2', 'unknown3', 'face_count', 'unique_vertex_count', 'unknown4'])
+
+Face = namedtuple('Face', [
+    'offset', 'size', 'vertex_count', 'flags', 'is_light', 'group',
+    'face_type', 'tex_index', 'tex_file', 'vertex_indices', 'uvs'])
+
+
+class ObjectHeader(namedtuple('ObjectHeader', [
+        'index', 'offset', 'size', 'vertex_count', 'face_count', 'attributes',
+        'radius', 'y_radius', 'name_bytes', 'anim_count', 'anim_pointer', 'id'])):
+    # name_bytes holds the full 88-byte name field (ObjName and TextureFile in the prerelease struct definition).
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return decode_name(self.name_bytes)
+
+    @property
+    def collision_bytes(self):
+        # The four bytes at offset 16 (the radius). See Info/Collision notes.md.
+        return tuple(self.radius.to_bytes(4, byteorder='little'))
+
+    @property
+    def total_size(self):
+        return self.size + OBJECT_SIZE_DEFICIT
+
+    @property
+    def end(self):
+        return self.offset + self.total_size
+
+    @property
+    def vertex_start(self):
+        return self.offset + LENGTH_OBJECT_HEADER
+
+    @property
+    def face_start(self):
+        return self.vertex_start + self.vertex_count*LENGTH_VERTEX
+
+
+def decode_name(nameBytes):
+    # Names are null-terminated. Subsequent bytes within the range allocated for the name may be garbage.
+    return bytes(nameBytes).partition(b'\0')[0].decode('ascii', 'ignore')
+
+
+class MaxFile:
+    """A memory-mapped Maxis mesh file.
+
+    Objects are listed in geometry table order, which is the index used by mesh-extract, mesh-replace and the viewer.
+    Use as a context manager or call close() when finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with instrument.stage('open'):
+            self._file = open(path, 'rb')
+            try:
+                self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception:
+                self._file.close()
+                raise
+
+            try:
+                self._read_headers()
+            except Exception:
+                self.close()
+                raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.data is not None:
+            try:
+                self.data.close()
+            except BufferError:
+                # Arrays (e.g., from maxis_mesh.arrays, or in the traceback of a decoding error) still view the file. The
+                # mapping is released when they're garbage collected.
+                pass
+            self.data = None
+        self._file.close()
+
+    def __len__(self):
+        return self.object_count
+
+    def _read_headers(self):
+        data = self.data
+
+        if len(data) < OFFSET_GEOM_ADDRESS + 4 or data[0:4] != b'DIRC':
+            raise ValueError(f"{self.path} is not a Maxis mesh file (missing DIRC signature).")
+
+        _, self.declared_size, _ = STRUCT_DIRC.unpack_from(data, 0)
+
+        self.cmap_address = struct.unpack_from('<I', data, OFFSET_CMAP_ADDRESS)[0]
+        self.geom_address = struct.unpack_from('<I', data, OFFSET_GEOM_ADDRESS)[0]
+
+        signature, self.geom_size, self.geom_entry_count, self.object_count, self.geom_table_address, self.duplicate_geom_table_address = \
+            STRUCT_GEOM_HEADER.unpack_from(data, self.geom_address)
+
+        if signature != b'GEOM':
+            raise ValueError(f"{self.path}: no GEOM section at offset {self.geom_address}.")
+
+        if self.geom_entry_count != self.object_count + 1:
+            raise ValueError(f"{self.path}: geometry table has {self.geom_entry_count} entries for {self.object_count} objects.")
+
+        self.totals = self._read_geom_table_entry(0)
+
+        self.object_offsets = [
+            struct.unpack_from('<I', data, self.geom_table_address + (i+1)*LENGTH_GEOM_TABLE_ENTRY + 17)[0]
+            for i in range(self.object_count)]
+
+        if self.object_offsets and self.object_offsets[-1] >= len(data):
+            raise ValueError(f"{self.path}: object address {self.object_offsets[-1]} lies outside the file.")
+
+    def _read_geom_table_entry(self, entryIndex):
+        values = STRUCT_GEOM_TABLE_ENTRY.unpack_from(self.data, self.geom_table_address + entryIndex*LENGTH_GEOM_TABLE_ENTRY)
+        return GeomTableEntry(decode_name(values[0]), *values[1:])
+
+    def geom_table_entry(self, index):
+        """Geometry table entry for the object at the given index (the totals entry is self.totals)."""
+        return self._read_geom_table_entry(index + 1)
+
+    def duplicate_geom_table_entry(self, index):
+        return DuplicateGeomTableEntry(*STRUCT_DUPLICATE_GEOM_TABLE_ENTRY.unpack_from(
+            self.data, self.duplicate_geom_table_address + index*LENGTH_DUPLICATE_GEOM_TABLE_ENTRY))
+
+    def palette(self):
+        """The colour map as a list of 256 (r, g, b) tuples."""
+        raw = self.data[OFFSET_PALETTE:OFFSET_PALETTE + 3*PALETTE_SIZE]
+        return [tuple(raw[3*i:3*i+3]) for i in range(PALETTE_SIZE)]
+
+    def object_header(self, index):
+        offset = self.object_offsets[index]
+        values = STRUCT_OBJECT_HEADER.unpack_from(self.data, offset)
+
+        if values[0] != b'OBJX':
+            raise ValueError(f"{self.path}: object {index} at offset {offset} doesn't start with OBJX.")
+
+        return ObjectHeader(index, offset, *values[1:])
+
+    def object_headers(self):
+        for index in range(self.object_count):
+            yield self.object_header(index)
+
+    def object_bytes(self, index):
+        """The raw bytes of an object (as written by mesh-extract and the Blender export script)."""
+        header = self.object_header(index)
+        return self.data[header.offset:header.end]
+
+    def vertices(self, header):
+        """List of (x, y, z) tuples, including the origin vertex."""
+        return list(STRUCT_VERTEX.iter_unpack(self.data[header.vertex_start:header.face_start]))
+
+    def face_headers(self, header):
+        """Yield (offset, size, vertex count, flags, isLight, group, face type, tex/colour, texFile) for each face of an object.
+
+        Only the fixed-size part of each face is decoded.
+        """
+        data = self.data
+        unpack = STRUCT_FACE_HEADER.unpack_from
+        pos = header.face_start
+
+        for _ in range(header.face_count):
+            signature, size, *fields = unpack(data, pos)
+
+            if signature != b'FACE':
+                raise ValueError(f"{self.path}: expected FACE at offset {pos} (object {header.index}).")
+
+            yield (pos, size, *fields)
+            pos += size
+
+    def faces(self, header):
+        """Yield fully decoded Face records (including vertex indices and UVs) for an object."""
+        data = self.data
+
+        for offset, size, vertexCount, flags, isLight, group, faceType, texIndex, texFile in self.face_headers(header):
+            indexStart = offset + LENGTH_FACE_HEADER
+            uvStart = indexStart + 2*vertexCount
+            vertexIndices = struct.unpack_from(f'<{vertexCount}H', data, indexStart)
+            uvValues = struct.unpack_from(f'<{2*vertexCount}i', data, uvStart)
+            uvs = tuple(zip(uvValues[0::2], uvValues[1::2]))
+
+            yield Face(offset, size, vertexCount, flags, isLight, group, faceType, texIndex, texFile, vertexIndices, uvs)
+
+
+def face_size(vertexCount):
+    """Size in bytes of a face with the given number of vertices."""
+    return 4+4+2+2+2+4+3+vertexCount*2+vertexCount*8
@@ -0,0 +1,425 @@
+# Compact in-memory representation of OBJX objects.
+
+# A MaxObject stores its vertices and faces in typed arrays (the array module) rather than as lists of Python objects:
+# vertices, vertex indices and UV coordinates are flat arrays of 32-bit or 16-bit integers, and each face attribute is an
+# array with one element per face (struct-of-arrays). Memory use is therefore close to the object's size in the file.
+# Faces are accessed through MaxFace views, which read and write the object's arrays.
+
+# to_bytes and write produce the exact on-disk layout (see Info/Maxis-Mesh-Format.md): the arrays' buffers are written directly
+# rather than converted element by element, the header's size field is 12 bytes less than the object's size, and the first
+# vertex is the object's origin. Arrays are also usable with NumPy without copying (e.g., np.frombuffer(obj.vertices, '<i4')).
+
+# MaxObject is the package's representation of a single object: MeshArchive returns them, replace_objects accepts them, and the
+# Blender export script and maxis_mesh.optimize build them from NumPy arrays with from_geometry. (maxis_mesh.arrays decodes
+# whole files into NumPy arrays instead; from_mesh_arrays converts one of their objects.)
+
+import struct
+import sys
+from array import array
+
+from .max_file import (STRUCT_OBJECT_HEADER, STRUCT_FACE_HEADER, LENGTH_OBJECT_HEADER, LENGTH_FACE_HEADER, LENGTH_VERTEX,
+                       OBJECT_SIZE_DEFICIT, decode_name, face_size)
+
+# Arrays are in the machine's byte order; the file is little-endian.
+_BYTE_SWAP = sys.byteorder != 'little'
+
+# The 12 bytes at offset 112 of the header (anim count, anim pointer and ID), which mesh-replace copies from the object being replaced.
+STRUCT_SIGNATURE = struct.Struct('<IIi')
+
+# Header fields (everything except the counts) copied by with_geometry.
+_HEADER_FIELDS = ('name_bytes', 'attributes', 'radius', 'y_radius', 'anim_count', 'anim_pointer', 'id', 'index', 'table_name')
+
+
+def _array_from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if _BYTE_SWAP:
+        values.byteswap()
+    return values
+
+
+def _little_endian(values):
+    # Bytes of an array (or array slice) in file byte order, without copying on little-endian machines.
+    if not _BYTE_SWAP:
+        return memoryview(values)
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _typed_array(typecode, values, name, count=None):
+    # An array of the given type from a sequence, a NumPy array of any shape (flattened) or, if count is given, a scalar
+    # repeated count times. Values that don't fit raise ValueError rather than wrapping as they would with NumPy.
+    if count is not None and not hasattr(values, '__len__'):
+        values = [values]*count
+    elif hasattr(values, 'ravel'):
+        values = values.ravel().tolist()
+    try:
+        result = array(typecode, values)
+    except OverflowError as e:
+        raise ValueError(f"A {name} value is out of range ({e}).") from None
+    if count is not None and len(result) != count:
+        raise ValueError(f"Expected {count} {name} values, not {len(result)}.")
+    return result
+
+
+def _face_attribute(name):
+    # A property reading and writing the face's element of the object's array with the given name.
+    def getter(face):
+        return getattr(face.object, name)[face.index]
+
+    def setter(face, value):
+        getattr(face.object, name)[face.index] = value
+
+    return property(getter, setter)
+
+
+class MaxFace:
+    """A face of a MaxObject. Setting an attribute changes the object."""
+
+    __slots__ = ('object', 'index')
+
+    def __init__(self, maxObject, index):
+        self.object = maxObject
+        self.index = index
+
+    flags = _face_attribute('face_flags')
+    is_light = _face_attribute('face_is_light')
+    group = _face_attribute('face_groups')
+    face_type = _face_attribute('face_types')
+    tex_index = _face_attribute('face_tex_indices')
+    tex_file = _face_attribute('face_tex_files')
+
+    @property
+    def vertex_count(self):
+        return self.object.face_vertex_counts[self.index]
+
+    @property
+    def vertex_indices(self):
+        """The face's vertex indices (a copy; indices into the object's vertices, so the origin is 0)."""
+        start, end = self.object._face_vertex_range(self.index)
+        return self.object.vertex_indices[start:end]
+
+    @property
+    def uvs(self):
+        """The face's (u, v) coordinates as a flat copy (u0, v0, u1, v1, ...), multiplied by 65536."""
+        start, end = self.object._face_vertex_range(self.index)
+        return self.object.uvs[2*start:2*end]
+
+    @property
+    def size(self):
+        return face_size(self.vertex_count)
+
+    def __repr__(self):
+        return (f"MaxFace(index={self.index}, face_type={self.face_type}, flags={self.flags}, tex_index={self.tex_index}, "
+                f"tex_file={self.tex_file}, vertex_indices={self.vertex_indices.tolist()})")
+
+
+class MaxObject:
+    """An OBJX object whose vertices and faces are stored in arrays.
+
+    vertices holds x, y, z for each vertex (including the origin, which is always vertex 0). Each face has vertex_count entries
+    in vertex_indices and 2*vertex_count entries in uvs (in face order), and one element in each face_* array.
+    index and table_name are set when the object is read from a mesh file (see from_file).
+    """
+
+    __slots__ = (
+        'name_bytes', # The full 88-byte name field (object name and texture file name)
+        'attributes', 'radius', 'y_radius', 'anim_count', 'anim_pointer', 'id',
+        'vertices', # array('i'), 3 per vertex
+        'face_vertex_counts', 'face_flags', 'face_is_light', # array('H'), one per face
+        'face_groups', # array('I')
+        'face_types', 'face_tex_indices', 'face_tex_files', # array('B')
+        'vertex_indices', # array('H'), all faces' vertex indices
+        'uvs', # array('i'), all faces' UV coordinates (u, v pairs)
+        'index', 'table_name',
+        '_face_starts', # array('I') of offsets into vertex_indices, computed when needed
+    )
+
+    def __init__(self, name='', radius=0, attributes=0, yRadius=0, animCount=0, animPointer=0, id=0):
+        self.name_bytes = (name.encode('ascii') + b'\0').ljust(88, b'\0')
+        if len(self.name_bytes) > 88:
+            raise ValueError(f"Object name {name!r} is too long (maximum 87 characters).")
+
+        self.attributes = attributes
+        self.radius = radius
+        self.y_radius = yRadius
+        self.anim_count = animCount
+        self.anim_pointer = animPointer
+        self.id = id
+
+        self.vertices = array('i', [0, 0, 0]) # The origin.
+        self.face_vertex_counts = array('H')
+        self.face_flags = array('H')
+        self.face_is_light = array('H')
+        self.face_groups = array('I')
+        self.face_types = array('B')
+        self.face_tex_indices = array('B')
+        self.face_tex_files = array('B')
+        self.vertex_indices = array('H')
+        self.uvs = array('i')
+
+        self.index = None
+        self.table_name = None
+        self._face_starts = None
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """Decode the object starting at offset in data (bytes, a memory-mapped file or anything else supporting slicing)."""
+        signature, _, vertexCount, faceCount, attributes, radius, yRadius, nameBytes, animCount, animPointer, id = \
+            STRUCT_OBJECT_HEADER.unpack_from(data, offset)
+
+        if signature != b'OBJX':
+            raise ValueError(f"Object at offset {offset} doesn't start with OBJX.")
+
+        obj = cls.__new__(cls)
+        obj.name_bytes = nameBytes
+        obj.attributes = attributes
+        obj.radius = radius
+        obj.y_radius = yRadius
+        obj.anim_count = animCount
+        obj.anim_pointer = animPointer
+        obj.id = id
+        obj.index = None
+        obj.table_name = None
+        obj._face_starts = None
+
+        pos = offset + LENGTH_OBJECT_HEADER
+        obj.vertices = _array_from_bytes('i', data[pos:pos + vertexCount*LENGTH_VERTEX])
+        pos += vertexCount*LENGTH_VERTEX
+
+        # Face headers are collected as rows and transposed into one array per attribute.
+        unpack = STRUCT_FACE_HEADER.unpack_from
+        headers = []
+        indexChunks = []
+        uvChunks = []
+        for _ in range(faceCount):
+            faceSignature, size, faceVertexCount, *fields = unpack(data, pos)
+            if faceSignature != b'FACE':
+                raise ValueError(f"Expected FACE at offset {pos}.")
+            headers.append((faceVertexCount, *fields))
+            indexStart = pos + LENGTH_FACE_HEADER
+            uvStart = indexStart + 2*faceVertexCount
+            indexChunks.append(data[indexStart:uvStart])
+            uvChunks.append(data[uvStart:uvStart + 8*faceVertexCount])
+            pos += size
+
+        counts, flags, isLight, groups, faceTypes, texIndices, texFiles = zip(*headers) if headers else ((),)*7
+        obj.face_vertex_counts = array('H', counts)
+        obj.face_flags = array('H', flags)
+        obj.face_is_light = array('H', isLight)
+        obj.face_groups = array('I', groups)
+        obj.face_types = array('B', faceTypes)
+        obj.face_tex_indices = array('B', texIndices)
+        obj.face_tex_files = array('B', texFiles)
+        obj.vertex_indices = _array_from_bytes('H', b''.join(indexChunks))
+        obj.uvs = _array_from_bytes('i', b''.join(uvChunks))
+        return obj
+
+    @classmethod
+    def from_geometry(cls, vertices, faceVertexCounts, vertexIndices, uvs, faceTypes, flags, texIndices, texFiles, isLight=0,
+                      group=None, name='', **header):
+        """Build an object from arrays of its geometry (NumPy arrays or sequences).
+
+        vertices: x, y, z of each vertex (flat or (N, 3)), including the origin.
+        faceVertexCounts: number of vertices in each face.
+        vertexIndices: every face's vertex indices, in order (indices into vertices, so the origin is 0).
+        uvs: u, v of each of vertexIndices (flat or (N, 2)), multiplied by 65536.
+        faceTypes, flags, texIndices, texFiles, isLight, group: per-face values (or scalars).
+            If group isn't specified, it's set to the texture/colour index as the Blender export script does.
+        name and header (radius, attributes, yRadius, animCount, animPointer, id) are as for the constructor.
+        Raises ValueError if a value doesn't fit its field.
+        """
+        obj = cls(name, **header)
+        obj.vertices = _typed_array('i', vertices, 'vertex coordinate')
+        obj.face_vertex_counts = _typed_array('H', faceVertexCounts, 'face vertex count')
+        faceCount = len(obj.face_vertex_counts)
+        obj.face_flags = _typed_array('H', flags, 'flags', faceCount)
+        obj.face_is_light = _typed_array('H', isLight, 'isLight', faceCount)
+        obj.face_groups = _typed_array('I', texIndices if group is None else group, 'group', faceCount)
+        obj.face_types = _typed_array('B', faceTypes, 'face type', faceCount)
+        obj.face_tex_indices = _typed_array('B', texIndices, 'texture/colour index', faceCount)
+        obj.face_tex_files = _typed_array('B', texFiles, 'texture file', faceCount)
+        obj.vertex_indices = _typed_array('H', vertexIndices, 'vertex index')
+        obj.uvs = _typed_array('i', uvs, 'UV coordinate')
+
+        if len(obj.vertices) % 3:
+            raise ValueError("The number of vertex coordinates isn't a multiple of 3.")
+        if len(obj.vertex_indices) != sum(obj.face_vertex_counts):
+            raise ValueError(f"Expected {sum(obj.face_vertex_counts)} vertex indices, not {len(obj.vertex_indices)}.")
+        if len(obj.uvs) != 2*len(obj.vertex_indices):
+            raise ValueError(f"Expected {2*len(obj.vertex_indices)} UV coordinates, not {len(obj.uvs)}.")
+        return obj
+
+    @classmethod
+    def from_mesh_arrays(cls, arrays, index):
+        """The object at the given index of a MeshArrays (see maxis_mesh.arrays)."""
+        faceStart, faceEnd = int(arrays.object_face_offsets[index]), int(arrays.object_face_offsets[index + 1])
+        cornerStart, cornerEnd = int(arrays.face_vertex_offsets[faceStart]), int(arrays.face_vertex_offsets[faceEnd])
+        faces = arrays.faces[faceStart:faceEnd]
+        _, _, _, _, attributes, radius, yRadius, nameBytes, animCount, animPointer, id = \
+            STRUCT_OBJECT_HEADER.unpack(arrays.objects[index].tobytes())
+        obj = cls.from_geometry(arrays.object_vertices(index), faces['vertex_count'], arrays.vertex_indices[cornerStart:cornerEnd],
+                                arrays.uvs[cornerStart:cornerEnd], faces['face_type'], faces['flags'], faces['tex_index'],
+                                faces['tex_file'], faces['is_light'], faces['group'], attributes=attributes, radius=radius,
+                                yRadius=yRadius, animCount=animCount, animPointer=animPointer, id=id)
+        obj.name_bytes = nameBytes
+        obj.index = index
+        return obj
+
+    def with_geometry(self, *geometry, **faceValues):
+        """A new object with this object's header (name, radius, ID, etc.) and different geometry (arguments as for from_geometry)."""
+        obj = type(self).from_geometry(*geometry, **faceValues)
+        for field in _HEADER_FIELDS:
+            setattr(obj, field, getattr(self, field))
+        return obj
+
+    @classmethod
+    def from_file(cls, maxFile, index):
+        """Decode the object at the given index of an open MaxFile."""
+        obj = cls.from_bytes(maxFile.data, maxFile.object_offsets[index])
+        obj.index = index
+        obj.table_name = maxFile.geom_table_entry(index).name
+        return obj
+
+    @property
+    def name(self):
+        return decode_name(self.name_bytes)
+
+    @property
+    def collision_bytes(self):
+        # The four bytes at offset 16 (the radius). See Info/Collision notes.md.
+        return tuple(self.radius.to_bytes(4, byteorder='little'))
+
+    @collision_bytes.setter
+    def collision_bytes(self, values):
+        self.radius = int.from_bytes(bytes(values), byteorder='little')
+
+    @property
+    def signature(self):
+        """The 12 bytes at offset 112 (anim count, anim pointer and ID), which mesh-replace keeps from the object being replaced."""
+        return STRUCT_SIGNATURE.pack(self.anim_count, self.anim_pointer, self.id)
+
+    @signature.setter
+    def signature(self, value):
+        self.anim_count, self.anim_pointer, self.id = STRUCT_SIGNATURE.unpack(bytes(value)[0:STRUCT_SIGNATURE.size].ljust(STRUCT_SIGNATURE.size, b'\0'))
+
+    @property
+    def vertex_count(self):
+        """Number of vertices, including the origin."""
+        return len(self.vertices)//3
+
+    @property
+    def face_count(self):
+        return len(self.face_types)
+
+    @property
+    def rendered_vertex_count(self):
+        """Total number of vertices of every face (as stored in the geometry table)."""
+        return len(self.vertex_indices)
+
+    @property
+    def origin(self):
+        return tuple(self.vertices[0:3])
+
+    def vertex(self, index):
+        return tuple(self.vertices[3*index:3*index + 3])
+
+    def _face_vertex_range(self, faceIndex):
+        if self._face_starts is None:
+            starts = array('I', [0])
+            total = 0
+            for count in self.face_vertex_counts:
+                total += count
+                starts.append(total)
+            self._face_starts = starts
+        return self._face_starts[faceIndex], self._face_starts[faceIndex + 1]
+
+    def face(self, index):
+        if index < 0:
+            index += self.face_count
+        if index < 0 or index >= self.face_count:
+            raise IndexError(f"Face index {index} is invalid: the object has {self.face_count} faces.")
+        return MaxFace(self, index)
+
+    @property
+    def faces(self):
+        """A list of MaxFace views, one per face."""
+        return [MaxFace(self, index) for index in range(self.face_count)]
+
+    def add_vertex(self, x, y, z):
+        """Append a vertex and return its index."""
+        self.vertices.extend((x, y, z))
+        return self.vertex_count - 1
+
+    def add_face(self, faceType, flags, vertexIndices, uvs=None, texIndex=0, texFile=0, isLight=0, group=None):
+        """Append a face and return it.
+
+        uvs is a flat sequence of (u, v) coordinates multiplied by 65536 (u0, v0, u1, v1, ...) or None for zeros.
+        If group isn't specified, it's set to the texture/colour index as the Blender export script does.
+        """
+        vertexIndices = list(vertexIndices)
+        uvs = [0]*(2*len(vertexIndices)) if uvs is None else list(uvs)
+        if len(uvs) != 2*len(vertexIndices):
+            raise ValueError(f"Expected {2*len(vertexIndices)} UV coordinates, not {len(uvs)}.")
+        if any(index < 0 or index >= self.vertex_count for index in vertexIndices):
+            raise ValueError(f"Vertex indices must be between 0 and {self.vertex_count - 1}.")
+
+        self.face_vertex_counts.append(len(vertexIndices))
+        self.face_flags.append(flags)
+        self.face_is_light.append(isLight)
+        self.face_groups.append(texIndex if group is None else group)
+        self.face_types.append(faceType)
+        self.face_tex_indices.append(texIndex)
+        self.face_tex_files.append(texFile)
+        self.vertex_indices.extend(vertexIndices)
+        self.uvs.extend(uvs)
+        self._face_starts = None
+        return MaxFace(self, self.face_count - 1)
+
+    @property
+    def total_size(self):
+        """Size of the object in bytes, as written by to_bytes."""
+        return LENGTH_OBJECT_HEADER + LENGTH_VERTEX*self.vertex_count + LENGTH_FACE_HEADER*self.face_count + 10*len(self.vertex_indices)
+
+    @property
+    def decoded_size(self):
+        """Approximate memory used by the object and its arrays, in bytes."""
+        arrays = [self.vertices, self.face_vertex_counts, self.face_flags, self.face_is_light, self.face_groups, self.face_types,
+                  self.face_tex_indices, self.face_tex_files, self.vertex_indices, self.uvs]
+        return sys.getsizeof(self) + sys.getsizeof(self.name_bytes) + sum(sys.getsizeof(values) for values in arrays)
+
+    def _parts(self):
+        # Bytes-like pieces of the on-disk layout, mostly views of the arrays' buffers.
+        parts = [STRUCT_OBJECT_HEADER.pack(
+            b'OBJX', self.total_size - OBJECT_SIZE_DEFICIT, self.vertex_count, self.face_count, self.attributes, self.radius,
+            self.y_radius, self.name_bytes, self.anim_count, self.anim_pointer, self.id)]
+        parts.append(_little_endian(self.vertices))
+
+        indexBytes = _little_endian(self.vertex_indices)
+        uvBytes = _little_endian(self.uvs)
+        if _BYTE_SWAP:
+            indexBytes = memoryview(indexBytes).cast('H')
+            uvBytes = memoryview(uvBytes).cast('i')
+
+        pack = STRUCT_FACE_HEADER.pack
+        start = 0
+        for values in zip(self.face_vertex_counts, self.face_flags, self.face_is_light, self.face_groups, self.face_types,
+                          self.face_tex_indices, self.face_tex_files):
+            count = values[0]
+            parts.append(pack(b'FACE', face_size(count), *values))
+            parts.append(indexBytes[start:start + count])
+            parts.append(uvBytes[2*start:2*(start + count)])
+            start += count
+        return parts
+
+    def to_bytes(self):
+        """The object in the on-disk format (as written by mesh-extract and read by mesh-replace)."""
+        return b''.join(self._parts())
+
+    def write(self, file):
+        """Write the object in the on-disk format to a binary file object."""
+        file.writelines(self._parts())
+
+    def __repr__(self):
+        return f"MaxObject(name={self.name!r}, vertex_count={self.vertex_count}, face_count={self.face_count})"
@@ -0,0 +1,482 @@
+# Optimisation of objects for the games' renderer: fewer vertices and faces with the same appearance.
+# Requires NumPy.
+
+# The Blender export script writes one face per Blender polygon and one vertex per Blender vertex, so objects often contain
+# duplicate vertices, faces with no area, and triangles that could be drawn as part of a larger polygon (e.g., quads that were
+# triangulated). optimize_mesh applies the following steps, each as array operations over every corner, edge or face:
+#   1. Weld: vertices with the same coordinates are merged if they're used by faces with the same attributes (face type, flags,
+#      texture/colour index, texture file, isLight and group), and unused vertices are removed.
+#   2. Drop degenerate faces: repeated consecutive vertices are removed from polygons, then polygons with fewer than three
+#      vertices or (almost) no area are dropped.
+#   3. Merge coplanar faces: pairs of polygons with the same attributes that share an edge are merged if they lie in the same
+#      plane, the result is convex, and (for textured faces) their UV coordinates are the same linear function of position.
+#      This repeats until no more pairs can be merged. Afterwards, vertices lying on a straight edge between their neighbours
+#      are removed from polygons if no other face uses them (so no cracks are introduced).
+# Each polygon with n vertices adds n to the object's "rendered" vertex count in the geometry table, so merging two polygons
+# that share an edge saves two rendered vertices.
+# Lines and points aren't changed; the vertex after each sprite line's first vertex (the bottom of the sprite) is kept in place.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.optimize <.bin file or mesh file> [...] [--output <path>] [--no-weld] [--keep-degenerate] [--no-merge]
+#       [--tolerance <units>]
+# Without --output, only the reductions are reported.
+
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from .arrays import csr_offsets
+from .max_file import MaxFile
+from .model import MaxObject
+from .replace import replace_objects
+
+# Distance (in coordinate units; 2^18 per metre) within which vertices are treated as lying on a plane or line. Vertex
+# coordinates are rounded to whole units when exported, so this allows for rounding.
+DEFAULT_TOLERANCE = 4.0
+
+# Maximum difference (in UV units; 2^16 per texture width) between a textured face's UV coordinates and those of the single
+# linear mapping required for it to be merged with another face or have a vertex removed.
+DEFAULT_UV_TOLERANCE = 2.0
+
+POLYGON_MINIMUM_VERTEX_COUNT = 3
+
+TEXTURED_POLYGON_TYPES = [13, 18]
+FACE_TYPE_LINE_SPRITE = 2
+
+
+class MeshCounts(namedtuple('MeshCounts', ['rendered_vertex_count', 'face_count', 'unique_vertex_count'])):
+    """Counts stored in an object's geometry table entry (see maxis_mesh.replace.count_object)."""
+
+    __slots__ = ()
+
+
+def mesh_counts(mesh):
+    """MeshCounts of a MaxObject."""
+    return MeshCounts(mesh.rendered_vertex_count, mesh.face_count, mesh.vertex_count)
+
+
+class OptimizationReport(namedtuple('OptimizationReport', [
+        'before', # MeshCounts
+        'after',
+        'degenerate_face_count', # Faces dropped because they had fewer than three distinct vertices or no area
+        'merged_face_count', # Faces merged into another face
+        'removed_corner_count', # Vertices removed from polygons because they were on a straight edge
+        ])):
+
+    __slots__ = ()
+
+    def __str__(self):
+        def change(before, after):
+            reduction = f" ({100*(before - after)/before:.1f}% fewer)" if before else ''
+            return f"{before} -> {after}{reduction}"
+
+        return (f"rendered vertices {change(self.before.rendered_vertex_count, self.after.rendered_vertex_count)}, "
+                f"faces {change(self.before.face_count, self.after.face_count)}, "
+                f"vertices {change(self.before.unique_vertex_count, self.after.unique_vertex_count)}; "
+                f"{self.degenerate_face_count} degenerate faces dropped, {self.merged_face_count} faces merged, "
+                f"{self.removed_corner_count} collinear vertices removed")
+
+
+def _ranges(starts, counts):
+    # Concatenation of arange(start, start + count) for each start and count.
+    offsets = csr_offsets(counts)
+    return np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1] - starts, counts)
+
+
+def _neighbour_corners(offsets, counts):
+    # Index of the next and previous corner of each corner's face.
+    cornerCount = int(offsets[-1])
+    hasCorners = counts > 0
+    following = np.arange(1, cornerCount + 1, dtype=np.int64)
+    following[offsets[1:][hasCorners] - 1] = offsets[:-1][hasCorners]
+    preceding = np.arange(-1, cornerCount - 1, dtype=np.int64)
+    preceding[offsets[:-1][hasCorners]] = offsets[1:][hasCorners] - 1
+    return following, preceding
+
+
+def _face_normals(points, offsets, counts, faceOf, following):
+    # Unit normal and twice the area of each face, from the positions of its corners (Newell's method). The normal points
+    # towards the side from which the corners appear anticlockwise in a right-handed coordinate system.
+    first = offsets[:-1][faceOf]
+    relative = points - points[first]
+    cross = np.cross(relative, relative[following])
+    faceCount = len(counts)
+    sums = np.column_stack([np.bincount(faceOf, cross[:, axis], minlength=faceCount) for axis in range(3)])
+    doubleAreas = np.linalg.norm(sums, axis=1)
+    normals = np.divide(sums, doubleAreas[:, None], out=np.zeros(sums.shape), where=doubleAreas[:, None] > 0)
+    return normals, doubleAreas
+
+
+def _run_maxima(values, counts):
+    # Maximum of each run of values (every count must be at least one).
+    return np.maximum.reduceat(values, csr_offsets(counts)[:-1]) if len(counts) else values[:0]
+
+
+def _affine_uv_residuals(points, uvs, normals, counts):
+    # Largest difference between each run's UV coordinates and the closest linear function of position within its plane.
+    # points, uvs: (M, 2|3) concatenated runs; normals: one per run.
+    runOf = np.repeat(np.arange(len(counts)), counts)
+    offsets = csr_offsets(counts)
+
+    # Coordinates within the plane, relative to the run's first point and scaled to about one for numerical stability.
+    normal = normals[runOf]
+    axis = np.where(np.abs(normal[:, [0]]) < 0.9, np.array([1.0, 0, 0]), np.array([0, 1.0, 0]))
+    u = np.cross(normal, axis)
+    u /= np.linalg.norm(u, axis=1)[:, None]
+    v = np.cross(normal, u)
+    relative = points - points[offsets[:-1]][runOf]
+    planar = np.column_stack([np.einsum('ij,ij->i', relative, u), np.einsum('ij,ij->i', relative, v)])
+    scale = np.maximum(_run_maxima(np.abs(planar).max(axis=1), counts), 1.0)
+    planar /= scale[runOf, None]
+
+    # Least squares fit of uv = [s, t, 1] @ coefficients for each run, solving the normal equations.
+    design = np.column_stack([planar, np.ones(len(planar))])
+    products = design[:, :, None]*design[:, None, :]
+    gram = np.stack([np.add.reduceat(products[:, i, j], offsets[:-1]) for i in range(3) for j in range(3)], axis=1).reshape(-1, 3, 3)
+    moments = np.stack([np.add.reduceat(design[:, i, None]*uvs, offsets[:-1]) for i in range(3)], axis=1)
+    coefficients = np.linalg.solve(gram + np.eye(3)*1e-12, moments)
+    fitted = np.einsum('ij,ijk->ik', design, coefficients[runOf])
+    return _run_maxima(np.abs(fitted - uvs).max(axis=1), counts)
+
+
+def _weld(vertices, vertexIndices, faceOf, attributeIds, isPolygonCorner):
+    # Replace each polygon corner's vertex with the lowest-index vertex at the same position used by faces with the same attributes.
+    corners = np.flatnonzero(isPolygonCorner)
+    used = vertexIndices[corners]
+    keys = np.column_stack([vertices[used], attributeIds[faceOf[corners]]])
+    order = np.lexsort((used, keys[:, 3], keys[:, 2], keys[:, 1], keys[:, 0]))
+    sortedKeys = keys[order]
+    isRunStart = np.ones(len(order), dtype=bool)
+    isRunStart[1:] = (sortedKeys[1:] != sortedKeys[:-1]).any(axis=1)
+    runStarts = np.maximum.accumulate(np.where(isRunStart, np.arange(len(order)), 0))
+
+    welded = vertexIndices.copy()
+    welded[corners[order]] = used[order][runStarts]
+    return welded
+
+
+def _drop_degenerate(points, counts, tolerance):
+    # (corner mask, face mask) of what remains after removing repeated consecutive vertices from polygons and then dropping
+    # polygons with fewer than three corners or an area less than tolerance times their perimeter. points are the corner positions.
+    offsets = csr_offsets(counts)
+    faceOf = np.repeat(np.arange(len(counts)), counts)
+    following, preceding = _neighbour_corners(offsets, counts)
+    isPolygonCorner = (counts >= POLYGON_MINIMUM_VERTEX_COUNT)[faceOf]
+
+    keepCorners = ~isPolygonCorner | (points != points[preceding]).any(axis=1)
+    # A polygon whose corners are all the same vertex loses them all; it's dropped below.
+    remaining = np.bincount(faceOf, keepCorners, minlength=len(counts)).astype(np.int64)
+
+    # Normals and perimeters of the remaining corners.
+    keptCounts = remaining
+    keptOffsets = csr_offsets(keptCounts)
+    keptPoints = points[keepCorners]
+    keptFaceOf = np.repeat(np.arange(len(counts)), keptCounts)
+    keptFollowing, _ = _neighbour_corners(keptOffsets, keptCounts)
+    _, doubleAreas = _face_normals(keptPoints, keptOffsets, keptCounts, keptFaceOf, keptFollowing)
+    perimeters = np.bincount(keptFaceOf, np.linalg.norm(keptPoints[keptFollowing] - keptPoints, axis=1), minlength=len(counts))
+
+    isPolygon = counts >= POLYGON_MINIMUM_VERTEX_COUNT
+    isDegenerate = isPolygon & ((remaining < POLYGON_MINIMUM_VERTEX_COUNT) | (doubleAreas <= 2*tolerance*perimeters))
+    return keepCorners & ~isDegenerate[faceOf], ~isDegenerate
+
+
+def _merge_pairs(positions, vertexIndices, uvs, counts, attributeIds, isTexturedFace, tolerance, uvTolerance):
+    # Find pairs of faces to merge (each face in at most one pair). Returns (first faces, second faces, merged corner lists as
+    # CSR (counts, corner indices)), where the merged face replaces the first face and the second face is removed.
+    offsets = csr_offsets(counts)
+    faceOf = np.repeat(np.arange(len(counts)), counts)
+    following, _ = _neighbour_corners(offsets, counts)
+    points = positions[vertexIndices].astype(np.float64)
+    normals, _ = _face_normals(points, offsets, counts, faceOf, following)
+    empty = np.zeros(0, dtype=np.int64)
+
+    # Edges used by exactly two polygons.
+    corners = np.flatnonzero((counts >= POLYGON_MINIMUM_VERTEX_COUNT)[faceOf])
+    start = vertexIndices[corners].astype(np.int64)
+    end = vertexIndices[following[corners]].astype(np.int64)
+    keys = np.minimum(start, end)*len(positions) + np.maximum(start, end)
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    isRunStart = np.ones(len(order), dtype=bool)
+    isRunStart[1:] = sortedKeys[1:] != sortedKeys[:-1]
+    runStarts = np.flatnonzero(isRunStart)
+    runLengths = np.diff(np.append(runStarts, len(order)))
+    pairStarts = runStarts[runLengths == 2]
+    cornerA = corners[order[pairStarts]]
+    cornerB = corners[order[pairStarts + 1]]
+
+    # The first face is the one that comes first, so merged faces stay in the same order.
+    swap = faceOf[cornerA] > faceOf[cornerB]
+    cornerA, cornerB = np.where(swap, cornerB, cornerA), np.where(swap, cornerA, cornerB)
+    faceA = faceOf[cornerA]
+    faceB = faceOf[cornerB]
+
+    # The edge must run in opposite directions (consistent winding) between faces with the same attributes facing the same way.
+    isCandidate = ((faceA != faceB) & (vertexIndices[cornerA] == vertexIndices[following[cornerB]])
+                   & (vertexIndices[following[cornerA]] == vertexIndices[cornerB])
+                   & (attributeIds[faceA] == attributeIds[faceB])
+                   & (np.einsum('ij,ij->i', normals[faceA], normals[faceB]) > 0))
+    # Faces sharing more than one edge can't be merged into a simple polygon.
+    pairKeys = faceA*len(counts) + faceB
+    uniquePairs, pairCounts = np.unique(pairKeys[isCandidate], return_counts=True)
+    isCandidate &= np.isin(pairKeys, uniquePairs[pairCounts == 1])
+    cornerA, cornerB, faceA, faceB = cornerA[isCandidate], cornerB[isCandidate], faceA[isCandidate], faceB[isCandidate]
+    if not len(faceA):
+        return empty, empty, empty, empty
+
+    # Merged corners: face A's corners starting after the shared edge (so ending with the edge's first vertex), then face B's
+    # corners excluding the shared edge's two vertices.
+    countA = counts[faceA]
+    countB = counts[faceB]
+    mergedCounts = countA + countB - 2
+    candidateOf = np.repeat(np.arange(len(faceA)), mergedCounts)
+    position = _ranges(np.zeros(len(faceA), dtype=np.int64), mergedCounts)
+    inA = position < countA[candidateOf]
+    startA = cornerA - offsets[faceA] + 1
+    startB = cornerB - offsets[faceB] + 2
+    merged = np.where(inA,
+                      offsets[faceA][candidateOf] + (startA[candidateOf] + position) % countA[candidateOf],
+                      offsets[faceB][candidateOf] + (startB[candidateOf] + position - countA[candidateOf]) % countB[candidateOf])
+
+    mergedOffsets = csr_offsets(mergedCounts)
+    mergedFollowing, mergedPreceding = _neighbour_corners(mergedOffsets, mergedCounts)
+    mergedPoints = points[merged]
+    planeNormals = normals[faceA]
+    normal = planeNormals[candidateOf]
+
+    # Every corner must lie in face A's plane.
+    distances = np.abs(np.einsum('ij,ij->i', mergedPoints - points[offsets[faceA]][candidateOf], normal))
+    isValid = _run_maxima(distances, mergedCounts) <= tolerance
+
+    # The merged face must be convex: each corner turns the same way as the face's winding (allowing straight corners).
+    incoming = mergedPoints - mergedPoints[mergedPreceding]
+    outgoing = mergedPoints[mergedFollowing] - mergedPoints
+    turns = np.einsum('ij,ij->i', np.cross(incoming, outgoing), normal)/np.maximum(np.linalg.norm(incoming, axis=1), 1.0)
+    isValid &= _run_maxima(-turns, mergedCounts) <= tolerance
+
+    # No vertex may appear twice (as it would if the faces also touch at another vertex).
+    mergedVertices = vertexIndices[merged]
+    byVertex = np.lexsort((mergedVertices, candidateOf))
+    isRepeated = (mergedVertices[byVertex][1:] == mergedVertices[byVertex][:-1]) & (candidateOf[byVertex][1:] == candidateOf[byVertex][:-1])
+    isValid &= np.bincount(candidateOf[byVertex][1:][isRepeated], minlength=len(faceA)) == 0
+
+    # Textured faces must use the same linear mapping from position to UV coordinates.
+    isTextured = isValid & isTexturedFace[faceA]
+    if isTextured.any():
+        runs = np.flatnonzero(isTextured)
+        runCorners = _ranges(mergedOffsets[runs], mergedCounts[runs])
+        residuals = _affine_uv_residuals(mergedPoints[runCorners], uvs[merged[runCorners]].astype(np.float64), planeNormals[runs], mergedCounts[runs])
+        isValid[runs[residuals > uvTolerance]] = False
+
+    # Each face can only be merged once per round. Candidates are accepted greedily, longest shared edge first (so triangulated
+    # quads are merged along their diagonals): each pass accepts the candidates that come first for both their faces, then drops
+    # the candidates of faces that were merged.
+    valid = np.flatnonzero(isValid)
+    edgeLengths = np.linalg.norm(points[following[cornerA]] - points[cornerA], axis=1)
+    ranks = np.empty(len(faceA), dtype=np.int64)
+    ranks[valid[np.lexsort((valid, -edgeLengths[valid]))]] = np.arange(len(valid))
+    acceptedRuns = []
+    while len(valid):
+        firstRank = np.full(len(counts), len(faceA), dtype=np.int64)
+        np.minimum.at(firstRank, faceA[valid], ranks[valid])
+        np.minimum.at(firstRank, faceB[valid], ranks[valid])
+        chosen = valid[(firstRank[faceA[valid]] == ranks[valid]) & (firstRank[faceB[valid]] == ranks[valid])]
+        acceptedRuns.append(chosen)
+        isMerged = np.zeros(len(counts), dtype=bool)
+        isMerged[faceA[chosen]] = True
+        isMerged[faceB[chosen]] = True
+        valid = valid[~isMerged[faceA[valid]] & ~isMerged[faceB[valid]]]
+    accepted = np.sort(np.concatenate(acceptedRuns)) if acceptedRuns else empty
+
+    return faceA[accepted], faceB[accepted], mergedCounts[accepted], merged[_ranges(mergedOffsets[accepted], mergedCounts[accepted])]
+
+
+def _collinear_corners(positions, vertexIndices, uvs, counts, isTexturedFace, tolerance, uvTolerance):
+    # Mask of polygon corners that lie on the straight line between their neighbours and whose vertex no other corner uses.
+    offsets = csr_offsets(counts)
+    faceOf = np.repeat(np.arange(len(counts)), counts)
+    following, preceding = _neighbour_corners(offsets, counts)
+    points = positions[vertexIndices].astype(np.float64)
+
+    edge = points[following] - points[preceding]
+    lengthSquared = np.maximum(np.einsum('ij,ij->i', edge, edge), 1.0)
+    offset = points - points[preceding]
+    along = np.einsum('ij,ij->i', offset, edge)/lengthSquared
+    distances = np.linalg.norm(np.cross(offset, edge), axis=1)/np.sqrt(lengthSquared)
+
+    useCounts = np.bincount(vertexIndices, minlength=len(positions))
+    isRemovable = ((counts > POLYGON_MINIMUM_VERTEX_COUNT)[faceOf] & (useCounts[vertexIndices] == 1)
+                   & (distances <= tolerance) & (along > 0) & (along < 1))
+
+    # Textured faces: the UV coordinates must be interpolated along the edge too.
+    uv = uvs.astype(np.float64)
+    interpolated = uv[preceding] + along[:, None]*(uv[following] - uv[preceding])
+    isRemovable &= ~isTexturedFace[faceOf] | (np.abs(interpolated - uv).max(axis=1) <= uvTolerance)
+
+    # Keep at least three corners of every face.
+    remaining = counts - np.bincount(faceOf, isRemovable, minlength=len(counts)).astype(np.int64)
+    isRemovable &= (remaining >= POLYGON_MINIMUM_VERTEX_COUNT)[faceOf]
+    return isRemovable
+
+
+def optimize_mesh(mesh, weld=True, dropDegenerate=True, mergeCoplanar=True, tolerance=DEFAULT_TOLERANCE, uvTolerance=DEFAULT_UV_TOLERANCE):
+    """Reduce the vertices and faces of a MaxObject without changing its appearance.
+
+    Returns (MaxObject, OptimizationReport); the new object has the same header (name, radius, ID, etc.).
+    """
+    before = mesh_counts(mesh)
+
+    # The object's arrays are read without copying (see maxis_mesh.model).
+    vertices = np.frombuffer(mesh.vertices, dtype=np.intc).astype(np.int64).reshape(-1, 3)
+    counts = np.frombuffer(mesh.face_vertex_counts, dtype=np.ushort).astype(np.int64)
+    vertexIndices = np.frombuffer(mesh.vertex_indices, dtype=np.ushort).astype(np.int64)
+    uvs = np.frombuffer(mesh.uvs, dtype=np.intc).astype(np.int64).reshape(-1, 2)
+    faceCount = len(counts)
+
+    faceValues = {
+        'faceTypes': np.frombuffer(mesh.face_types, dtype=np.ubyte),
+        'flags': np.frombuffer(mesh.face_flags, dtype=np.ushort),
+        'texIndices': np.frombuffer(mesh.face_tex_indices, dtype=np.ubyte),
+        'texFiles': np.frombuffer(mesh.face_tex_files, dtype=np.ubyte),
+        'isLight': np.frombuffer(mesh.face_is_light, dtype=np.ushort),
+        'group': np.frombuffer(mesh.face_groups, dtype=np.uintc),
+    }
+    attributes = np.column_stack([values.astype(np.int64) for values in faceValues.values()]).reshape(faceCount, len(faceValues))
+    if faceCount:
+        _, attributeIds = np.unique(attributes, axis=0, return_inverse=True)
+        attributeIds = attributeIds.reshape(-1)
+    else:
+        attributeIds = np.zeros(0, dtype=np.int64)
+    isTexturedFace = np.isin(attributes[:, 0], TEXTURED_POLYGON_TYPES)
+
+    # The vertex after each sprite line's first vertex must stay immediately after it.
+    faceStarts = csr_offsets(counts)[:-1]
+    isSprite = (attributes[:, 0] == FACE_TYPE_LINE_SPRITE) & (counts > 0)
+    spriteBottoms = vertexIndices[faceStarts[isSprite]] + 1
+
+    faces = np.arange(faceCount) # Index in the original faces of each remaining face
+
+    if weld:
+        faceOf = np.repeat(np.arange(faceCount), counts)
+        vertexIndices = _weld(vertices, vertexIndices, faceOf, attributeIds, (counts >= POLYGON_MINIMUM_VERTEX_COUNT)[faceOf])
+
+    degenerateCount = 0
+    if dropDegenerate:
+        keepCorners, keepFaces = _drop_degenerate(vertices[vertexIndices].astype(np.float64), counts, tolerance)
+        degenerateCount = int((~keepFaces).sum())
+        faceOf = np.repeat(np.arange(len(counts)), counts)
+        counts = np.bincount(faceOf[keepCorners], minlength=len(counts)).astype(np.int64)[keepFaces]
+        vertexIndices = vertexIndices[keepCorners]
+        uvs = uvs[keepCorners]
+        faces = faces[keepFaces]
+
+    mergedCount = 0
+    removedCornerCount = 0
+    if mergeCoplanar:
+        while True:
+            firstFaces, secondFaces, mergedCounts, mergedCorners = _merge_pairs(
+                vertices, vertexIndices, uvs, counts, attributeIds[faces], isTexturedFace[faces], tolerance, uvTolerance)
+            if not len(firstFaces):
+                break
+            mergedCount += len(firstFaces)
+
+            # Corners of the remaining faces, taken from either the existing corners or the merged corner lists (appended to them).
+            offsets = csr_offsets(counts)
+            sourceStarts = offsets[:-1].copy()
+            sourceCounts = counts.copy()
+            sourceStarts[firstFaces] = offsets[-1] + csr_offsets(mergedCounts)[:-1]
+            sourceCounts[firstFaces] = mergedCounts
+            keepFaces = np.ones(len(counts), dtype=bool)
+            keepFaces[secondFaces] = False
+
+            sources = np.concatenate([np.arange(offsets[-1], dtype=np.int64), mergedCorners])[_ranges(sourceStarts[keepFaces], sourceCounts[keepFaces])]
+            vertexIndices = vertexIndices[sources]
+            uvs = uvs[sources]
+            counts = sourceCounts[keepFaces]
+            faces = faces[keepFaces]
+
+        isRemovable = _collinear_corners(vertices, vertexIndices, uvs, counts, isTexturedFace[faces], tolerance, uvTolerance)
+        removedCornerCount = int(isRemovable.sum())
+        faceOf = np.repeat(np.arange(len(counts)), counts)
+        counts = counts - np.bincount(faceOf, isRemovable, minlength=len(counts)).astype(np.int64)
+        vertexIndices = vertexIndices[~isRemovable]
+        uvs = uvs[~isRemovable]
+
+    if weld:
+        # Remove unused vertices (keeping the origin and the bottoms of sprites), preserving the order of the others.
+        isUsed = np.zeros(len(vertices), dtype=bool)
+        isUsed[vertexIndices] = True
+        isUsed[spriteBottoms[spriteBottoms < len(vertices)]] = True
+        if len(vertices):
+            isUsed[0] = True
+        newIndices = np.cumsum(isUsed) - 1
+        vertices = vertices[isUsed]
+        vertexIndices = newIndices[vertexIndices]
+
+    optimized = mesh.with_geometry(vertices, counts, vertexIndices, uvs, **{name: values[faces] for name, values in faceValues.items()})
+    return optimized, OptimizationReport(before, mesh_counts(optimized), degenerateCount, mergedCount, removedCornerCount)
+
+
+def count_totals(maxFile):
+    """MeshCounts of the totals in the first entry of an open MaxFile's geometry table."""
+    totals = maxFile.totals
+    return MeshCounts(totals.rendered_vertex_count, totals.face_count, totals.unique_vertex_count)
+
+
+def optimize_object_bytes(data, **options):
+    """Optimise an object (e.g., the contents of a .bin file). Returns (bytes, OptimizationReport).
+
+    The object header is preserved apart from its size and counts. options are passed to optimize_mesh.
+    """
+    optimized, report = optimize_mesh(MaxObject.from_bytes(data), **options)
+    return optimized.to_bytes(), report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.optimize', description="Reduce the vertices and faces of Maxis mesh objects.")
+    parser.add_argument('inputs', nargs='+', help="Object files (.bin) or mesh files (sim3d#.max).")
+    parser.add_argument('-o', '--output', help="Path of the optimised object or mesh file (only with a single input). Default: only report the reductions.")
+    parser.add_argument('--no-weld', action='store_true', help="Don't merge duplicate vertices or remove unused ones.")
+    parser.add_argument('--keep-degenerate', action='store_true', help="Don't drop faces with no area.")
+    parser.add_argument('--no-merge', action='store_true', help="Don't merge coplanar faces.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f"Distance (in coordinate units) within which vertices are treated as lying on a plane or line (default: {DEFAULT_TOLERANCE}).")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.inputs) > 1:
+        parser.error("--output can only be used with a single input.")
+
+    options = {'weld': not args.no_weld, 'dropDegenerate': not args.keep_degenerate, 'mergeCoplanar': not args.no_merge, 'tolerance': args.tolerance}
+
+    for path in args.inputs:
+        with open(path, 'rb') as file:
+            isMeshFile = file.read(4) == b'DIRC'
+
+        if not isMeshFile:
+            with open(path, 'rb') as file:
+                objectBytes, report = optimize_object_bytes(file.read(), **options)
+            print(f"{path}: {report}")
+            if args.output:
+                with open(args.output, 'wb') as out:
+                    out.write(objectBytes)
+            continue
+
+        # For mesh files, the totals in the geometry table are compared with those after replacing every object that changed.
+        replacements = {}
+        with MaxFile(path) as maxFile:
+            before = np.array(count_totals(maxFile), dtype=np.int64)
+            after = before.copy()
+            for index in range(maxFile.object_count):
+                objectBytes, report = optimize_object_bytes(maxFile.object_bytes(index), **options)
+                if report.after != report.before:
+                    replacements[index] = bytes(objectBytes)
+                    after += np.subtract(report.after, report.before)
+
+        reductions = ', '.join(f"{label} {b} -> {a}" for label, b, a in zip(('rendered vertices', 'faces', 'vertices'), before.tolist(), after.tolist()))
+        print(f"{path}: {len(replacements)} of {maxFile.object_count} objects reduced; geometry table totals: {reductions}")
+        if args.output:
+            replace_objects(path, replacements, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Colour map (palette) loading and colour-to-index lookup.
+# Requires NumPy.
+
+# Palettes can be loaded from a GIMP palette (.gpl) exported by the Maxis Texture Tool or directly from the CMAP section of a
+# mesh file (only the colour map in sim3d1.max is used by the games, but all three contain the same one).
+
+# Lookups are vectorised:
+#   * Exact matches use a sorted table of the palette's colours (encoded as 0xRRGGBB) and return the first matching index at or
+#     after a given start index, like palette[start:].index(colour).
+#   * Nearest matches compare each distinct colour with every entry in the range of the palette that lookups are restricted to,
+#     so the result is always the nearest entry (the first one if several are equally near).
+
+import os
+
+import numpy as np
+
+from .max_file import MaxFile, PALETTE_SIZE
+
+# Ranges are [start, end).
+PALETTE_RANGE_ALL = (0, PALETTE_SIZE)
+
+# The last 10 colours aren't part of a gradient and don't get brighter/darker depending on orientation.
+PALETTE_RANGE_UNSHADED = (246, PALETTE_SIZE)
+
+# SimCopter remaps this range to a grey gradient near the end of the palette for light beams (e.g., car headlights).
+PALETTE_RANGE_LIGHTS = (43, 56)
+
+# Colours compared with the palette at a time by nearest-colour lookups, which bounds the size of the distance matrix.
+NEAREST_CHUNK_COLORS = 4096
+
+
+def color_keys(colors):
+    """Encode an (N, 3) array of RGB values (0-255) as 0xRRGGBB integers."""
+    colors = np.asarray(colors, dtype=np.int64).reshape(-1, 3)
+    return (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+
+class Palette:
+    """A 256-colour palette with vectorised exact and nearest-colour lookup."""
+
+    def __init__(self, colors):
+        self.colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        self._keys = color_keys(self.colors)
+        self._exactTables = {}
+
+    def __len__(self):
+        return len(self.colors)
+
+    def _exact_table(self, start):
+        if start not in self._exactTables:
+            # np.unique returns the index of the first occurrence of each value.
+            self._exactTables[start] = np.unique(self._keys[start:], return_index=True)
+        return self._exactTables[start]
+
+    def exact_indices(self, colors, start=0):
+        """Index of the first palette entry at or after start exactly matching each colour, or -1 if there's none."""
+        keys = color_keys(colors)
+        uniqueKeys, firstIndices = self._exact_table(start)
+        if len(uniqueKeys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(uniqueKeys, keys), len(uniqueKeys) - 1)
+        return np.where(uniqueKeys[positions] == keys, start + firstIndices[positions], -1)
+
+    def nearest_indices(self, colors, paletteRange=PALETTE_RANGE_ALL):
+        """Index of the nearest palette entry within paletteRange to each colour (the first one if several are equally near)."""
+        start, end = paletteRange
+        entries = self.colors[start:end].astype(np.float32)
+        if len(entries) == 0:
+            raise ValueError(f"Palette range [{start}, {end}) is empty.")
+
+        # Faces usually share a few colours, so each distinct colour is only compared once.
+        uniqueKeys, inverse = np.unique(color_keys(colors), return_inverse=True)
+        uniqueColors = np.column_stack([uniqueKeys >> 16, (uniqueKeys >> 8) & 0xFF, uniqueKeys & 0xFF]).astype(np.float32)
+
+        # Squared distance |c - e|^2 = |c|^2 - 2c.e + |e|^2; |c|^2 doesn't affect which entry is nearest.
+        # All values are small integers, so float32 arithmetic is exact.
+        entryNorms = (entries**2).sum(axis=1)
+        nearest = np.empty(len(uniqueKeys), dtype=np.int64)
+        for first in range(0, len(uniqueKeys), NEAREST_CHUNK_COLORS):
+            chunk = uniqueColors[first:first + NEAREST_CHUNK_COLORS]
+            distances = entryNorms[None, :] - 2*(chunk @ entries.T)
+            nearest[first:first + len(chunk)] = start + np.argmin(distances, axis=1)
+        return nearest[inverse.reshape(-1)]
+
+    def lookup(self, colors, start=0, paletteRange=None):
+        """Exact match at or after start if there is one, otherwise the nearest entry within paletteRange.
+
+        If paletteRange isn't specified, it's [start, 256).
+        Returns (indices, isExact).
+        """
+        if paletteRange is None:
+            paletteRange = (start, PALETTE_SIZE)
+
+        indices = self.exact_indices(colors, start)
+        isExact = indices >= 0
+        if not isExact.all():
+            colors = np.asarray(colors, dtype=np.int64).reshape(-1, 3)
+            indices[~isExact] = self.nearest_indices(colors[~isExact], paletteRange)
+        return indices, isExact
+
+
+def read_gpl(path):
+    """Colours from a GIMP palette file, as written by the Maxis Texture Tool."""
+    colors = []
+    with open(path, 'r') as file:
+        for line in file.readlines()[1:]:
+            fields = line.split()
+            # Skip the header lines ("Name:", "Columns:") and comments.
+            if len(fields) < 3 or not all(f.isdigit() for f in fields[0:3]):
+                continue
+            colors.append([int(c) for c in fields[0:3]])
+    return colors
+
+
+def read_cmap(path):
+    """Colours from the colour map of a mesh file."""
+    with MaxFile(path) as maxFile:
+        return maxFile.palette()
+
+
+# Palettes (and the lookup tables built for them) are kept for the lifetime of the process.
+# In Blender, this means they're reused by every export in a session.
+_loadedPalettes = {}
+
+
+def load_palette(path):
+    """Load a palette from a .gpl file or a mesh file, reusing the previously loaded one if the file hasn't changed."""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    cached = _loadedPalettes.get(key)
+    if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+
+    if path.lower().endswith('.gpl'):
+        palette = Palette(read_gpl(path))
+    else:
+        palette = Palette(read_cmap(path))
+
+    _loadedPalettes[key] = ((stat.st_size, stat.st_mtime_ns), palette)
+    return palette
@@ -0,0 +1,275 @@
+# Attribute and spatial queries over every object and face in a set of Maxis mesh files.
+# Requires NumPy.
+
+# The query index answers questions like "which objects use texture 78 in atlas 2?", "which faces are lights?" or "which
+# objects have a bounding radius over N?" without reparsing the mesh files or tabulating them to CSV:
+#   * Inverted indexes map each value of the face type, texture/colour index, texture file, flags and isLight fields to the faces
+#     with that value. Each is a list of face IDs sorted by value plus CSR offsets by value, so finding the faces with a given
+#     value is a single slice.
+#   * Object bounding radii are sorted for range queries, and each object's axis-aligned bounding box (AABB, excluding the origin
+#     vertex) is stored for box queries.
+# The index is saved (as a .mmqx file, in NumPy .npz format) next to the mesh files' index cache files. It records the SHA-1
+# digest of each mesh file (from maxis_mesh.cache), so it's rebuilt only if one of the mesh files changes.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.query <directory, file or glob pattern> [...] [--face-type <value> [...]] [--tex-index <value> [...]]
+#       [--tex-file <value> [...]] [--flags <value> [...]] [--is-light <value> [...]] [--min-radius <value>] [--max-radius <value>]
+#       [--box <x0> <y0> <z0> <x1> <y1> <z1>] [--faces] [--cache-dir <path>]
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+from .arrays import csr_offsets, decode_file
+from .batch import decode_all, find_mesh_files
+from .cache import load_index
+
+QUERY_INDEX_EXTENSION = '.mmqx'
+QUERY_INDEX_VERSION = 1
+
+# Face fields with inverted indexes, and the number of possible values of each.
+FACE_KEYS = {
+    'face_type': 256,
+    'tex_index': 256,
+    'tex_file': 256,
+    'flags': 65536,
+    'is_light': 65536,
+}
+
+FACE_REF_DTYPE = np.dtype([('file', '<i4'), ('object', '<i4'), ('face', '<i4')])
+OBJECT_REF_DTYPE = np.dtype([('file', '<i4'), ('object', '<i4')])
+
+
+def decode_query_data(path):
+    """Per-face and per-object columns of one mesh file, for building a query index."""
+    arrays = decode_file(path)
+
+    objectFaceCounts = np.diff(arrays.object_face_offsets)
+    faceObjects = np.repeat(np.arange(arrays.object_count, dtype=np.int32), objectFaceCounts)
+    faceIndices = (np.arange(len(arrays.faces)) - np.repeat(arrays.object_face_offsets[:-1], objectFaceCounts)).astype(np.int32)
+
+    # Bounding boxes exclude each object's first vertex (its origin) unless it's the only one.
+    vertexCounts = np.diff(arrays.object_vertex_offsets)
+    isOrigin = np.zeros(len(arrays.vertices), dtype=bool)
+    isOrigin[arrays.object_vertex_offsets[:-1][vertexCounts > 1]] = True
+    geometryVertices = arrays.vertices[~isOrigin]
+    geometryCounts = vertexCounts - (vertexCounts > 1)
+
+    aabbMin = np.zeros((arrays.object_count, 3), dtype=np.int32)
+    aabbMax = np.zeros((arrays.object_count, 3), dtype=np.int32)
+    hasVertices = geometryCounts > 0
+    if hasVertices.any():
+        starts = csr_offsets(geometryCounts)[:-1][hasVertices]
+        aabbMin[hasVertices] = np.minimum.reduceat(geometryVertices, starts, axis=0)
+        aabbMax[hasVertices] = np.maximum.reduceat(geometryVertices, starts, axis=0)
+
+    columns = {field: arrays.faces[field] for field in FACE_KEYS}
+    columns['face_object'] = faceObjects
+    columns['face_index'] = faceIndices
+    columns['radius'] = arrays.objects['radius']
+    columns['aabb_min'] = aabbMin
+    columns['aabb_max'] = aabbMax
+    # Names are null-terminated; bytes after the terminator may be garbage.
+    columns['name'] = np.array([name.partition(b'\0')[0] for name in arrays.objects['name'].tolist()], dtype='S24')
+    return columns
+
+
+class QueryIndex:
+    """Inverted face indexes, sorted radii and bounding boxes of every object in a set of mesh files.
+
+    Faces and objects are identified by IDs (positions in the corpus-wide face and object arrays); use face_refs and object_refs
+    to convert them to (file, object, face) and (file, object) records, where file is an index into self.files.
+    """
+
+    def __init__(self, files, digests, arrays):
+        self.files = list(files)
+        self.digests = list(digests)
+        self.arrays = arrays
+
+    @classmethod
+    def build(cls, paths, digests, jobs=None):
+        fileColumns = list(decode_all(paths, jobs, decode_query_data))
+
+        def concatenate(name):
+            return np.concatenate([columns[name] for columns in fileColumns])
+
+        arrays = {}
+        faceCounts = [len(columns['face_object']) for columns in fileColumns]
+        objectCounts = [len(columns['radius']) for columns in fileColumns]
+        arrays['face_file'] = np.repeat(np.arange(len(paths), dtype=np.int32), faceCounts)
+        arrays['face_object'] = concatenate('face_object')
+        arrays['face_index'] = concatenate('face_index')
+
+        for field, valueCount in FACE_KEYS.items():
+            values = concatenate(field).astype(np.int64)
+            arrays[field + '_order'] = np.argsort(values, kind='stable').astype(np.int32)
+            arrays[field + '_offsets'] = csr_offsets(np.bincount(values, minlength=valueCount))
+
+        arrays['object_file'] = np.repeat(np.arange(len(paths), dtype=np.int32), objectCounts)
+        arrays['file_object_offsets'] = csr_offsets(objectCounts)
+        arrays['object_index'] = np.concatenate([np.arange(count, dtype=np.int32) for count in objectCounts])
+        arrays['object_name'] = concatenate('name')
+        arrays['radius'] = concatenate('radius')
+        arrays['radius_order'] = np.argsort(arrays['radius'], kind='stable').astype(np.int32)
+        arrays['sorted_radius'] = arrays['radius'][arrays['radius_order']]
+        arrays['aabb_min'] = concatenate('aabb_min')
+        arrays['aabb_max'] = concatenate('aabb_max')
+
+        return cls(paths, digests, arrays)
+
+    @property
+    def face_count(self):
+        return len(self.arrays['face_file'])
+
+    @property
+    def object_count(self):
+        return len(self.arrays['object_file'])
+
+    def faces_with(self, field, values):
+        """IDs (sorted) of the faces whose field (one of FACE_KEYS) has the given value or any of the given values."""
+        order = self.arrays[field + '_order']
+        offsets = self.arrays[field + '_offsets']
+        if np.isscalar(values):
+            values = [values]
+
+        runs = [order[offsets[value]:offsets[value + 1]] for value in values if 0 <= value < len(offsets) - 1]
+        if len(runs) == 1:
+            return runs[0] # Already sorted, since the sort by value was stable.
+        return np.sort(np.concatenate(runs)) if runs else np.zeros(0, dtype=np.int32)
+
+    def find_faces(self, **criteria):
+        """IDs of the faces matching all the criteria (field=value or field=[values]; see FACE_KEYS)."""
+        result = None
+        for field, values in criteria.items():
+            if field not in FACE_KEYS:
+                raise KeyError(f"Faces can't be queried by {field!r} (expected one of {', '.join(FACE_KEYS)}).")
+            ids = self.faces_with(field, values)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return np.arange(self.face_count, dtype=np.int32) if result is None else result
+
+    def objects_of_faces(self, faceIds):
+        """IDs (sorted, without duplicates) of the objects containing the given faces."""
+        objectStarts = self.arrays['file_object_offsets']
+        return np.unique(objectStarts[self.arrays['face_file'][faceIds]] + self.arrays['face_object'][faceIds])
+
+    def find_objects(self, **criteria):
+        """IDs of the objects with at least one face matching all the criteria (as for find_faces)."""
+        return self.objects_of_faces(self.find_faces(**criteria))
+
+    def objects_with_radius(self, minimum=None, maximum=None):
+        """IDs (sorted) of the objects with minimum <= radius <= maximum."""
+        sortedRadius = self.arrays['sorted_radius']
+        start = 0 if minimum is None else np.searchsorted(sortedRadius, minimum, side='left')
+        end = len(sortedRadius) if maximum is None else np.searchsorted(sortedRadius, maximum, side='right')
+        return np.sort(self.arrays['radius_order'][start:end])
+
+    def objects_in_box(self, boxMin, boxMax):
+        """IDs of the objects whose bounding boxes intersect the box from boxMin to boxMax (in file coordinates)."""
+        intersects = np.all((self.arrays['aabb_min'] <= np.asarray(boxMax)) & (self.arrays['aabb_max'] >= np.asarray(boxMin)), axis=1)
+        return np.flatnonzero(intersects).astype(np.int32)
+
+    def face_refs(self, faceIds):
+        refs = np.empty(len(faceIds), dtype=FACE_REF_DTYPE)
+        refs['file'] = self.arrays['face_file'][faceIds]
+        refs['object'] = self.arrays['face_object'][faceIds]
+        refs['face'] = self.arrays['face_index'][faceIds]
+        return refs
+
+    def object_refs(self, objectIds):
+        refs = np.empty(len(objectIds), dtype=OBJECT_REF_DTYPE)
+        refs['file'] = self.arrays['object_file'][objectIds]
+        refs['object'] = self.arrays['object_index'][objectIds]
+        return refs
+
+    def object_name(self, objectId):
+        return self.arrays['object_name'][objectId].decode('ascii', 'ignore')
+
+    def save(self, path):
+        # Write to a temporary file first so a partially-written index is never read.
+        tempPath = path + '.tmp'
+        with open(tempPath, 'wb') as file:
+            np.savez(file, version=QUERY_INDEX_VERSION, files=np.array(self.files, dtype=str),
+                     digests=np.frombuffer(b''.join(self.digests), dtype=np.uint8).reshape(-1, 20), **self.arrays)
+        os.replace(tempPath, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            if int(npz['version']) != QUERY_INDEX_VERSION:
+                raise ValueError("Unrecognized query index version.")
+            arrays = {name: npz[name] for name in npz.files if name not in ('version', 'files', 'digests')}
+            return cls(npz['files'].tolist(), [row.tobytes() for row in npz['digests']], arrays)
+
+
+def query_index_path(paths, cacheDir=None):
+    """Path of the query index for a set of mesh files: in cacheDir if given, otherwise in the folder containing all of them."""
+    absolutePaths = [os.path.abspath(path) for path in paths]
+    pathsDigest = hashlib.sha1('\n'.join(absolutePaths).encode('utf-8')).hexdigest()[:12]
+    folder = cacheDir if cacheDir is not None else os.path.commonpath([os.path.dirname(path) for path in absolutePaths])
+    return os.path.join(folder, f"corpus.{pathsDigest}{QUERY_INDEX_EXTENSION}")
+
+
+def load_query_index(paths, cacheDir=None, jobs=None):
+    """Load the query index for a set of mesh files, building (and saving) it if there's no valid saved index.
+
+    The mesh files' digests come from their index cache files (see maxis_mesh.cache), which are also stored in cacheDir.
+    """
+    digests = [load_index(path, cacheDir).digest for path in paths]
+    indexPath = query_index_path(paths, cacheDir)
+
+    try:
+        saved = QueryIndex.load(indexPath)
+        if saved.files == [os.path.abspath(path) for path in paths] and saved.digests == digests:
+            return saved
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = QueryIndex.build([os.path.abspath(path) for path in paths], digests, jobs)
+    try:
+        os.makedirs(os.path.dirname(indexPath), exist_ok=True)
+        index.save(indexPath)
+    except OSError:
+        # The query index is only a cache; failing to write it (e.g., read-only game folder) isn't an error.
+        pass
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.query', description="Find objects or faces in Maxis mesh files by attribute, radius or position.")
+    parser.add_argument('inputs', nargs='+', help="Mesh files, directories (searched recursively for .max files) or glob patterns.")
+    for field in FACE_KEYS:
+        parser.add_argument('--' + field.replace('_', '-'), dest=field, type=int, nargs='+', help=f"Faces with any of these {field} values.")
+    parser.add_argument('--min-radius', type=int, help="Objects with at least this bounding radius.")
+    parser.add_argument('--max-radius', type=int, help="Objects with at most this bounding radius.")
+    parser.add_argument('--box', type=int, nargs=6, metavar=('X0', 'Y0', 'Z0', 'X1', 'Y1', 'Z1'), help="Objects whose bounding boxes intersect this box.")
+    parser.add_argument('--faces', action='store_true', help="List matching faces rather than objects (face criteria only).")
+    parser.add_argument('--cache-dir', help="Folder for index files (default: next to the mesh files).")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes used to build the index (default: one per CPU).")
+    args = parser.parse_args(argv)
+
+    paths = find_mesh_files(args.inputs)
+    if not paths:
+        parser.error("No mesh files found.")
+
+    index = load_query_index(paths, args.cache_dir, args.jobs)
+    criteria = {field: getattr(args, field) for field in FACE_KEYS if getattr(args, field) is not None}
+
+    if args.faces:
+        for file, objectIndex, face in index.face_refs(index.find_faces(**criteria)).tolist():
+            print(f"{index.files[file]}, {objectIndex}, {face}")
+        return
+
+    objectIds = index.find_objects(**criteria) if criteria else np.arange(index.object_count)
+    if args.min_radius is not None or args.max_radius is not None:
+        objectIds = np.intersect1d(objectIds, index.objects_with_radius(args.min_radius, args.max_radius))
+    if args.box is not None:
+        objectIds = np.intersect1d(objectIds, index.objects_in_box(args.box[0:3], args.box[3:6]))
+
+    for objectId, (file, objectIndex) in zip(objectIds.tolist(), index.object_refs(objectIds).tolist()):
+        print(f"{index.files[file]}, {objectIndex}, {index.object_name(objectId)}, {index.arrays['radius'][objectId]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+# Headless rendering of objects to PNG images (e.g., thumbnails of every object for an asset browser).
+# Requires NumPy.
+
+# Objects are drawn the way the viewer (Processing/maxis_mesh_viewer) draws them:
+#   * Faces of types 2, 13 and 18 are textured (see maxis_mesh.texture) with nearest-neighbour sampling and repeating UVs;
+#     textures that can't be found (or all of them, if no texture files are given) are replaced with a magenta checkerboard.
+#     Other faces are filled with the palette colour given by their texture/colour index, without shading.
+#   * Faces of type 11 are translucent (drawn with an opacity of 128/255 over whatever is behind them).
+#   * Faces with one vertex are drawn as points and faces with two vertices as lines, except for faces of type 2, which are
+#     sprites: a vertical quad whose bottom centre is the vertex after the line's first vertex.
+#   * The bounding circle (the object's radius, centred on its origin vertex in the XZ plane) can optionally be drawn.
+# As in maxis_mesh.export, Z is negated so the object isn't mirrored. The camera is orthographic, looks at the object from the
+# given yaw and pitch and is zoomed so the object fills the image.
+
+# Rasterisation is done with array operations: each triangle's bounding box is expanded into candidate pixels (in batches of at
+# most FRAGMENT_BATCH_SIZE), barycentric coordinates are computed for all of them at once, and the nearest fragment for each pixel
+# is kept with a depth buffer. Images are encoded as PNG with zlib, and objects are rendered in parallel by worker processes.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.render <directory, file or glob pattern> [...] [--output-dir <path>] [--size <pixels>]
+#       [--textures <sim3d.bmp> [--sky <sky.bmp>] [--palette <sim3d1.max or .gpl file>]] [--jobs <count>]
+
+import argparse
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .arrays import csr_offsets, decode_arrays
+from .batch import find_mesh_files
+from .export import TEXTURED_FACE_TYPES, UV_SCALE, object_file_name, output_labels
+from .max_file import MaxFile, PALETTE_SIZE, decode_name
+from .texture import TextureLibrary
+
+FACE_TYPE_SPRITE = 2
+FACE_TYPE_TRANSLUCENT = 11
+
+TRANSLUCENT_OPACITY = 128/255 # As in the viewer.
+
+DEFAULT_SIZE = 128
+DEFAULT_YAW = 45.0
+DEFAULT_PITCH = 30.0
+DEFAULT_BACKGROUND = (128, 128, 128) # As in the viewer.
+
+MARGIN = 0.05 # Fraction of the image left empty on each side.
+
+# Sizes in pixels (of the final image, before supersampling).
+LINE_WIDTH = 1
+POINT_SIZE = 3
+
+COLOR_RADIUS_CIRCLE = (255, 255, 0)
+RADIUS_CIRCLE_SIDE_COUNT = 16
+
+FALLBACK_TEXTURE = np.where((np.add.outer(np.arange(32), np.arange(32)) // 4 % 2 == 0)[:, :, None],
+                            np.array([255, 0, 255], dtype=np.uint8), np.array([0, 0, 0], dtype=np.uint8)).astype(np.uint8)
+
+# Maximum number of candidate pixels rasterised at once (limits memory use for large triangles).
+FRAGMENT_BATCH_SIZE = 2**20
+
+# Number of objects rendered by each worker task.
+RENDER_CHUNK_SIZE = 64
+
+
+class RenderOptions(namedtuple('RenderOptions', [
+        'size', # Width and height of the image in pixels
+        'yaw', # Camera angle around the Y axis in degrees (0: looking along -Z after Z is negated, i.e., from the object's front)
+        'pitch', # Camera angle above the XZ plane in degrees
+        'background', # RGB colour, or None for a transparent background (the image is then RGBA)
+        'radius_circle', # Draw the bounding circle
+        'supersample', # Render at this many times the size in each dimension and average (antialiasing)
+        ], defaults=[DEFAULT_SIZE, DEFAULT_YAW, DEFAULT_PITCH, DEFAULT_BACKGROUND, False, 1])):
+
+    __slots__ = ()
+
+
+class Primitives(namedtuple('Primitives', [
+        'triangles', # float64 (T, 3, 3), corner positions
+        'triangle_tex_coords', # float64 (T, 3, 2), (u, v) with v = 0 at the top of the texture
+        'triangle_faces', # int64 (T,), face index of each triangle
+        'lines', # float64 (L, 2, 3), end positions
+        'line_colors', # uint8 (L, 3)
+        'points', # float64 (P, 3)
+        'point_colors', # uint8 (P, 3)
+        ])):
+    """The triangles, lines and points drawn for an object, in world coordinates (with Z negated)."""
+
+    __slots__ = ()
+
+
+def object_primitives(arrays, index, palette, radiusCircle=False):
+    """Break an object from a MeshArrays into triangles (polygons and sprites), lines and points."""
+    vertexStart, vertexEnd = arrays.object_vertex_offsets[index:index + 2]
+    faceStart, faceEnd = arrays.object_face_offsets[index:index + 2]
+    cornerStart, cornerEnd = arrays.face_vertex_offsets[[faceStart, faceEnd]]
+    positions = arrays.vertices[vertexStart:vertexEnd]*np.array([1.0, 1.0, -1.0])
+    faces = arrays.faces[faceStart:faceEnd]
+    faceVertexOffsets = arrays.face_vertex_offsets[faceStart:faceEnd + 1] - cornerStart
+    vertexIndices = arrays.vertex_indices[cornerStart:cornerEnd].astype(np.int64)
+    uvs = arrays.uvs[cornerStart:cornerEnd]
+    counts = np.diff(faceVertexOffsets)
+    faceTypes = faces['face_type']
+    colors = palette[faces['tex_index']]
+
+    if (vertexIndices >= len(positions)).any():
+        raise ValueError(f"{arrays.path}: object {index} has a face referencing a vertex outside its {len(positions)} vertices.")
+
+    # Polygons are split into fans of triangles: (0, k + 1, k + 2) for k = 0 to n - 3.
+    triangleCounts = np.where(counts >= 3, counts - 2, 0)
+    triangleFaces = np.repeat(np.arange(len(faces)), triangleCounts)
+    k = np.arange(triangleCounts.sum()) - np.repeat(csr_offsets(triangleCounts)[:-1], triangleCounts)
+    first = faceVertexOffsets[triangleFaces]
+    corners = np.stack([first, first + k + 1, first + k + 2], axis=1)
+    triangles = positions[vertexIndices[corners]]
+    # The viewer flips V, since Processing's texture origin is at the top left.
+    texCoords = np.stack([uvs[corners, 0]/UV_SCALE, 1.0 - uvs[corners, 1]/UV_SCALE], axis=-1)
+
+    # Sprites: the bottom centre is the vertex after the first vertex of the line, the first vertex gives the half-width and the
+    # second gives the height. Sprite textures are flipped vertically compared to other textures.
+    spriteFaces = np.flatnonzero((faceTypes == FACE_TYPE_SPRITE) & (counts == 2))
+    side = vertexIndices[faceVertexOffsets[spriteFaces]]
+    top = vertexIndices[faceVertexOffsets[spriteFaces] + 1]
+    isValid = side + 1 < len(positions)
+    spriteFaces, side, top = spriteFaces[isValid], side[isValid], top[isValid]
+    bottom = positions[side + 1]
+    bottomCentreToSide = positions[side] - bottom
+    bottomCentreToSide[:, 1] = 0.0
+    bottom1 = bottom + bottomCentreToSide
+    bottom2 = bottom - bottomCentreToSide
+    top1, top2 = bottom1.copy(), bottom2.copy()
+    top1[:, 1] = top2[:, 1] = positions[top, 1]
+    spriteTriangles = np.concatenate([np.stack([bottom1, bottom2, top2], axis=1), np.stack([bottom1, top2, top1], axis=1)])
+    spriteTexCoords = np.concatenate([np.tile([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]], (len(spriteFaces), 1, 1)),
+                                      np.tile([[0.0, 0.0], [1.0, 1.0], [0.0, 1.0]], (len(spriteFaces), 1, 1))])
+
+    isLine = (counts == 2) & (faceTypes != FACE_TYPE_SPRITE)
+    lineCorners = faceVertexOffsets[:-1][isLine]
+    lines = positions[np.stack([vertexIndices[lineCorners], vertexIndices[lineCorners + 1]], axis=1)]
+    lineColors = colors[isLine]
+
+    isPoint = counts == 1
+    points = positions[vertexIndices[faceVertexOffsets[:-1][isPoint]]]
+
+    if radiusCircle and len(positions):
+        angles = np.linspace(0.0, 2*np.pi, RADIUS_CIRCLE_SIDE_COUNT + 1)
+        radius = float(arrays.objects[index]['radius'])
+        circle = np.stack([positions[0, 0] + radius*np.cos(angles), np.zeros_like(angles), positions[0, 2] + radius*np.sin(angles)], axis=1)
+        lines = np.concatenate([lines, np.stack([circle[:-1], circle[1:]], axis=1)])
+        lineColors = np.concatenate([lineColors, np.tile(np.array(COLOR_RADIUS_CIRCLE, dtype=np.uint8), (RADIUS_CIRCLE_SIDE_COUNT, 1))])
+
+    return Primitives(np.concatenate([triangles, spriteTriangles]).reshape(-1, 3, 3),
+                      np.concatenate([texCoords, spriteTexCoords]).reshape(-1, 3, 2),
+                      np.concatenate([triangleFaces, spriteFaces, spriteFaces]),
+                      lines.reshape(-1, 2, 3), lineColors.reshape(-1, 3), points.reshape(-1, 3), colors[isPoint])
+
+
+def view_basis(yaw, pitch):
+    """Rows: the camera's right, up and backward (towards the camera) directions."""
+    yaw, pitch = np.radians(yaw), np.radians(pitch)
+    backward = np.array([np.cos(pitch)*np.sin(yaw), np.sin(pitch), np.cos(pitch)*np.cos(yaw)])
+    right = np.array([np.cos(yaw), 0.0, -np.sin(yaw)])
+    return np.stack([right, np.cross(backward, right), backward])
+
+
+class _Projection:
+    # Orthographic projection to pixel coordinates (y down) and depth (smaller is nearer), scaled to fit the given points.
+
+    def __init__(self, basis, points, size):
+        self.basis = basis
+        projected = points @ basis[:2].T
+        if len(projected):
+            low, high = projected.min(axis=0), projected.max(axis=0)
+        else:
+            low = high = np.zeros(2)
+        extent = (high - low).max()
+        self.scale = size*(1 - 2*MARGIN)/extent if extent > 0 else 1.0
+        self.centre = (low + high)/2
+        self.size = size
+
+    def __call__(self, points):
+        view = points @ self.basis.T
+        x = (view[..., 0] - self.centre[0])*self.scale + self.size/2
+        y = self.size/2 - (view[..., 1] - self.centre[1])*self.scale
+        return np.stack([x, y], axis=-1), -view[..., 2]*self.scale
+
+
+def _barycentric_planes(screen):
+    """(T, 3, 3) coefficients (a, b, c) such that the barycentric weight of each triangle's corner at (x, y) is a*x + b*y + c,
+    and whether each triangle has a non-zero area."""
+    (x0, y0), (x1, y1), (x2, y2) = screen[:, 0].T, screen[:, 1].T, screen[:, 2].T
+    area = (x1 - x0)*(y2 - y0) - (x2 - x0)*(y1 - y0)
+    isValid = np.abs(area) > 1e-12
+    area = np.where(isValid, area, 1.0)[:, None]
+    following, opposite = screen[:, [1, 2, 0]], screen[:, [2, 0, 1]]
+    a = (following[..., 1] - opposite[..., 1])/area
+    b = (opposite[..., 0] - following[..., 0])/area
+    c = (following[..., 0]*opposite[..., 1] - opposite[..., 0]*following[..., 1])/area
+    return np.stack([a, b, c], axis=-1), isValid
+
+
+def _attribute_planes(barycentricPlanes, values):
+    """(T, K, 3) coefficients of the planes interpolating per-corner values (T, 3, K) across each triangle."""
+    return np.einsum('tik,tij->tkj', values, barycentricPlanes)
+
+
+def _interpolate(planes, triangle, x, y):
+    """Values (N, K) at the centres of pixels (x, y) of the given triangles."""
+    plane = planes[triangle]
+    return plane[..., 0]*(x + 0.5)[:, None] + plane[..., 1]*(y + 0.5)[:, None] + plane[..., 2]
+
+
+def _triangle_fragments(screen, barycentricPlanes, isValid, size):
+    """Pixels whose centres are covered by triangles, in batches: yields (triangle index, x, y)."""
+    low = np.clip(np.ceil(screen.min(axis=1) - 0.5), 0, size).astype(np.int64)
+    high = np.clip(np.floor(screen.max(axis=1) - 0.5), -1, size - 1).astype(np.int64)
+    rowCounts = np.where(isValid, np.maximum(high[:, 1] - low[:, 1] + 1, 0), 0)
+    widths = np.maximum(high[:, 0] - low[:, 0] + 1, 0)
+
+    # Split the triangles into batches covering at most FRAGMENT_BATCH_SIZE pixels of their bounding boxes (or one triangle, if
+    # it covers more).
+    ends = csr_offsets(rowCounts*widths)
+    start = 0
+    while start < len(rowCounts):
+        end = max(int(np.searchsorted(ends, ends[start] + FRAGMENT_BATCH_SIZE, side='right')) - 1, start + 1)
+        batchRowCounts = rowCounts[start:end]
+        rowTriangle = np.repeat(np.arange(start, end), batchRowCounts)
+        y = low[rowTriangle, 1] + np.arange(batchRowCounts.sum()) - np.repeat(csr_offsets(batchRowCounts)[:-1], batchRowCounts)
+
+        # Along a row, each barycentric weight is a*x + k, and the covered pixels are those where all three are non-negative.
+        plane = barycentricPlanes[rowTriangle]
+        a = plane[..., 0]
+        k = plane[..., 1]*(y + 0.5)[:, None] + plane[..., 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = -k/a
+        left = np.where(a > 0, bound, -np.inf).max(axis=1)
+        right = np.where(a < 0, bound, np.inf).min(axis=1)
+        isEmpty = ((a == 0) & (k < -1e-9)).any(axis=1)
+        spanStart = np.clip(np.ceil(left - 0.5 - 1e-9), low[rowTriangle, 0], size).astype(np.int64)
+        spanEnd = np.clip(np.floor(right - 0.5 + 1e-9), -1, high[rowTriangle, 0]).astype(np.int64)
+        spanCounts = np.where(isEmpty, 0, np.maximum(spanEnd - spanStart + 1, 0))
+
+        local = np.arange(spanCounts.sum()) - np.repeat(csr_offsets(spanCounts)[:-1], spanCounts)
+        yield np.repeat(rowTriangle, spanCounts), np.repeat(spanStart, spanCounts) + local, np.repeat(y, spanCounts)
+        start = end
+
+
+def _stamp(x, y, depth, item, brushSize, size):
+    # Expand each pixel into a brushSize x brushSize square (clipped to the image).
+    offsets = np.arange(brushSize) - (brushSize - 1)//2
+    shape = (len(x), brushSize, brushSize)
+    x = np.broadcast_to(x[:, None, None] + offsets[None, None, :], shape).reshape(-1)
+    y = np.broadcast_to(y[:, None, None] + offsets[None, :, None], shape).reshape(-1)
+    depth, item = np.repeat(depth, brushSize**2), np.repeat(item, brushSize**2)
+    isInside = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+    return item[isInside], y[isInside]*size + x[isInside], depth[isInside]
+
+
+def _line_fragments(screen, depth, width, size):
+    """Pixels covered by lines: (line index, pixel index, depth)."""
+    lengths = np.ceil(np.abs(screen[:, 1] - screen[:, 0]).max(axis=1)).astype(np.int64) + 1
+    line = np.repeat(np.arange(len(screen)), lengths)
+    t = (np.arange(lengths.sum()) - np.repeat(csr_offsets(lengths)[:-1], lengths))/np.maximum(lengths[line] - 1, 1)
+    position = screen[line, 0] + (screen[line, 1] - screen[line, 0])*t[:, None]
+    fragmentDepth = depth[line, 0] + (depth[line, 1] - depth[line, 0])*t
+    return _stamp(np.floor(position[:, 0]).astype(np.int64), np.floor(position[:, 1]).astype(np.int64), fragmentDepth, line, width, size)
+
+
+class _FaceTextures:
+    # The textures used by an object's textured faces, packed into one array of pixels so they can be sampled together.
+
+    def __init__(self, faces, textures):
+        isTextured = np.zeros(256, dtype=bool)
+        isTextured[TEXTURED_FACE_TYPES] = True
+        isTextured = isTextured[faces['face_type']]
+        keys = faces['tex_file'].astype(np.int64)*PALETTE_SIZE + faces['tex_index']
+        uniqueKeys, inverse = np.unique(keys[isTextured], return_inverse=True)
+
+        images = [_texture(textures, *divmod(int(key), PALETTE_SIZE)) for key in uniqueKeys.tolist()]
+        self.face_textures = np.full(len(faces), -1, dtype=np.int64)
+        self.face_textures[isTextured] = inverse.reshape(-1)
+        self.widths = np.array([image.shape[1] for image in images], dtype=np.int64)
+        self.heights = np.array([image.shape[0] for image in images], dtype=np.int64)
+        self.offsets = csr_offsets(self.widths*self.heights)[:-1]
+        self.pixels = np.concatenate([image.reshape(-1, 3) for image in images]) if images else np.zeros((0, 3), dtype=np.uint8)
+
+    def sample(self, texture, texCoords):
+        # Nearest-neighbour sampling with repeating texture coordinates (v = 0 is the top row).
+        widths, heights = self.widths[texture], self.heights[texture]
+        x = np.floor(texCoords[:, 0]*widths).astype(np.int64) % widths
+        y = np.floor(texCoords[:, 1]*heights).astype(np.int64) % heights
+        return self.pixels[self.offsets[texture] + y*widths + x]
+
+
+def _texture(textures, texFile, texIndex):
+    if textures is None:
+        return FALLBACK_TEXTURE
+    try:
+        return textures.texture(texFile, texIndex)
+    except (IndexError, ValueError):
+        return FALLBACK_TEXTURE
+
+
+def render_object(arrays, index, palette, textures=None, options=RenderOptions()):
+    """Render an object from a MeshArrays as a (size, size, 3) uint8 image ((size, size, 4) if the background is transparent).
+
+    palette is a (256, 3) array of colours for untextured faces; textures is a maxis_mesh.texture.TextureLibrary (or None, in which
+    case textured faces use the fallback checkerboard).
+    """
+    size = options.size*options.supersample
+    primitives = object_primitives(arrays, index, palette, options.radius_circle)
+    faces = arrays.object_faces(index)
+
+    allPositions = np.concatenate([primitives.triangles.reshape(-1, 3), primitives.lines.reshape(-1, 3), primitives.points])
+    project = _Projection(view_basis(options.yaw, options.pitch), allPositions, size)
+
+    depthBuffer = np.full(size*size, np.inf)
+    color = np.empty((size*size, 3), dtype=np.float64)
+    color[:] = options.background if options.background is not None else 0
+    alpha = np.zeros(size*size, dtype=np.float64)
+
+    def draw(pixel, depth, fragmentColor, buffer=depthBuffer):
+        # Keep the nearest fragment for each pixel; fragmentColor(selection) gives the colours of the selected fragments.
+        isNearer = depth < buffer[pixel]
+        pixel, depth, selection = pixel[isNearer], depth[isNearer], np.flatnonzero(isNearer)
+        np.minimum.at(buffer, pixel, depth)
+        isNearest = depth <= buffer[pixel]
+        return pixel[isNearest], fragmentColor(selection[isNearest])
+
+    faceTextures = _FaceTextures(faces, textures)
+    screen, depth = project(primitives.triangles)
+    barycentricPlanes, isValid = _barycentric_planes(screen)
+    depthPlanes = _attribute_planes(barycentricPlanes, depth[:, :, None])
+    texCoordPlanes = _attribute_planes(barycentricPlanes, primitives.triangle_tex_coords)
+    isTranslucent = faces['face_type'][primitives.triangle_faces] == FACE_TYPE_TRANSLUCENT
+
+    def triangle_colors(triangle, x, y):
+        def colors(selection):
+            face = primitives.triangle_faces[triangle[selection]]
+            result = palette[faces['tex_index'][face]]
+            texture = faceTextures.face_textures[face]
+            isTextured = texture >= 0
+            if isTextured.any():
+                textured = selection[isTextured]
+                texCoords = _interpolate(texCoordPlanes, triangle[textured], x[textured], y[textured])
+                result[isTextured] = faceTextures.sample(texture[isTextured], texCoords)
+            return result
+        return colors
+
+    def triangle_fragments(triangles):
+        for triangle, x, y in _triangle_fragments(screen[triangles], barycentricPlanes[triangles], isValid[triangles], size):
+            triangle = triangles[triangle]
+            yield triangle, x, y, y*size + x, _interpolate(depthPlanes, triangle, x, y)[:, 0]
+
+    # Opaque faces, then lines and points (slightly nearer, so lines on faces are visible), then translucent faces.
+    for triangle, x, y, pixel, fragmentDepth in triangle_fragments(np.flatnonzero(~isTranslucent)):
+        pixel, fragmentColor = draw(pixel, fragmentDepth, triangle_colors(triangle, x, y))
+        color[pixel], alpha[pixel] = fragmentColor, 1.0
+
+    bias = 1e-3*size
+    brush = options.supersample
+    if len(primitives.lines):
+        lineScreen, lineDepth = project(primitives.lines)
+        line, pixel, fragmentDepth = _line_fragments(lineScreen, lineDepth - bias, LINE_WIDTH*brush, size)
+        pixel, fragmentColor = draw(pixel, fragmentDepth, lambda selection: primitives.line_colors[line[selection]])
+        color[pixel], alpha[pixel] = fragmentColor, 1.0
+    if len(primitives.points):
+        pointScreen, pointDepth = project(primitives.points)
+        point, pixel, fragmentDepth = _stamp(np.floor(pointScreen[:, 0]).astype(np.int64), np.floor(pointScreen[:, 1]).astype(np.int64),
+                                             pointDepth - bias, np.arange(len(pointScreen)), POINT_SIZE*brush, size)
+        pixel, fragmentColor = draw(pixel, fragmentDepth, lambda selection: primitives.point_colors[point[selection]])
+        color[pixel], alpha[pixel] = fragmentColor, 1.0
+
+    # Only the nearest translucent face in front of the opaque geometry is blended with it.
+    translucentDepth = np.full(size*size, np.inf)
+    translucentColor = np.zeros((size*size, 3), dtype=np.float64)
+    for triangle, x, y, pixel, fragmentDepth in triangle_fragments(np.flatnonzero(isTranslucent)):
+        isVisible = fragmentDepth < depthBuffer[pixel]
+        triangle, x, y = triangle[isVisible], x[isVisible], y[isVisible]
+        pixel, fragmentColor = draw(pixel[isVisible], fragmentDepth[isVisible], triangle_colors(triangle, x, y), translucentDepth)
+        translucentColor[pixel] = fragmentColor
+    isBlended = np.isfinite(translucentDepth)
+    color[isBlended] += (translucentColor[isBlended] - color[isBlended])*TRANSLUCENT_OPACITY
+    alpha[isBlended] += (1.0 - alpha[isBlended])*TRANSLUCENT_OPACITY
+
+    image = color.reshape(size, size, 3)
+    if options.background is None:
+        image = np.concatenate([image*alpha.reshape(size, size, 1), 255*alpha.reshape(size, size, 1)], axis=2)
+    if options.supersample > 1:
+        image = image.reshape(options.size, options.supersample, options.size, options.supersample, -1).mean(axis=(1, 3))
+    if options.background is None:
+        # Undo the premultiplication by alpha used for averaging.
+        image[:, :, :3] /= np.maximum(image[:, :, 3:], 1e-9)/255
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def png_bytes(image, level=6):
+    """Encode a (height, width, 3) or (height, width, 4) uint8 image as PNG."""
+    height, width, channels = image.shape
+    colorType = {3: 2, 4: 6}[channels] # Truecolour, truecolour with alpha
+
+    # Each row starts with its filter type (0: none).
+    raw = np.zeros((height, 1 + width*channels), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width*channels)
+
+    def chunk(chunkType, data):
+        return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, colorType, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), level))
+            + chunk(b'IEND', b''))
+
+
+# Each worker process keeps the arrays and palette of the file it most recently decoded (consecutive tasks are usually from the
+# same file) and the texture library it was given.
+_decodedFile = [None, None, None]
+_textureLibrary = [None, None]
+
+
+def _decoded_file(path):
+    if _decodedFile[0] != path:
+        with MaxFile(path) as maxFile:
+            _decodedFile[:] = [path, decode_arrays(maxFile), np.array(maxFile.palette(), dtype=np.uint8)]
+    return _decodedFile[1], _decodedFile[2]
+
+
+def _texture_library(textureArgs):
+    if textureArgs is None:
+        return None
+    if _textureLibrary[0] != textureArgs:
+        _textureLibrary[:] = [textureArgs, TextureLibrary(*textureArgs)]
+    return _textureLibrary[1]
+
+
+def render_objects(path, outputFolder, start, end, options=RenderOptions(), textureArgs=None):
+    """Render objects start to end - 1 of a mesh file to PNG files in outputFolder. Returns the number of objects rendered.
+
+    textureArgs are the arguments for maxis_mesh.texture.TextureLibrary (paths of sim3d.bmp and the palette, path of sky.bmp or None,
+    cacheDir), or None.
+    """
+    arrays, palette = _decoded_file(path)
+    textures = _texture_library(textureArgs)
+    for index in range(start, end):
+        image = render_object(arrays, index, palette, textures, options)
+        name = decode_name(arrays.objects[index]['name'].tobytes())
+        with open(os.path.join(outputFolder, object_file_name(index, name) + '.png'), 'wb') as out:
+            out.write(png_bytes(image))
+    return end - start
+
+
+def _render_task(task):
+    return render_objects(*task)
+
+
+def render_files(paths, outputDir='.', options=RenderOptions(), textureArgs=None, jobs=None):
+    """Render every object of each mesh file to a folder (named after the file) in outputDir. Returns the number of objects rendered.
+
+    jobs is the number of worker processes (default: one per CPU). With jobs=1, everything is done in this process.
+    """
+    if textureArgs is not None:
+        # Build the texture caches once, so the workers only have to memory-map them.
+        TextureLibrary(*textureArgs)
+
+    tasks = []
+    for path, label in zip(paths, output_labels(paths)):
+        outputFolder = os.path.join(outputDir, label)
+        os.makedirs(outputFolder, exist_ok=True)
+        with MaxFile(path) as maxFile:
+            objectCount = maxFile.object_count
+        for start in range(0, objectCount, RENDER_CHUNK_SIZE):
+            tasks.append((path, outputFolder, start, min(start + RENDER_CHUNK_SIZE, objectCount), options, textureArgs))
+
+    if jobs == 1 or len(tasks) <= 1:
+        return sum(map(_render_task, tasks))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return sum(executor.map(_render_task, tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.render', description="Render every object in Maxis mesh files to PNG images.")
+    parser.add_argument('inputs', nargs='+', help="Mesh files, directories (searched recursively for .max files) or glob patterns.")
+    parser.add_argument('-o', '--output-dir', default='.', help="Folder in which to create a folder for each mesh file (default: current folder).")
+    parser.add_argument('-s', '--size', type=int, default=DEFAULT_SIZE, help=f"Width and height of the images in pixels (default: {DEFAULT_SIZE}).")
+    parser.add_argument('--yaw', type=float, default=DEFAULT_YAW, help=f"Camera angle around the vertical axis in degrees (default: {DEFAULT_YAW:g}).")
+    parser.add_argument('--pitch', type=float, default=DEFAULT_PITCH, help=f"Camera angle above the horizontal in degrees (default: {DEFAULT_PITCH:g}).")
+    parser.add_argument('--supersample', type=int, default=1, help="Render at this many times the size and scale down (antialiasing).")
+    parser.add_argument('--transparent', action='store_true', help="Write RGBA images with a transparent background.")
+    parser.add_argument('--radius', action='store_true', help="Draw each object's bounding circle.")
+    parser.add_argument('-t', '--textures', help="Path of sim3d.bmp (default: textured faces use a checkerboard).")
+    parser.add_argument('--sky', help="Path of sky.bmp (used by faces with texture file 20).")
+    parser.add_argument('-p', '--palette', help="Mesh file or .gpl palette used to decode the textures (default: the first mesh file).")
+    parser.add_argument('--cache-dir', help="Folder for the texture cache files (default: next to the texture files).")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: one per CPU).")
+    args = parser.parse_args(argv)
+
+    paths = find_mesh_files(args.inputs)
+    if not paths:
+        parser.error("No mesh files found.")
+
+    options = RenderOptions(args.size, args.yaw, args.pitch, None if args.transparent else DEFAULT_BACKGROUND, args.radius, args.supersample)
+    textureArgs = None
+    if args.textures:
+        textureArgs = (args.textures, args.palette or paths[0], args.sky, args.cache_dir)
+
+    begin = time.perf_counter()
+    count = render_files(paths, args.output_dir, options, textureArgs, args.jobs)
+    print(f"Rendered {count} objects from {len(paths)} mesh files in {time.perf_counter() - begin:.1f} s.")
+
+
+if __name__ == '__main__':
+    main()
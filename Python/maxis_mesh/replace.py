@@ -0,0 +1,206 @@
+# Replace objects within a Maxis mesh file (a Python counterpart to the mesh-replace tool).
+
+# The output is written in a single pass: the headers and geometry tables (updated with the new object addresses and counts)
+# are written first, followed by each object in turn. Unchanged objects are copied directly from the memory-mapped source file,
+# so the run time is proportional to the size of the output regardless of how many objects are replaced.
+
+# Unlike mesh-replace, this also updates the object addresses and per-object counts in both geometry tables and the file
+# size in the DIRC header.
+
+import argparse
+import os
+import struct
+import tempfile
+
+from .max_file import (MaxFile, STRUCT_OBJECT_HEADER, STRUCT_FACE_HEADER, LENGTH_OBJECT_HEADER, LENGTH_FACE_HEADER, LENGTH_VERTEX,
+                       LENGTH_GEOM_TABLE_ENTRY, LENGTH_DUPLICATE_GEOM_TABLE_ENTRY, OFFSET_OBJECT_SIGNATURE, LENGTH_OBJECT_SIGNATURE)
+from .model import MaxObject
+from . import instrument
+
+# Offsets within geometry table entries.
+OFFSET_ENTRY_ADDRESS = 17
+OFFSET_ENTRY_RENDERED_VERTEX_COUNT = 29
+OFFSET_ENTRY_FACE_COUNT = 41
+OFFSET_ENTRY_UNIQUE_VERTEX_COUNT = 45
+
+# Offsets within duplicate geometry table entries.
+OFFSET_DUPLICATE_ENTRY_ADDRESS = 4
+OFFSET_DUPLICATE_ENTRY_RENDERED_VERTEX_COUNT = 12
+OFFSET_DUPLICATE_ENTRY_FACE_COUNT = 24
+OFFSET_DUPLICATE_ENTRY_UNIQUE_VERTEX_COUNT = 28
+
+OFFSET_DIRC_FILE_SIZE = 4
+
+
+def count_object(objectBytes):
+    """(rendered vertex count, face count, unique vertex count) of an object, as stored in the geometry table.
+
+    Raises ValueError if the data isn't a complete object.
+    """
+    if len(objectBytes) < LENGTH_OBJECT_HEADER:
+        raise ValueError(f"Replacement data is {len(objectBytes)} bytes long; an object is at least {LENGTH_OBJECT_HEADER} bytes long.")
+    signature, _, vertexCount, faceCount, *_ = STRUCT_OBJECT_HEADER.unpack_from(objectBytes, 0)
+    if signature != b'OBJX':
+        raise ValueError("Replacement data doesn't start with OBJX.")
+
+    renderedVertexCount = 0
+    pos = LENGTH_OBJECT_HEADER + vertexCount*LENGTH_VERTEX
+    if pos > len(objectBytes):
+        raise ValueError(f"Replacement data ends at offset {len(objectBytes)}, before the end of its vertices.")
+    for _ in range(faceCount):
+        if pos + LENGTH_FACE_HEADER > len(objectBytes):
+            raise ValueError(f"Replacement data ends at offset {len(objectBytes)}, before the end of its faces.")
+        faceSignature, size, faceVertexCount, *_ = STRUCT_FACE_HEADER.unpack_from(objectBytes, pos)
+        if faceSignature != b'FACE':
+            raise ValueError(f"Expected FACE at offset {pos} of replacement data.")
+        renderedVertexCount += faceVertexCount
+        pos += size
+    if pos > len(objectBytes):
+        raise ValueError(f"Replacement data ends at offset {len(objectBytes)}, before the end of its faces.")
+
+    return renderedVertexCount, faceCount, vertexCount
+
+
+def resolve_index(maxFile, key):
+    """Object index for an integer index or an object name (from either the geometry table or the object block)."""
+    if isinstance(key, int):
+        if key < 0 or key >= maxFile.object_count:
+            raise IndexError(f"Specified index {key} is invalid: there are only {maxFile.object_count} meshes in {maxFile.path} (valid indices are 0 to {maxFile.object_count - 1}).")
+        return key
+
+    matches = [i for i in range(maxFile.object_count)
+               if key.casefold() in (maxFile.geom_table_entry(i).name.casefold(), maxFile.object_header(i).name.casefold())]
+
+    if len(matches) != 1:
+        raise KeyError(f"Name {key!r} matches {len(matches)} meshes in {maxFile.path}; use an index instead.")
+
+    return matches[0]
+
+
+def _load_replacement(replacement):
+    if isinstance(replacement, MaxObject):
+        return replacement.to_bytes()
+    if isinstance(replacement, (bytes, bytearray, memoryview)):
+        return bytes(replacement)
+    with open(replacement, 'rb') as file:
+        return file.read()
+
+
+def replace_objects(sourcePath, replacements, outputPath):
+    """Replace objects in a mesh file and write the result to outputPath.
+
+    replacements maps object indices or names to replacement objects: paths to .bin files (as written by the Blender export
+    script or mesh-extract), bytes or MaxObjects. The 12-byte signature at offset 112 of each replaced object is preserved.
+    outputPath may be the same as sourcePath.
+    """
+    loaded = {}
+
+    with MaxFile(sourcePath) as maxFile:
+        data = maxFile.data
+
+        with instrument.stage('load_replacements'):
+            for key, replacement in replacements.items():
+                index = resolve_index(maxFile, key)
+                if index in loaded:
+                    raise ValueError(f"Mesh {index} is specified more than once.")
+                objectBytes = _load_replacement(replacement)
+                try:
+                    counts = count_object(objectBytes)
+                except ValueError as e:
+                    raise ValueError(f"Invalid replacement for mesh {index}: {e}") from None
+                loaded[index] = (objectBytes, counts)
+
+        with instrument.stage('layout'):
+            # Each object's span extends to the start of the next object (or the end of the file), as in mesh-replace.
+            order = sorted(range(maxFile.object_count), key=lambda i: maxFile.object_offsets[i])
+            spanEnds = {}
+            for position, index in enumerate(order):
+                spanEnds[index] = maxFile.object_offsets[order[position + 1]] if position + 1 < len(order) else len(data)
+
+            prefixEnd = maxFile.object_offsets[order[0]] if order else len(data)
+            prefix = bytearray(data[0:prefixEnd])
+
+            pieces = []
+            newOffset = prefixEnd
+            totals = [maxFile.totals.rendered_vertex_count, maxFile.totals.face_count, maxFile.totals.unique_vertex_count]
+
+            for index in order:
+                start = maxFile.object_offsets[index]
+                end = spanEnds[index]
+                entryOffset = maxFile.geom_table_address + (index + 1)*LENGTH_GEOM_TABLE_ENTRY
+                duplicateEntryOffset = maxFile.duplicate_geom_table_address + index*LENGTH_DUPLICATE_GEOM_TABLE_ENTRY
+
+                if index in loaded:
+                    objectBytes, newCounts = loaded[index]
+                    replacement = bytearray(objectBytes)
+                    # Use the signature from the original object.
+                    replacement[OFFSET_OBJECT_SIGNATURE:OFFSET_OBJECT_SIGNATURE + LENGTH_OBJECT_SIGNATURE] = \
+                        data[start + OFFSET_OBJECT_SIGNATURE:start + OFFSET_OBJECT_SIGNATURE + LENGTH_OBJECT_SIGNATURE]
+
+                    oldCounts = count_object(data[start:end])
+                    for i in range(3):
+                        totals[i] += newCounts[i] - oldCounts[i]
+
+                    for base, offsets in ((entryOffset, (OFFSET_ENTRY_RENDERED_VERTEX_COUNT, OFFSET_ENTRY_FACE_COUNT, OFFSET_ENTRY_UNIQUE_VERTEX_COUNT)),
+                                          (duplicateEntryOffset, (OFFSET_DUPLICATE_ENTRY_RENDERED_VERTEX_COUNT, OFFSET_DUPLICATE_ENTRY_FACE_COUNT, OFFSET_DUPLICATE_ENTRY_UNIQUE_VERTEX_COUNT))):
+                        for offset, count in zip(offsets, newCounts):
+                            struct.pack_into('<I', prefix, base + offset, count)
+
+                    pieces.append(replacement)
+                    newSize = len(replacement)
+                else:
+                    pieces.append((start, end)) # Copied from the source while writing.
+                    newSize = end - start
+
+                struct.pack_into('<I', prefix, entryOffset + OFFSET_ENTRY_ADDRESS, newOffset)
+                struct.pack_into('<I', prefix, duplicateEntryOffset + OFFSET_DUPLICATE_ENTRY_ADDRESS, newOffset)
+                newOffset += newSize
+
+            totalsOffset = maxFile.geom_table_address
+            struct.pack_into('<I', prefix, totalsOffset + OFFSET_ENTRY_RENDERED_VERTEX_COUNT, totals[0])
+            struct.pack_into('<I', prefix, totalsOffset + OFFSET_ENTRY_FACE_COUNT, totals[1])
+            struct.pack_into('<I', prefix, totalsOffset + OFFSET_ENTRY_UNIQUE_VERTEX_COUNT, totals[2])
+            struct.pack_into('<I', prefix, OFFSET_DIRC_FILE_SIZE, newOffset)
+
+        with instrument.stage('write'):
+            # Write to a temporary file in the output folder so the source can be overwritten safely.
+            outputFolder = os.path.dirname(os.path.abspath(outputPath))
+            handle, tempPath = tempfile.mkstemp(dir=outputFolder, suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as out:
+                    out.write(prefix)
+                    for piece in pieces:
+                        if isinstance(piece, tuple):
+                            # Released straight away so no view of the source is left when it's closed.
+                            with memoryview(data)[piece[0]:piece[1]] as view:
+                                out.write(view)
+                        else:
+                            out.write(piece)
+                os.chmod(tempPath, os.stat(sourcePath).st_mode & 0o777)
+            except BaseException:
+                os.remove(tempPath)
+                raise
+
+    os.replace(tempPath, outputPath)
+    instrument.count('bytes_written', newOffset)
+    instrument.count('objects_replaced', len(loaded))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m maxis_mesh.replace',
+        description="Replace the mesh/meshes at the specified index/indices in a Maxis mesh file with the specified data.")
+    parser.add_argument('-s', '--source', required=True, help="Source path. A Maxis mesh file (sim3d#.max).")
+    parser.add_argument('-i', '--index', required=True, help="Index/indices (or names) of mesh/meshes to replace, separated by commas.")
+    parser.add_argument('-r', '--replacement', required=True, help="Path to replacement object data.")
+    parser.add_argument('-o', '--output', required=True, help="Output path.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    keys = [int(key) if key.strip().lstrip('-').isdigit() else key.strip() for key in args.index.split(',')]
+    with instrument.recording_from_arguments(args), instrument.archive(args.source):
+        replace_objects(args.source, {key: args.replacement for key in keys}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+# A long-running local service that keeps mesh files open and parsed between requests.
+# Requires NumPy.
+
+# Workflows that alternate between exporting, replacing and tabulating otherwise pay for starting Python, importing NumPy and
+# parsing the mesh files on every step. The service holds each mesh file as a MeshArchive (memory-mapped, with its object table
+# parsed) and answers requests over HTTP on localhost, so a request from maxis_mesh.client takes a few milliseconds.
+
+# The files are polled for changes (size and modification time), and also checked before each request. A changed file is parsed
+# again incrementally: the SHA-1 digest of each object (see maxis_mesh.batch.object_digests) is compared with the previous version
+# and exported OBJ text is cached by digest, so only the objects that actually changed are exported again.
+
+# Endpoints (parameters are in the query string):
+#   GET  /archives                                         The mesh files held by the service (JSON).
+#   GET  /objects?archive=<mesh file>                      Object table of a mesh file (JSON).
+#   GET  /object?archive=...&object=<index or name>&format=obj|mtl|bin[&unscaled=1][&mtl=<.mtl file name>]
+#   POST /replace?archive=...&object=...[&object=...][&output=<path>][&validate=1]   The body is the replacement object.
+#   POST /tabulate?output-dir=<folder>[&archive=...][&table=...]   Incremental tabulation (see maxis_mesh.batch).
+#   POST /shutdown
+# archive is a path (mesh files that aren't held yet are opened) or the file name of a mesh file the service already holds.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.service [<directory, file or glob pattern> ...] [--port <port>] [--interval <seconds>]
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import time
+import traceback
+import urllib.parse
+from collections import OrderedDict
+
+from .archive import MeshArchive
+from .arrays import decode_object_bytes
+from .batch import find_mesh_files, object_digests, tabulate_files_incremental
+from .client import DEFAULT_HOST, DEFAULT_PORT
+from .export import export_geometry, mtl_text, obj_text, object_geometry, output_labels
+from .max_file import OFFSET_PALETTE, PALETTE_SIZE
+from .replace import replace_objects
+from . import tabulate
+
+DEFAULT_INTERVAL = 1.0 # Seconds between checks for changed files
+
+DEFAULT_OBJ_CACHE_BUDGET = 64*2**20
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_TEXT = 'text/plain; charset=utf-8'
+CONTENT_TYPE_BINARY = 'application/octet-stream'
+
+
+class HotArchive:
+    """A mesh file held open by the service, with the digest of each object and its object table."""
+
+    def __init__(self, path, label):
+        self.path = path
+        self.label = label # File name without extension, made unique (see maxis_mesh.export.output_labels)
+        self.archive = None
+        self.stat = None # (size, mtime in ns) of the loaded version
+        self.digests = None # bytes of each object's SHA-1 digest
+        self.palette_digest = None # SHA-1 digest of the colour map
+        self.reloads = 0
+        self.error = None # Message if the current version of the file couldn't be loaded
+        self.lock = asyncio.Lock()
+        self._objects = None
+
+    def changed(self):
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns) != self.stat
+
+    def load(self):
+        """Open the current version of the file. Returns the number of objects whose digests differ from the previous version."""
+        stat = os.stat(self.path)
+        archive = MeshArchive(self.path)
+        try:
+            _, digestArray = object_digests(archive.file)
+        except BaseException:
+            archive.close()
+            raise
+
+        digests = [digest.tobytes() for digest in digestArray]
+        paletteDigest = hashlib.sha1(archive.file.data[OFFSET_PALETTE:OFFSET_PALETTE + 3*PALETTE_SIZE]).digest()
+        previous = set(self.digests or [])
+        changedCount = sum(digest not in previous for digest in digests)
+
+        self.close()
+        if self.stat is not None:
+            self.reloads += 1
+        self.archive = archive
+        self.stat = (stat.st_size, stat.st_mtime_ns)
+        self.digests = digests
+        self.palette_digest = paletteDigest
+        self.error = None
+        return changedCount
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        self._objects = None
+
+    def objects(self):
+        """The object table: one dict per object, in geometry table order."""
+        if self._objects is None:
+            maxFile = self.archive.file
+            self._objects = [{
+                'index': header.index,
+                'table_name': maxFile.geom_table_entry(header.index).name,
+                'name': header.name,
+                'offset': header.offset,
+                'total_size': header.total_size,
+                'vertex_count': header.vertex_count,
+                'face_count': header.face_count,
+                'radius': header.radius,
+                'id': header.id,
+            } for header in maxFile.object_headers()]
+        return self._objects
+
+    def summary(self):
+        return {
+            'path': self.path,
+            'object_count': len(self.archive) if self.archive is not None else 0,
+            'size': self.stat[0] if self.stat is not None else None,
+            'reloads': self.reloads,
+            'error': self.error,
+        }
+
+
+class MeshService:
+    """Holds mesh files open and answers requests about them (see the endpoints above)."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, objCacheBudget=DEFAULT_OBJ_CACHE_BUDGET):
+        self.interval = interval
+        self.archives = {} # Normalized absolute path to HotArchive
+        self.obj_cache_budget = objCacheBudget
+        self.obj_cached_bytes = 0
+        self._objCache = OrderedDict() # (digest, format, unscaled, .mtl name) to bytes
+        self._fileLock = asyncio.Lock() # Held while replacing objects or tabulating, so files aren't replaced while being read
+        self._stopped = None
+
+        self._routes = {
+            ('GET', '/archives'): self.handle_archives,
+            ('GET', '/objects'): self.handle_objects,
+            ('GET', '/object'): self.handle_object,
+            ('POST', '/replace'): self.handle_replace,
+            ('POST', '/tabulate'): self.handle_tabulate,
+            ('POST', '/shutdown'): self.handle_shutdown,
+        }
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _hot_archive(self, path):
+        key = self._key(path)
+        hot = self.archives.get(key)
+        if hot is None:
+            labels = output_labels([h.path for h in self.archives.values()] + [os.path.abspath(path)])
+            hot = HotArchive(os.path.abspath(path), labels[-1])
+            self.archives[key] = hot
+        return hot
+
+    def _forget(self, hot):
+        # Stop holding a mesh file that has never been loaded, so a path that isn't a valid mesh file isn't retried forever.
+        key = self._key(hot.path)
+        if hot.stat is None and self.archives.get(key) is hot:
+            del self.archives[key]
+
+    def add(self, path):
+        """Open a mesh file (if it isn't already held). Must be called from the service's event loop."""
+        hot = self._hot_archive(path)
+        if hot.archive is None:
+            try:
+                hot.load()
+            except BaseException:
+                self._forget(hot)
+                raise
+        return hot
+
+    def _find(self, archive):
+        # A path, or the file name of a held mesh file.
+        if os.path.isabs(archive):
+            if not os.path.isfile(archive):
+                raise ValueError(f"{archive} doesn't exist.")
+            return self._hot_archive(archive)
+
+        matches = [hot for hot in self.archives.values() if os.path.normcase(os.path.basename(hot.path)) == os.path.normcase(archive)]
+        if len(matches) != 1:
+            raise ValueError(f"{archive!r} matches {len(matches)} of the mesh files held by the service; use its full path instead.")
+        return matches[0]
+
+    async def _refresh(self, hot):
+        # Reload the archive if the file changed. The caller must hold hot.lock.
+        if hot.archive is not None and not hot.changed():
+            return
+
+        begin = time.perf_counter()
+        try:
+            changedCount = await asyncio.get_running_loop().run_in_executor(None, hot.load)
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            # Perhaps the file is still being written; keep the previous version (if any) and try again later.
+            if hot.error != str(e):
+                hot.error = str(e)
+                print(f"Couldn't load {hot.path}: {e}")
+            if hot.archive is None:
+                self._forget(hot)
+                raise ValueError(f"Couldn't load {hot.path}: {e}")
+            return
+        print(f"Loaded {hot.path} ({changedCount} of {len(hot.archive)} objects changed) in {(time.perf_counter() - begin)*1000:.1f} ms.")
+
+    def _current(self, params):
+        # The archive named by the request's archive parameter, locked and up to date while in an async with block.
+        return _LockedArchive(self, self._find(_parameter(params, 'archive')))
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for hot in list(self.archives.values()):
+                async with hot.lock:
+                    try:
+                        await self._refresh(hot)
+                    except (OSError, ValueError):
+                        pass
+
+    # Request handlers. Each returns (content type, body bytes).
+
+    async def handle_archives(self, params, body):
+        return _json([hot.summary() for hot in self.archives.values()])
+
+    async def handle_objects(self, params, body):
+        async with self._current(params) as hot:
+            return _json(hot.objects())
+
+    async def handle_object(self, params, body):
+        outputFormat = _parameter(params, 'format', 'obj')
+        if outputFormat not in ('obj', 'mtl', 'bin'):
+            raise ValueError(f"Unknown format {outputFormat!r}.")
+        unscaled = _parameter(params, 'unscaled', '0') == '1'
+
+        async with self._current(params) as hot:
+            index = hot.archive.index_of(_object_key(_parameter(params, 'object')))
+            if outputFormat == 'bin':
+                return CONTENT_TYPE_BINARY, hot.archive.file.object_bytes(index)
+
+            mtlName = _parameter(params, 'mtl', hot.label + '.mtl')
+            # OBJ text names unnamed objects after their index and MTL text uses the file's colour map, so identical objects only
+            # share cached text when those match too.
+            if outputFormat == 'obj':
+                variant = (mtlName, None if hot.objects()[index]['name'] else index)
+            else:
+                variant = hot.palette_digest
+            key = (hot.digests[index], outputFormat, unscaled, variant)
+            cached = self._objCache.get(key)
+            if cached is not None:
+                self._objCache.move_to_end(key)
+                return CONTENT_TYPE_TEXT, cached
+
+            arrays = decode_object_bytes(hot.archive.file.object_bytes(index), hot.path)
+            geometry = object_geometry(arrays, export_geometry(arrays, not unscaled), 0)._replace(index=index)
+            if outputFormat == 'obj':
+                text = obj_text(geometry, mtlName)
+            else:
+                text = mtl_text(set(geometry.material_ids.tolist()), hot.archive.file.palette())
+
+        content = text.encode('utf-8')
+        self._store(key, content)
+        return CONTENT_TYPE_TEXT, content
+
+    def _store(self, key, content):
+        if len(content) > self.obj_cache_budget:
+            return
+        self._objCache[key] = content
+        self.obj_cached_bytes += len(content)
+        while self.obj_cached_bytes > self.obj_cache_budget:
+            _, evicted = self._objCache.popitem(last=False)
+            self.obj_cached_bytes -= len(evicted)
+
+    async def handle_replace(self, params, body):
+        if not body:
+            raise ValueError("The request has no replacement object.")
+        keys = [_object_key(key) for key in params.get('object', [])]
+        if not keys:
+            raise ValueError("No objects were specified.")
+
+        if _parameter(params, 'validate', '0') == '1':
+            from .validate import ERROR, validate_object
+            errors = [issue for issue in validate_object(body) if issue.severity == ERROR]
+            if errors:
+                raise ValueError("The replacement object has errors: " + '; '.join(map(str, errors[:5])))
+
+        async with self._fileLock, self._current(params) as hot:
+            indices = [hot.archive.index_of(key) for key in keys]
+            outputPath = os.path.abspath(_parameter(params, 'output', hot.path))
+
+            # The source and (if it's held) the output are closed while the output is replaced, since a memory-mapped file can't
+            # be replaced on Windows.
+            output = self.archives.get(self._key(outputPath))
+            outputHot = output if output is not None and output is not hot else None
+            if outputHot is not None:
+                await outputHot.lock.acquire()
+            try:
+                def replace():
+                    hot.close()
+                    if outputHot is not None:
+                        outputHot.close()
+                    try:
+                        replace_objects(hot.path, {index: body for index in indices}, outputPath)
+                    finally:
+                        hot.load()
+                        if outputHot is not None:
+                            outputHot.load()
+                await asyncio.get_running_loop().run_in_executor(None, replace)
+            finally:
+                if outputHot is not None:
+                    outputHot.lock.release()
+
+        print(f"Replaced objects {', '.join(map(str, indices))} of {hot.path} in {outputPath}.")
+        return _json({'replaced': indices, 'output': outputPath})
+
+    async def handle_tabulate(self, params, body):
+        outputDir = _parameter(params, 'output-dir')
+        tables = params.get('table', tabulate.TABLES)
+        for table in tables:
+            if table not in tabulate.TABLES:
+                raise ValueError(f"Unknown table {table!r}.")
+
+        async with self._fileLock:
+            hots = [self._find(archive) for archive in params['archive']] if 'archive' in params else list(self.archives.values())
+            paths = []
+            skipped = []
+            for hot in hots:
+                async with hot.lock:
+                    try:
+                        await self._refresh(hot)
+                    except ValueError:
+                        pass
+                    # Files that can't be loaded (and were never loaded) are reported rather than failing the whole request.
+                    if hot.archive is None:
+                        skipped.append({'path': hot.path, 'error': hot.error})
+                    else:
+                        paths.append(hot.path)
+
+            # Unchanged files are recognized from the tabulation state, so they aren't read again. Tabulation runs in this
+            # process (jobs=1): starting worker processes would take longer than decoding the few objects that usually change.
+            changedCount = await asyncio.get_running_loop().run_in_executor(None, tabulate_files_incremental, paths, outputDir,
+                                                                            tables, 1)
+        return _json({'file_count': len(paths), 'changed_count': changedCount, 'skipped': skipped})
+
+    async def handle_shutdown(self, params, body):
+        self._stopped.set()
+        return _json({})
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, contentType, content = await self._respond(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: {contentType}\r\nContent-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode('ascii'))
+            writer.write(content)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        # Returns (status, content type, body) for one request.
+        head = await reader.readuntil(b'\r\n\r\n')
+        requestLine, *headerLines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = requestLine.split(' ', 2)
+            headers = dict((name.strip().lower(), value.strip()) for name, value in (line.split(':', 1) for line in headerLines if line))
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        except ValueError:
+            return 400, CONTENT_TYPE_JSON, _json({'error': "Malformed request."})[1]
+
+        url = urllib.parse.urlsplit(target)
+        handler = self._routes.get((method, url.path))
+        if handler is None:
+            status = 405 if any(path == url.path for _, path in self._routes) else 404
+            return status, CONTENT_TYPE_JSON, _json({'error': f"No {method} {url.path} endpoint."})[1]
+
+        try:
+            contentType, content = await handler(urllib.parse.parse_qs(url.query), body)
+        except (ValueError, KeyError, IndexError, OSError) as e:
+            message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+            return 400, CONTENT_TYPE_JSON, _json({'error': message})[1]
+        except Exception as e:
+            print(f"Error handling {method} {target}:")
+            traceback.print_exc()
+            return 500, CONTENT_TYPE_JSON, _json({'error': f"{type(e).__name__}: {e}"})[1]
+        return 200, contentType, content
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, paths=()):
+        """Open the given mesh files, then answer requests until a shutdown request is received."""
+        for path in paths:
+            self.add(path)
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        watcher = asyncio.ensure_future(self.watch())
+        print(f"Serving {len(self.archives)} mesh files on http://{host}:{port}.")
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            watcher.cancel()
+            for hot in self.archives.values():
+                hot.close()
+
+
+class _LockedArchive:
+    # Async context manager that holds an archive's lock and makes sure it's loaded and up to date.
+
+    def __init__(self, service, hot):
+        self.service = service
+        self.hot = hot
+
+    async def __aenter__(self):
+        await self.hot.lock.acquire()
+        try:
+            await self.service._refresh(self.hot)
+        except BaseException:
+            self.hot.lock.release()
+            raise
+        return self.hot
+
+    async def __aexit__(self, *exc):
+        self.hot.lock.release()
+
+
+def _parameter(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise ValueError(f"The {name} parameter is required.")
+        return default
+    return values[-1]
+
+
+def _object_key(key):
+    return int(key) if key.lstrip('-').isdigit() else key
+
+
+def _json(value):
+    return CONTENT_TYPE_JSON, json.dumps(value).encode('utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.service', description="Keep Maxis mesh files open and parsed, answering requests from maxis_mesh.client.")
+    parser.add_argument('inputs', nargs='*', help="Mesh files, directories (searched recursively for .max files) or glob patterns to open at startup.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST}).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT}).")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help=f"Seconds between checks for changed files (default: {DEFAULT_INTERVAL}).")
+    args = parser.parse_args(argv)
+
+    paths = find_mesh_files(args.inputs) if args.inputs else []
+    try:
+        asyncio.run(MeshService(args.interval).serve(args.host, args.port, paths))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
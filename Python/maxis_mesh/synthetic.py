@@ -0,0 +1,167 @@
+# Generation of synthetic (but format-valid) Maxis mesh files, for benchmarking without the games' files.
+# Requires NumPy.
+
+# Files have the same layout as sim3d#.max: DIRC header, colour map, geometry table (with its duplicate) and objects. Objects
+# contain random vertices and faces of every face type used by the games, with flags, texture indices and vertex counts
+# consistent with each type (using maxis_mesh.validate's tables of them, so generated files pass its checks; see
+# Info/Maxis-Mesh-Format.md). The geometry tables hold the correct addresses and counts.
+# The same seed always produces the same file.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.synthetic <output path> [--objects <count>] [--seed <seed>]
+
+import argparse
+
+import numpy as np
+
+from .max_file import (STRUCT_DIRC, STRUCT_GEOM_HEADER, STRUCT_GEOM_TABLE_ENTRY, STRUCT_DUPLICATE_GEOM_TABLE_ENTRY,
+                       LENGTH_GEOM_HEADER, LENGTH_GEOM_TABLE_ENTRY, LENGTH_DUPLICATE_GEOM_TABLE_ENTRY, OFFSET_PALETTE, PALETTE_SIZE)
+from .replace import count_object
+from .validate import FACE_TYPE_FLAGS, FACE_TYPE_VERTEX_COUNTS, FACE_TYPE_LINE_SPRITE, FACE_TYPE_TEXTURED_DEDICATED
+from .writer import pack_object
+
+# The real files contain around 400 objects each.
+DEFAULT_OBJECT_COUNT = 400
+
+CMAP_ADDRESS = 28
+GEOM_ADDRESS = 829
+
+# Roughly the proportions of each face type in the games' files.
+DEFAULT_FACE_TYPE_WEIGHTS = {
+    2: 0.03,
+    11: 0.03,
+    13: 0.01,
+    15: 0.25,
+    18: 0.5,
+    19: 0.1,
+    20: 0.04,
+    25: 0.03,
+    26: 0.01,
+}
+
+FACE_TYPE_TEXTURED_ATLAS = 18
+FACE_TYPE_POINT_LIGHT = 25
+
+IS_LIGHT_FACE = 4
+
+# Coordinates span about one SimCity 2000 tile (16 metres, or 2^22 units).
+COORDINATE_RANGE = 2**22
+UV_RANGE = 2**16
+
+
+def synthetic_object(rng, index, vertexCount, faceCount, faceTypeWeights=DEFAULT_FACE_TYPE_WEIGHTS):
+    """Bytes of a random object with vertexCount vertices (including the origin, at least 3) and faceCount faces."""
+    vertices = rng.integers(-COORDINATE_RANGE, COORDINATE_RANGE, size=(vertexCount, 3), dtype=np.int32)
+    vertices[0] = 0 # The first vertex is the object's origin.
+
+    types = np.array(list(faceTypeWeights.keys()))
+    weights = np.array(list(faceTypeWeights.values()), dtype=np.float64)
+    faceTypes = rng.choice(types, size=faceCount, p=weights/weights.sum())
+
+    # Lines and points have the vertex counts in FACE_TYPE_VERTEX_COUNTS. Other faces have three to five.
+    faceVertexCounts = rng.integers(3, 5, size=faceCount, endpoint=True)
+    for faceType, count in FACE_TYPE_VERTEX_COUNTS.items():
+        faceVertexCounts[faceTypes == faceType] = count
+
+    faceStarts = np.concatenate([[0], np.cumsum(faceVertexCounts)[:-1]])
+    vertexIndices = rng.integers(1, vertexCount, size=int(faceVertexCounts.sum()))
+    # The vertex after a sprite line's first vertex is the midpoint of the bottom of the sprite, so it must exist.
+    spriteStarts = faceStarts[faceTypes == FACE_TYPE_LINE_SPRITE]
+    vertexIndices[spriteStarts] = np.minimum(vertexIndices[spriteStarts], vertexCount - 2)
+
+    isTextured = (faceTypes == FACE_TYPE_TEXTURED_DEDICATED) | (faceTypes == FACE_TYPE_TEXTURED_ATLAS)
+    uvs = rng.integers(0, UV_RANGE, size=(len(vertexIndices), 2), endpoint=True)
+    uvs[~np.repeat(isTextured, faceVertexCounts)] = 0
+
+    texIndices = rng.integers(0, PALETTE_SIZE, size=faceCount)
+    isAtlas = faceTypes == FACE_TYPE_TEXTURED_ATLAS
+    texIndices[isAtlas] = rng.integers(0, 64, size=int(isAtlas.sum()))
+    # Atlas-textured faces use texture files 1 and 2 (0 is for dedicated textures and colours).
+    texFiles = np.where(isAtlas, rng.integers(1, 3, size=faceCount), 0)
+    # For atlas-textured faces, the group is the face's index; for others, it's the colour/texture index.
+    group = np.where(isAtlas, np.arange(faceCount), texIndices)
+    flags = np.array([FACE_TYPE_FLAGS[t][0] for t in faceTypes.tolist()], dtype=np.int64)
+    isLight = np.where(faceTypes == FACE_TYPE_POINT_LIGHT, IS_LIGHT_FACE, 0)
+
+    # The bounding radius covers the vertices' extent in the XZ plane.
+    radius = int(np.ceil(np.hypot(vertices[:, 0].astype(np.float64), vertices[:, 2].astype(np.float64)).max()))
+    signature = rng.integers(0, 256, size=12, dtype=np.uint8).tobytes()
+
+    return pack_object(f"OBJ{index}", vertices, faceVertexCounts, vertexIndices, uvs, faceTypes, flags, texIndices, texFiles,
+                       isLight=isLight, group=group, collisionBytes=radius.to_bytes(4, byteorder='little'), signature=signature)
+
+
+def synthetic_mesh_file(objectCount=DEFAULT_OBJECT_COUNT, seed=0, vertexCountRange=(3, 60), faceCountRange=(1, 50),
+                        faceTypeWeights=DEFAULT_FACE_TYPE_WEIGHTS, name='sim3d1'):
+    """Bytes of a random mesh file with objectCount objects.
+
+    Each object's vertex and face counts are chosen uniformly from the given (inclusive) ranges.
+    """
+    if vertexCountRange[0] < 3:
+        raise ValueError("Objects must have at least 3 vertices (including the origin).")
+
+    rng = np.random.default_rng(seed)
+
+    objects = []
+    for index in range(objectCount):
+        vertexCount = int(rng.integers(vertexCountRange[0], vertexCountRange[1], endpoint=True))
+        faceCount = int(rng.integers(faceCountRange[0], faceCountRange[1], endpoint=True))
+        objects.append(synthetic_object(rng, index, vertexCount, faceCount, faceTypeWeights))
+
+    # (rendered vertex count, face count, unique vertex count) of each object.
+    counts = [count_object(objectBytes) for objectBytes in objects]
+
+    entryCount = objectCount + 1 # The first entry holds totals.
+    geomTableAddress = GEOM_ADDRESS + LENGTH_GEOM_HEADER
+    duplicateTableAddress = geomTableAddress + entryCount*LENGTH_GEOM_TABLE_ENTRY
+    firstObjectAddress = duplicateTableAddress + objectCount*LENGTH_DUPLICATE_GEOM_TABLE_ENTRY
+
+    addresses = np.concatenate([[0], np.cumsum([len(o) for o in objects])]).astype(np.int64) + firstObjectAddress
+    fileSize = int(addresses[-1])
+
+    header = bytearray(STRUCT_DIRC.pack(b'DIRC', fileSize, 2))
+    header += b'CMAP' + CMAP_ADDRESS.to_bytes(4, 'little') + b'GEOM' + GEOM_ADDRESS.to_bytes(4, 'little')
+
+    # Colour map section, then the colour map itself (see "Colour Map (CMAP)" in the format description).
+    header += b'CMAP' + (801).to_bytes(4, 'little') + (1).to_bytes(4, 'little')
+    header += b'CMAP' + bytes([0, 123, 124, 131]) + bytes([0x00, 0x00, 0x80, 0x80, 0x00, 0x80, 0x00, 0x80, 0x80])
+    header += OFFSET_PALETTE.to_bytes(4, 'little')
+    header += rng.integers(0, 256, size=3*PALETTE_SIZE, dtype=np.uint8).tobytes()
+    assert len(header) == GEOM_ADDRESS
+
+    header += STRUCT_GEOM_HEADER.pack(b'GEOM', LENGTH_GEOM_HEADER + entryCount*LENGTH_GEOM_TABLE_ENTRY + objectCount*LENGTH_DUPLICATE_GEOM_TABLE_ENTRY,
+                                      entryCount, objectCount, geomTableAddress, duplicateTableAddress)
+
+    totals = np.sum(counts, axis=0, dtype=np.int64).tolist() if counts else [0, 0, 0]
+    header += STRUCT_GEOM_TABLE_ENTRY.pack(name.encode('ascii'), firstObjectAddress, objectCount, 0, totals[0], 0, 0, totals[1], totals[2], 0)
+    for index, (renderedVertexCount, faceCount, vertexCount) in enumerate(counts):
+        header += STRUCT_GEOM_TABLE_ENTRY.pack(f"OBJ{index}".encode('ascii'), int(addresses[index]), 1, 0,
+                                               renderedVertexCount, 0, 0, faceCount, vertexCount, 0)
+    for index, (renderedVertexCount, faceCount, vertexCount) in enumerate(counts):
+        header += STRUCT_DUPLICATE_GEOM_TABLE_ENTRY.pack(index, int(addresses[index]), 0, renderedVertexCount, 0, 0, faceCount, vertexCount, 0)
+    assert len(header) == firstObjectAddress
+
+    return b''.join([header, *objects])
+
+
+def write_synthetic_mesh_file(path, objectCount=DEFAULT_OBJECT_COUNT, seed=0, **kwargs):
+    """Write a random mesh file (see synthetic_mesh_file) and return its size."""
+    data = synthetic_mesh_file(objectCount, seed, **kwargs)
+    with open(path, 'wb') as file:
+        file.write(data)
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.synthetic', description="Write a synthetic Maxis mesh file with random objects.")
+    parser.add_argument('output', help="Output path.")
+    parser.add_argument('-n', '--objects', type=int, default=DEFAULT_OBJECT_COUNT, help=f"Number of objects (default: {DEFAULT_OBJECT_COUNT}).")
+    parser.add_argument('-s', '--seed', type=int, default=0, help="Random seed (default: 0).")
+    args = parser.parse_args(argv)
+
+    size = write_synthetic_mesh_file(args.output, args.objects, args.seed)
+    print(f"Wrote {args.objects} objects ({size} bytes) to {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Rows and output formats of the tables produced by the scripts in the Tabulation-scripts folder.
+# Requires NumPy.
+
+# Rows are generated from the arrays returned by maxis_mesh.arrays.decode_headers. The output formats match the ones written by
+# tabulate-object-header-info.py, tabulate-collision-bytes.py, tabulate-face-info.py and tabulate-mesh-names.py.
+
+import numpy as np
+
+from .max_file import LENGTH_OBJECT_HEADER, RADIUS_SCALE_FACTOR, decode_name
+
+OBJECT_HEADER_HEADINGS = ['file', 'index', 'offset', 'vertex count', 'face count', 'attributes','radius', 'radius scaled', 'y radius', 'name', 'texture file', 'anim count?', 'anim pointer?', 'ID']
+COLLISION_HEADINGS = ['file','index','offset','col-1', 'col-2', 'col-3', 'col-4']
+FACE_HEADINGS = ['vertexCount', 'flags', 'isLight', 'group', 'face type', 'tex/color', 'texFile']
+MESH_NAME_HEADINGS = ["Name from Geometry Table", "Name from Object Block"]
+
+OBJECT_HEADER_TABLE = 'object-header-info'
+COLLISION_TABLE = 'collision-bytes'
+FACE_TABLE = 'face-info'
+MESH_NAME_TABLE = 'mesh-names'
+
+TABLES = [OBJECT_HEADER_TABLE, COLLISION_TABLE, FACE_TABLE, MESH_NAME_TABLE]
+
+
+def _raw_object_headers(headers):
+    return np.ascontiguousarray(headers.objects).view(np.uint8).reshape(-1, LENGTH_OBJECT_HEADER)
+
+
+def object_header_rows(headers, fileLabel):
+    raw = _raw_object_headers(headers)
+    fields = headers.objects[['vertex_count', 'face_count', 'attributes', 'radius', 'y_radius', 'anim_count', 'anim_pointer', 'id']].tolist()
+
+    for index, (offset, values) in enumerate(zip(headers.object_offsets.tolist(), fields)):
+        vertexCount, faceCount, attributes, radius, yRadius, animCount, animPointer, id = values
+        name = raw[index, 24:48].tobytes().decode('ascii', 'ignore')
+        textureFile = raw[index, 48:112].tobytes().decode('ascii', 'ignore')
+        yield [fileLabel, index, offset, vertexCount, faceCount, attributes, radius, radius/RADIUS_SCALE_FACTOR, yRadius, name, textureFile, animCount, animPointer, id]
+
+
+def collision_rows(headers, fileLabel):
+    raw = _raw_object_headers(headers)
+    collisionBytes = raw[:, 16:20].tolist()
+
+    for index, (offset, values) in enumerate(zip(headers.object_offsets.tolist(), collisionBytes)):
+        yield [fileLabel, index, offset, *values]
+
+
+FACE_FIELDS = ['vertex_count', 'flags', 'is_light', 'group', 'face_type', 'tex_index', 'tex_file']
+
+
+def face_rows(headers):
+    for values in headers.faces[FACE_FIELDS].tolist():
+        yield list(values)
+
+
+# Number of face rows formatted at a time by face_csv_chunks.
+FACE_CSV_CHUNK_SIZE = 65536
+
+
+def face_csv_chunks(headers, chunkSize=FACE_CSV_CHUNK_SIZE):
+    """The rows of face_rows formatted as CSV lines, yielded in chunks of up to chunkSize rows.
+
+    Each chunk is formatted with a single format operation rather than one per row.
+    """
+    faces = headers.faces
+    rowFormat = ', '.join(['%d']*len(FACE_FIELDS)) + '\n'
+    for start in range(0, len(faces), chunkSize):
+        chunk = faces[start:start + chunkSize]
+        columns = np.column_stack([chunk[field].astype(np.int64) for field in FACE_FIELDS])
+        yield rowFormat*len(chunk) % tuple(columns.ravel().tolist())
+
+
+def face_csv_text(headers):
+    """The rows of face_rows formatted as CSV lines."""
+    return ''.join(face_csv_chunks(headers))
+
+
+def collision_csv_text(headers, fileLabel):
+    """The rows of collision_rows formatted as CSV lines."""
+    raw = _raw_object_headers(headers)
+    if len(raw) == 0:
+        return ''
+    columns = np.column_stack([np.arange(len(raw)), headers.object_offsets, raw[:, 16:20].astype(np.int64)])
+    values = []
+    for row in columns.tolist():
+        values.append(fileLabel)
+        values.extend(row)
+    return '%s, %d, %d, %d, %d, %d, %d\n'*len(raw) % tuple(values)
+
+
+def object_header_columns(headers):
+    """The object header table as a dict of arrays (for maxis_mesh.columnar), excluding the file column.
+
+    Unlike the CSV table, names and texture file names end at the first null byte.
+    """
+    raw = _raw_object_headers(headers)
+    objects = headers.objects
+    return {
+        'index': np.arange(len(objects), dtype=np.int32),
+        'offset': headers.object_offsets,
+        'vertex_count': objects['vertex_count'],
+        'face_count': objects['face_count'],
+        'attributes': objects['attributes'],
+        'radius': objects['radius'],
+        'radius_scaled': objects['radius']/RADIUS_SCALE_FACTOR,
+        'y_radius': objects['y_radius'],
+        'name': np.array([decode_name(row[24:48].tobytes()) for row in raw], dtype=str),
+        'texture_file': np.array([decode_name(row[48:112].tobytes()) for row in raw], dtype=str),
+        'anim_count': objects['anim_count'],
+        'anim_pointer': objects['anim_pointer'],
+        'id': objects['id'],
+    }
+
+
+def face_columns(headers):
+    """The face table as a dict of arrays (for maxis_mesh.columnar), excluding the file column.
+
+    Unlike the CSV table, it also includes the index of the object each face belongs to and the file offset of each face.
+    """
+    faces = headers.faces
+    columns = {
+        'object': np.repeat(np.arange(len(headers.objects), dtype=np.int32), np.diff(headers.object_face_offsets)),
+        'offset': headers.face_offsets,
+    }
+    for field in FACE_FIELDS:
+        columns[field] = faces[field]
+    return columns
+
+
+def mesh_name_rows(headers):
+    raw = _raw_object_headers(headers)
+
+    for index, tableName in enumerate(headers.table_names):
+        yield [tableName, decode_name(raw[index, 24:112].tobytes())]
+
+
+def format_csv_row(row):
+    return ', '.join([str(v) for v in row]) + '\n'
+
+
+def write_csv_rows(out, rows):
+    for row in rows:
+        out.write(format_csv_row(row))
+
+
+def mesh_names_title(generatedBy):
+    return f"# Names of Meshes (SimCopter and Streets of SimCity)\n\nGenerated by `{generatedBy}`\n"
+
+
+def mesh_names_section_heading(key):
+    return f"\n## {key}\n\n" + " | ".join(MESH_NAME_HEADINGS) + '\n' + "--- | ---" + '\n'
+
+
+def format_mesh_name_row(entry):
+    return f"{entry[0]} | {entry[1]}\n"
+
+
+def write_mesh_names_title(out, generatedBy):
+    out.write(mesh_names_title(generatedBy))
+
+
+def write_mesh_names_section(out, key, rows):
+    out.write(mesh_names_section_heading(key))
+
+    for entry in rows:
+        out.write(format_mesh_name_row(entry))
@@ -0,0 +1,283 @@
+# Decoding of the games' texture files (sim3d.bmp and sky.bmp) into RGB arrays, with a memory-mapped cache.
+# Requires NumPy.
+
+# A texture file contains a sequence of textures, each of which is a width x height grid of palette indices. Layout:
+#   Offset 8: number of textures (Int, 4 bytes)
+#   Offset 12: number of resolution blocks (Int, 4 bytes); each is 12 bytes and they're followed by the first texture
+#   Each texture: width, height and an unknown value (Ints, 4 bytes each), a 4-byte value for each row, then width*height
+#   palette indices (one byte each) starting with the bottom row.
+# Faces with a texture file of 0 use a dedicated texture (texture index i in sim3d.bmp). Other faces use a 32x32 tile within a
+# texture atlas: texture texFile in sim3d.bmp, except for texture file 20, which is texture 4 in sky.bmp. Atlases are 8 tiles
+# wide; tile i is in column i % 8 and row i // 8, counting rows from the bottom.
+# (See the Processing viewer's class_texture_set.pde and functions_texture.pde, which this matches.)
+
+# Textures are decoded with the colour map from a mesh file (or a .gpl palette) in one array operation per file, and the
+# result is saved to a sidecar file (sim3d.bmp.mmtex, or in cacheDir if specified). Later loads memory-map the sidecar, so each
+# texture is a zero-copy view of it. The sidecar records the texture file's size and modification time and a digest of the
+# palette, and is rebuilt if either changes.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.texture <texture file> [...] --palette <sim3d1.max or .gpl file> [--cache-dir <path>]
+
+import argparse
+import hashlib
+import os
+import struct
+import time
+
+import numpy as np
+
+from .cache import INDEX_EXTENSION, index_path
+from .palette import Palette, load_palette
+
+OFFSET_TEXTURE_COUNT = 8
+OFFSET_RESOLUTION_BLOCK_COUNT = 12
+LENGTH_TEXTURE_FILE_HEADER = 16
+LENGTH_RESOLUTION_BLOCK = 12
+LENGTH_TEXTURE_HEADER = 12
+LENGTH_ROW_ENTRY = 4
+
+STRUCT_TEXTURE_HEADER = struct.Struct('<III') # Width, height, unknown
+
+ATLAS_TILE_SIZE = 32
+ATLAS_COLUMNS = 8
+ATLAS_ROWS = 8
+
+# Faces with texture file 20 use texture 4 in sky.bmp rather than texture 20 in sim3d.bmp.
+TEX_FILE_SKY = 20
+SKY_ATLAS_INDEX = 4
+
+CACHE_EXTENSION = '.mmtex'
+CACHE_MAGIC = b'MMTX'
+CACHE_VERSION = 1
+CACHE_ALIGNMENT = 64
+
+# Magic, version, texture file size, mtime (ns), SHA-1 digest of the palette, texture count, offset of the pixel data.
+STRUCT_CACHE_HEADER = struct.Struct('<4sIQQ20sIQ')
+# Offset (in pixels) within the pixel data, width, height.
+STRUCT_CACHE_RECORD = struct.Struct('<QII')
+
+
+class TextureSet:
+    """The palette-indexed textures in a texture file (sim3d.bmp or sky.bmp).
+
+    indices(i) returns texture i as a (height, width) uint8 array of palette indices with the top row first (a view of the file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = file.read()
+
+        data = self.data
+        textureCount = struct.unpack_from('<I', data, OFFSET_TEXTURE_COUNT)[0]
+        resolutionBlockCount = struct.unpack_from('<I', data, OFFSET_RESOLUTION_BLOCK_COUNT)[0]
+
+        # Each texture's size depends on its dimensions, so they have to be found one after another.
+        offsets = np.empty(textureCount, dtype=np.int64)
+        widths = np.empty(textureCount, dtype=np.int64)
+        heights = np.empty(textureCount, dtype=np.int64)
+        pos = LENGTH_TEXTURE_FILE_HEADER + resolutionBlockCount*LENGTH_RESOLUTION_BLOCK
+        for index in range(textureCount):
+            width, height, _ = STRUCT_TEXTURE_HEADER.unpack_from(data, pos)
+            pos += LENGTH_TEXTURE_HEADER + height*LENGTH_ROW_ENTRY
+            offsets[index], widths[index], heights[index] = pos, width, height
+            pos += width*height
+
+        if pos > len(data):
+            raise ValueError(f"{path} is truncated: its textures extend to offset {pos}, but it's only {len(data)} bytes long.")
+
+        self.pixel_offsets = offsets # File offset of each texture's palette indices
+        self.widths = widths
+        self.heights = heights
+
+    def __len__(self):
+        return len(self.pixel_offsets)
+
+    def indices(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(f"Texture {index} is invalid: there are only {len(self)} textures in {self.path}.")
+        width, height = int(self.widths[index]), int(self.heights[index])
+        rows = np.frombuffer(self.data, dtype=np.uint8, count=width*height, offset=int(self.pixel_offsets[index])).reshape(height, width)
+        return rows[::-1]
+
+    def decode(self, palette):
+        """Every texture's pixels with the palette (an (N, 3) array of colours) applied.
+
+        Returns (pixel offset of each texture, pixels as a (total pixel count, 3) uint8 array), with each texture's rows
+        starting from the top.
+        """
+        pixelCounts = self.widths*self.heights
+        starts = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(pixelCounts, out=starts[1:])
+
+        indices = np.empty(int(starts[-1]), dtype=np.uint8)
+        for index in range(len(self)):
+            indices[starts[index]:starts[index + 1]] = self.indices(index).reshape(-1)
+
+        return starts[:-1], np.asarray(palette, dtype=np.uint8)[indices]
+
+
+class DecodedTextures:
+    """The textures of a texture file as RGB images.
+
+    textures[i] is a (height, width, 3) uint8 array with the top row first. If the textures were loaded from the cache, each
+    one is a view of the memory-mapped cache file.
+    """
+
+    def __init__(self, path, offsets, widths, heights, pixels):
+        self.path = path
+        self.offsets = offsets
+        self.widths = widths
+        self.heights = heights
+        self.pixels = pixels
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(f"Texture {index} is invalid: there are only {len(self)} textures in {self.path}.")
+        start = int(self.offsets[index])
+        width, height = int(self.widths[index]), int(self.heights[index])
+        return self.pixels[start:start + width*height].reshape(height, width, 3)
+
+    def to_bytes_header(self, fileSize, mtime, paletteDigest):
+        pixelStart = STRUCT_CACHE_HEADER.size + len(self)*STRUCT_CACHE_RECORD.size
+        pixelStart += -pixelStart % CACHE_ALIGNMENT
+        header = bytearray(STRUCT_CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, fileSize, mtime, paletteDigest, len(self), pixelStart))
+        for offset, width, height in zip(self.offsets.tolist(), self.widths.tolist(), self.heights.tolist()):
+            header += STRUCT_CACHE_RECORD.pack(offset, width, height)
+        return bytes(header.ljust(pixelStart, b'\0'))
+
+
+def palette_colors(palette):
+    """(256, 3) uint8 colours from a Palette, an array of colours or a path (a mesh file or .gpl file)."""
+    if isinstance(palette, (str, os.PathLike)):
+        palette = load_palette(palette)
+    if isinstance(palette, Palette):
+        return palette.colors
+    return np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+
+
+def palette_digest(colors):
+    return hashlib.sha1(np.ascontiguousarray(colors, dtype=np.uint8).tobytes()).digest()
+
+
+def cache_path(path, cacheDir=None):
+    """Path of the cache file for a texture file. If cacheDir is given, the cache is stored there instead of next to the texture file."""
+    return index_path(path, cacheDir)[:-len(INDEX_EXTENSION)] + CACHE_EXTENSION
+
+
+def _read_cache(path, cachePath, fileSize, mtime, paletteDigest):
+    try:
+        with open(cachePath, 'rb') as file:
+            header = file.read(STRUCT_CACHE_HEADER.size)
+            magic, version, cachedSize, cachedMtime, cachedDigest, count, pixelStart = STRUCT_CACHE_HEADER.unpack(header)
+            if (magic != CACHE_MAGIC or version != CACHE_VERSION or cachedSize != fileSize or cachedMtime != mtime
+                    or cachedDigest != paletteDigest):
+                return None
+            records = np.frombuffer(file.read(count*STRUCT_CACHE_RECORD.size), dtype=np.dtype([('offset', '<u8'), ('width', '<u4'), ('height', '<u4')]))
+
+        offsets = records['offset'].astype(np.int64)
+        widths = records['width'].astype(np.int64)
+        heights = records['height'].astype(np.int64)
+        pixelCount = int((widths*heights).sum())
+        if len(records) != count or os.path.getsize(cachePath) != pixelStart + 3*pixelCount:
+            return None
+        pixels = np.memmap(cachePath, dtype=np.uint8, mode='r', offset=pixelStart, shape=(pixelCount, 3)) if pixelCount else np.zeros((0, 3), dtype=np.uint8)
+        return DecodedTextures(path, offsets, widths, heights, pixels)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _write_cache(textures, cachePath, fileSize, mtime, paletteDigest):
+    # Write to a temporary file first so a partially-written cache is never read.
+    tempPath = cachePath + '.tmp'
+    try:
+        directory = os.path.dirname(cachePath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tempPath, 'wb') as file:
+            file.write(textures.to_bytes_header(fileSize, mtime, paletteDigest))
+            file.write(np.ascontiguousarray(textures.pixels).data)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        # The cache is only a cache; failing to write it (e.g., read-only game folder) isn't an error.
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+
+
+def load_textures(path, palette, cacheDir=None):
+    """Decode the textures in a texture file (or load them from the cache) as a DecodedTextures.
+
+    palette is a Palette, an array of colours or the path of a mesh file (its colour map is used) or .gpl file.
+    """
+    colors = palette_colors(palette)
+    digest = palette_digest(colors)
+    stat = os.stat(path)
+    cachePath = cache_path(path, cacheDir)
+
+    cached = _read_cache(path, cachePath, stat.st_size, stat.st_mtime_ns, digest)
+    if cached is not None:
+        return cached
+
+    textureSet = TextureSet(path)
+    offsets, pixels = textureSet.decode(colors)
+    textures = DecodedTextures(path, offsets, textureSet.widths, textureSet.heights, pixels)
+    _write_cache(textures, cachePath, stat.st_size, stat.st_mtime_ns, digest)
+    return textures
+
+
+class TextureLibrary:
+    """Resolves a face's texture file and texture index to its texture, using sim3d.bmp and (optionally) sky.bmp."""
+
+    def __init__(self, sim3dPath, palette, skyPath=None, cacheDir=None):
+        colors = palette_colors(palette)
+        self.sim3d = load_textures(sim3dPath, colors, cacheDir)
+        self.sky = load_textures(skyPath, colors, cacheDir) if skyPath is not None else None
+
+    def atlas(self, texFile):
+        """The texture atlas used by faces with the given (non-zero) texture file."""
+        if texFile == TEX_FILE_SKY:
+            if self.sky is None:
+                raise ValueError("Texture file 20 refers to sky.bmp, which wasn't loaded.")
+            return self.sky[SKY_ATLAS_INDEX]
+        return self.sim3d[texFile]
+
+    def texture(self, texFile, texIndex):
+        """The (height, width, 3) image used by a face: a dedicated texture (texFile 0) or a tile of an atlas (a view of it)."""
+        if texFile == 0:
+            return self.sim3d[texIndex]
+
+        atlas = self.atlas(texFile)
+        row, column = divmod(texIndex, ATLAS_COLUMNS)
+        if row >= ATLAS_ROWS:
+            raise IndexError(f"Tile {texIndex} is invalid: atlases contain {ATLAS_ROWS*ATLAS_COLUMNS} tiles.")
+        # Rows are counted from the bottom, but the image's rows start from the top.
+        top = (ATLAS_ROWS - 1 - row)*ATLAS_TILE_SIZE
+        return atlas[top:top + ATLAS_TILE_SIZE, column*ATLAS_TILE_SIZE:(column + 1)*ATLAS_TILE_SIZE]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.texture', description="Decode Maxis texture files (sim3d.bmp and sky.bmp) and cache the results.")
+    parser.add_argument('paths', nargs='+', help="Texture files.")
+    parser.add_argument('-p', '--palette', required=True, help="Mesh file (e.g., sim3d1.max) whose colour map is used, or a .gpl palette.")
+    parser.add_argument('--cache-dir', help="Folder for the cache files (default: next to the texture files).")
+    parser.add_argument('--list', action='store_true', help="List the dimensions of each texture.")
+    args = parser.parse_args(argv)
+
+    colors = palette_colors(args.palette)
+    for path in args.paths:
+        begin = time.perf_counter()
+        textures = load_textures(path, colors, args.cache_dir)
+        print(f"{path}: {len(textures)} textures, {len(textures.pixels)} pixels ({(time.perf_counter() - begin)*1000:.1f} ms)")
+        if args.list:
+            for index in range(len(textures)):
+                print(f"  {index}: {textures.widths[index]} x {textures.heights[index]}")
+
+
+if __name__ == '__main__':
+    main()
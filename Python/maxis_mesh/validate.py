@@ -0,0 +1,333 @@
+# Consistency checks for Maxis mesh files and replacement objects (.bin files), to catch problems that would otherwise only
+# show up (usually as a crash) when the game spawns the mesh.
+# Requires NumPy.
+
+# The file or object is decoded into arrays (see maxis_mesh.arrays) and each check is a single array operation over every face,
+# vertex index or object, so validating a whole mesh file takes about as long as decoding it. Checks:
+#   * Each face's flags value is one used with its face type in the games' files (an incompatible value crashes the game).
+#   * Lines have two vertices, points one and polygons at least three.
+#   * Vertex indices are within the object's vertex list (and the vertex after a sprite line's first vertex exists).
+#   * UV coordinates of faces with dedicated textures are within [0, 1] (0 to 65536).
+#   * Each face's size field matches its vertex count, and each object's size field is 12 less than its actual size.
+#   * The bounding radius covers the object's vertices in the XZ plane (vertices outside it are ignored for collision).
+# For mesh files, the objects must also lie within the file without overlapping, and the counts in the geometry tables must match
+# the objects (the totals in the first entry are errors; per-object counts are warnings, since mesh-replace doesn't update them).
+# Files and objects that can't be decoded at all (e.g., truncated ones) are reported as a single structure error.
+
+# Usage (from the Python folder):
+#   python -m maxis_mesh.validate <mesh file or .bin file> [...] [--strict] [--max-issues <count>]
+# The exit status is 1 if any errors (or, with --strict, warnings) are found, so it can be used as a pre-commit hook.
+
+import argparse
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from .arrays import decode_arrays, decode_object_bytes
+from .max_file import MaxFile, LENGTH_OBJECT_HEADER, LENGTH_FACE_HEADER, LENGTH_VERTEX, OBJECT_SIZE_DEFICIT
+from .model import MaxObject
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Flag values used with each face type in the games' files (see "Face Flags" in Info/Maxis-Mesh-Format.md). The first value for
+# each type is the one used by the Blender export script (faceTypeToFlagValue).
+FACE_TYPE_FLAGS = {
+    2: (22, 8214),
+    11: (2,),
+    13: (8194,),
+    15: (3, 2050),
+    18: (8194,),
+    19: (16386,),
+    20: (32770,),
+    25: (2,),
+    26: (2,),
+}
+
+# Number of vertices of lines and points; other face types are polygons with at least three.
+FACE_TYPE_VERTEX_COUNTS = {
+    2: 2,
+    20: 2,
+    25: 1,
+    26: 1,
+}
+
+FACE_TYPE_LINE_SPRITE = 2
+FACE_TYPE_TEXTURED_DEDICATED = 13
+
+UV_MAXIMUM = 2**16
+
+GEOM_TABLE_ENTRY_DTYPE = np.dtype([
+    ('name', 'S17'),
+    ('address', '<u4'),
+    ('object_count', '<u4'),
+    ('unknown1', '<u4'),
+    ('rendered_vertex_count', '<u4'),
+    ('unknown2', '<u4'),
+    ('unknown3', '<u4'),
+    ('face_count', '<u4'),
+    ('unique_vertex_count', '<u4'),
+    ('unknown4', '<u4'),
+])
+
+DUPLICATE_GEOM_TABLE_ENTRY_DTYPE = np.dtype([
+    ('id', '<i4'),
+    ('address', '<u4'),
+    ('unknown1', '<u4'),
+    ('rendered_vertex_count', '<u4'),
+    ('unknown2', '<u4'),
+    ('unknown3', '<u4'),
+    ('face_count', '<u4'),
+    ('unique_vertex_count', '<u4'),
+    ('unknown4', '<u4'),
+])
+
+
+class Issue(namedtuple('Issue', [
+        'severity', # ERROR or WARNING
+        'check', # Short name of the check that failed
+        'object', # Object index, or -1 for the file as a whole
+        'face', # Face index within the object, or -1
+        'message',
+        ])):
+
+    __slots__ = ()
+
+    def __str__(self):
+        location = ''
+        if self.object >= 0:
+            location = f"object {self.object}" + (f", face {self.face}" if self.face >= 0 else '') + ": "
+        return f"{self.severity}: {location}{self.message} [{self.check}]"
+
+
+def _face_issues(severity, check, faceIds, faceObjects, faceIndices, messages):
+    return [Issue(severity, check, o, f, message) for o, f, message in zip(faceObjects[faceIds].tolist(), faceIndices[faceIds].tolist(), messages)]
+
+
+def check_arrays(arrays):
+    """Issues found in decoded objects (a MeshArrays), in check order."""
+    issues = []
+
+    objects = arrays.objects
+    faces = arrays.faces
+    vertexCounts = np.diff(arrays.object_vertex_offsets)
+    faceCounts = np.diff(arrays.object_face_offsets)
+    faceObjectIds = np.repeat(np.arange(len(objects)), faceCounts)
+    faceObjects = faceObjectIds
+    faceIndices = np.arange(len(faces)) - arrays.object_face_offsets[faceObjectIds]
+
+    faceTypes = faces['face_type'].astype(np.int64)
+    flags = faces['flags'].astype(np.int64)
+    faceVertexCounts = faces['vertex_count'].astype(np.int64)
+
+    # Face type and flags.
+    isKnown = np.isin(faceTypes, list(FACE_TYPE_FLAGS))
+    flagsValid = np.zeros(len(faces), dtype=bool)
+    for faceType, values in FACE_TYPE_FLAGS.items():
+        flagsValid |= (faceTypes == faceType) & np.isin(flags, values)
+
+    bad = np.flatnonzero(isKnown & ~flagsValid)
+    issues += _face_issues(ERROR, 'face-flags', bad, faceObjects, faceIndices,
+                           [f"face type {t} has flags {v} (expected {' or '.join(map(str, FACE_TYPE_FLAGS[t]))})"
+                            for t, v in zip(faceTypes[bad].tolist(), flags[bad].tolist())])
+
+    bad = np.flatnonzero(~isKnown)
+    issues += _face_issues(WARNING, 'face-type', bad, faceObjects, faceIndices,
+                           [f"unknown face type {t}" for t in faceTypes[bad].tolist()])
+
+    # Vertex counts of lines, points and polygons.
+    expectedCounts = np.full(len(faces), -1, dtype=np.int64)
+    for faceType, count in FACE_TYPE_VERTEX_COUNTS.items():
+        expectedCounts[faceTypes == faceType] = count
+    isPolygon = isKnown & (expectedCounts < 0)
+    bad = np.flatnonzero(((expectedCounts >= 0) & (faceVertexCounts != expectedCounts)) | (isPolygon & (faceVertexCounts < 3)))
+    issues += _face_issues(ERROR, 'face-vertex-count', bad, faceObjects, faceIndices,
+                           [f"face type {t} has {n} vertices (expected {e if e >= 0 else 'at least 3'})"
+                            for t, n, e in zip(faceTypes[bad].tolist(), faceVertexCounts[bad].tolist(), expectedCounts[bad].tolist())])
+
+    # Declared face sizes.
+    expectedSizes = LENGTH_FACE_HEADER + 10*faceVertexCounts
+    declaredSizes = faces['size'].astype(np.int64)
+    bad = np.flatnonzero(declaredSizes != expectedSizes)
+    issues += _face_issues(ERROR, 'face-size', bad, faceObjects, faceIndices,
+                           [f"size is {d} (expected {e} for {n} vertices)"
+                            for d, e, n in zip(declaredSizes[bad].tolist(), expectedSizes[bad].tolist(), faceVertexCounts[bad].tolist())])
+
+    # Vertex index bounds. Index 0 is the origin, which faces don't normally use.
+    indexFaces = np.repeat(np.arange(len(faces)), faceVertexCounts)
+    indices = arrays.vertex_indices.astype(np.int64)
+    limits = vertexCounts[faceObjectIds][indexFaces]
+    badFaces = np.zeros(len(faces), dtype=bool)
+    badFaces[indexFaces[indices >= limits]] = True
+    bad = np.flatnonzero(badFaces)
+    maxIndices = np.zeros(len(faces), dtype=np.int64)
+    np.maximum.at(maxIndices, indexFaces, indices)
+    issues += _face_issues(ERROR, 'vertex-index', bad, faceObjects, faceIndices,
+                           [f"vertex index {i} is out of range (the object has {n} vertices)"
+                            for i, n in zip(maxIndices[bad].tolist(), vertexCounts[faceObjectIds[bad]].tolist())])
+
+    usesOrigin = np.zeros(len(faces), dtype=bool)
+    usesOrigin[indexFaces[indices == 0]] = True
+    bad = np.flatnonzero(usesOrigin)
+    issues += _face_issues(WARNING, 'origin-vertex', bad, faceObjects, faceIndices, ["uses the origin vertex (index 0)"]*len(bad))
+
+    # The vertex after a sprite line's first vertex is the midpoint of the bottom of the sprite.
+    firstIndices = np.zeros(len(faces), dtype=np.int64)
+    hasVertices = faceVertexCounts > 0
+    firstIndices[hasVertices] = indices[arrays.face_vertex_offsets[:-1][hasVertices]]
+    bad = np.flatnonzero((faceTypes == FACE_TYPE_LINE_SPRITE) & hasVertices & (firstIndices + 1 >= vertexCounts[faceObjectIds]))
+    issues += _face_issues(ERROR, 'sprite-vertex', bad, faceObjects, faceIndices,
+                           [f"sprite line starts at vertex {i}, but there's no vertex {i + 1}" for i in firstIndices[bad].tolist()])
+
+    # UVs of faces with dedicated textures.
+    uvOutside = np.any((arrays.uvs < 0) | (arrays.uvs > UV_MAXIMUM), axis=1)
+    badFaces = np.zeros(len(faces), dtype=bool)
+    badFaces[indexFaces[uvOutside]] = True
+    bad = np.flatnonzero(badFaces & (faceTypes == FACE_TYPE_TEXTURED_DEDICATED))
+    issues += _face_issues(ERROR, 'uv-range', bad, faceObjects, faceIndices, ["UV coordinates are outside [0, 1]"]*len(bad))
+
+    # Declared object sizes.
+    faceBytes = np.bincount(faceObjectIds, weights=declaredSizes, minlength=len(objects)).astype(np.int64)
+    actualSizes = LENGTH_OBJECT_HEADER + LENGTH_VERTEX*vertexCounts + faceBytes
+    declaredObjectSizes = objects['size'].astype(np.int64) + OBJECT_SIZE_DEFICIT
+    for index in np.flatnonzero(declaredObjectSizes != actualSizes).tolist():
+        issues.append(Issue(ERROR, 'object-size', index, -1,
+                            f"size field is {declaredObjectSizes[index] - OBJECT_SIZE_DEFICIT} (expected {actualSizes[index] - OBJECT_SIZE_DEFICIT}, 12 less than the object's size)"))
+
+    # Bounding radius (centred on the origin vertex) vs. the vertices' extent in the XZ plane.
+    vertexObjects = np.repeat(np.arange(len(objects)), vertexCounts)
+    origins = arrays.vertices[arrays.object_vertex_offsets[:-1][vertexCounts > 0]]
+    originOfVertex = np.zeros((len(objects), 3), dtype=np.int64)
+    originOfVertex[vertexCounts > 0] = origins
+    relative = arrays.vertices.astype(np.float64) - originOfVertex[vertexObjects]
+    distances = np.hypot(relative[:, 0], relative[:, 2])
+    extents = np.zeros(len(objects))
+    np.maximum.at(extents, vertexObjects, distances)
+    radii = objects['radius'].astype(np.int64)
+    for index in np.flatnonzero(np.floor(extents) > radii).tolist():
+        issues.append(Issue(WARNING, 'radius', index, -1,
+                            f"bounding radius {radii[index]} is smaller than the vertices' XZ extent {int(np.ceil(extents[index]))}"))
+
+    return issues
+
+
+def _read_table(data, dtype, address, count):
+    if address + count*dtype.itemsize > len(data):
+        return None
+    return np.frombuffer(data, dtype=dtype, count=count, offset=address)
+
+
+def check_geometry_tables(maxFile, arrays):
+    """Issues with the geometry tables and object layout of an open MaxFile whose objects have been decoded into arrays."""
+    issues = []
+    data = maxFile.data
+    objectCount = len(arrays.objects)
+
+    if maxFile.declared_size != len(data):
+        issues.append(Issue(WARNING, 'file-size', -1, -1, f"DIRC header gives the file size as {maxFile.declared_size}, but it's {len(data)} bytes"))
+
+    vertexCounts = np.diff(arrays.object_vertex_offsets)
+    faceCounts = np.diff(arrays.object_face_offsets)
+    faceObjectIds = np.repeat(np.arange(objectCount), faceCounts)
+    renderedCounts = np.bincount(faceObjectIds, weights=arrays.faces['vertex_count'], minlength=objectCount).astype(np.int64)
+
+    # Objects must lie within the file without overlapping (in address order).
+    starts = arrays.object_offsets
+    ends = starts + arrays.objects['size'].astype(np.int64) + OBJECT_SIZE_DEFICIT
+    order = np.argsort(starts, kind='stable')
+    for index in order[ends[order] > len(data)].tolist():
+        issues.append(Issue(ERROR, 'object-bounds', index, -1, f"ends at offset {ends[index]}, after the end of the file ({len(data)})"))
+    overlapping = order[:-1][ends[order[:-1]] > starts[order[1:]]]
+    for index in overlapping.tolist():
+        issues.append(Issue(ERROR, 'object-bounds', index, -1, f"ends at offset {ends[index]}, overlapping the next object"))
+
+    # Counts in the geometry table (the first entry holds totals) and its duplicate.
+    table = _read_table(data, GEOM_TABLE_ENTRY_DTYPE, maxFile.geom_table_address, objectCount + 1)
+    duplicate = _read_table(data, DUPLICATE_GEOM_TABLE_ENTRY_DTYPE, maxFile.duplicate_geom_table_address, objectCount)
+    if table is None or duplicate is None:
+        issues.append(Issue(ERROR, 'geometry-table', -1, -1, "geometry tables extend past the end of the file"))
+        return issues
+
+    counts = {
+        'rendered_vertex_count': renderedCounts,
+        'face_count': faceCounts,
+        'unique_vertex_count': vertexCounts,
+    }
+    for field, actual in counts.items():
+        fieldName = field.replace('_', ' ')
+        if int(table[field][0]) != int(actual.sum()):
+            issues.append(Issue(ERROR, 'geometry-totals', -1, -1,
+                                f"geometry table total {fieldName} is {table[field][0]} (objects have {actual.sum()})"))
+        for entries, tableName in [(table[1:], "geometry table"), (duplicate, "duplicate geometry table")]:
+            for index in np.flatnonzero(entries[field].astype(np.int64) != actual).tolist():
+                issues.append(Issue(WARNING, 'geometry-counts', index, -1,
+                                    f"{tableName} {fieldName} is {entries[field][index]} (object has {actual[index]})"))
+
+    return issues
+
+
+def validate_mesh_file(path):
+    """Issues found in a mesh file."""
+    try:
+        with MaxFile(path) as maxFile:
+            arrays = decode_arrays(maxFile)
+            return check_arrays(arrays) + check_geometry_tables(maxFile, arrays)
+    except (ValueError, IndexError, struct.error) as e:
+        return [Issue(ERROR, 'structure', -1, -1, str(e))]
+
+
+def validate_object(replacement):
+    """Issues found in a replacement object: bytes (e.g., a .bin file's contents) or a MaxObject."""
+    data = replacement.to_bytes() if isinstance(replacement, MaxObject) else bytes(replacement)
+    try:
+        arrays = decode_object_bytes(data)
+    except (ValueError, IndexError, struct.error) as e:
+        return [Issue(ERROR, 'structure', 0, -1, str(e))]
+
+    issues = check_arrays(arrays)
+    end = LENGTH_OBJECT_HEADER + LENGTH_VERTEX*len(arrays.vertices) + int(arrays.faces['size'].astype(np.int64).sum())
+    if end != len(data):
+        issues.append(Issue(ERROR, 'object-size', 0, -1, f"data is {len(data)} bytes, but the object's faces end at {end}"))
+    return issues
+
+
+def validate_path(path):
+    """Issues found in a mesh file or a file containing a single object (distinguished by the DIRC signature)."""
+    with open(path, 'rb') as file:
+        isMeshFile = file.read(4) == b'DIRC'
+    if isMeshFile:
+        return validate_mesh_file(path)
+    with open(path, 'rb') as file:
+        return validate_object(file.read())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m maxis_mesh.validate', description="Check Maxis mesh files and replacement objects for problems.")
+    parser.add_argument('paths', nargs='+', help="Mesh files (sim3d#.max) or object files (.bin).")
+    parser.add_argument('--strict', action='store_true', help="Treat warnings as errors.")
+    parser.add_argument('--max-issues', type=int, default=20, help="Maximum number of issues to print per file (default: 20).")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.paths:
+        issues = validate_path(path)
+        errorCount = sum(issue.severity == ERROR for issue in issues)
+        warningCount = len(issues) - errorCount
+
+        for issue in issues[:args.max_issues]:
+            print(f"{path}: {issue}")
+        if len(issues) > args.max_issues:
+            print(f"{path}: ... and {len(issues) - args.max_issues} more")
+        if issues:
+            print(f"{path}: {errorCount} errors, {warningCount} warnings")
+
+        if errorCount or (args.strict and warningCount):
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# Assembly of OBJX object data (the format written by the Blender export script and read by mesh-replace).
+
+# pack_object is a shortcut for building a MaxObject from arrays (see MaxObject.from_geometry) and encoding it, for callers
+# that only need the bytes (e.g., maxis_mesh.synthetic).
+
+from .model import MaxObject
+
+# Placeholder for the 12 bytes (anim count, anim pointer, ID) that mesh-replace copies from the object being replaced.
+PLACEHOLDER_SIGNATURE = b'DEADDEADDEAD'
+
+
+def pack_object(name, vertices, faceVertexCounts, vertexIndices, uvs, faceTypes, flags, texIndices, texFiles,
+                isLight=0, group=None, collisionBytes=(0, 0, 0, 0), signature=PLACEHOLDER_SIGNATURE):
+    """Build the bytes of an OBJX object.
+
+    vertices: (N, 3) integer coordinates, including the origin vertex.
+    faceVertexCounts: number of vertices in each face.
+    vertexIndices: flat array of every face's vertex indices (indices into vertices, so the origin is 0).
+    uvs: (len(vertexIndices), 2) integer UV coordinates (already multiplied by 65536).
+    faceTypes, flags, texIndices, texFiles, isLight, group: per-face values (or scalars).
+        If group isn't specified, it's set to the texture/colour index as the Blender export script does.
+    collisionBytes: the four bytes at offset 16 of the header.
+    """
+    obj = MaxObject.from_geometry(vertices, faceVertexCounts, vertexIndices, uvs, faceTypes, flags, texIndices, texFiles,
+                                  isLight, group, name=name)
+    obj.collision_bytes = collisionBytes
+    obj.signature = signature
+    return obj.to_bytes()
+
+
+def write_object(path, objectBytes):
+    with open(path, 'wb') as file:
+        file.write(objectBytes)
@@ -0,0 +1,21 @@
+# Shared fixtures for the maxis_mesh tests. Run from the Python folder: python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+# The maxis_mesh package is in the parent folder.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from maxis_mesh.synthetic import write_synthetic_mesh_file
+
+SYNTHETIC_OBJECT_COUNT = 20
+
+
+@pytest.fixture
+def mesh_path(tmp_path):
+    """Path of a small synthetic mesh file."""
+    path = str(tmp_path / 'sim3d1.max')
+    write_synthetic_mesh_file(path, SYNTHETIC_OBJECT_COUNT, seed=1)
+    return path
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+from maxis_mesh.batch import tabulate_files, tabulate_files_incremental
+from maxis_mesh.max_file import MaxFile
+from maxis_mesh.replace import replace_objects
+from maxis_mesh.synthetic import synthetic_object, write_synthetic_mesh_file
+from maxis_mesh import tabulate
+
+
+def read_tables(outputDir):
+    # The contents of each table (not the tabulation state).
+    tables = {}
+    for name in sorted(os.listdir(outputDir)):
+        if not name.endswith('.npz'):
+            with open(os.path.join(outputDir, name), 'rb') as file:
+                tables[name] = file.read()
+    return tables
+
+
+def test_incremental_matches_full(mesh_path, tmp_path):
+    otherPath = str(tmp_path / 'sim3d2.max')
+    write_synthetic_mesh_file(otherPath, 30, seed=2)
+    paths = [mesh_path, otherPath]
+    incrementalDir = str(tmp_path / 'incremental')
+
+    objectCount = 0
+    for path in paths:
+        with MaxFile(path) as maxFile:
+            objectCount += maxFile.object_count
+    assert tabulate_files_incremental(paths, incrementalDir, jobs=1) == objectCount
+
+    # A larger object moves every object after it, so their object header rows change too.
+    with MaxFile(mesh_path) as maxFile:
+        header = maxFile.object_header(3)
+    replacement = synthetic_object(np.random.default_rng(3), 99, header.vertex_count + 5, header.face_count + 5)
+    replace_objects(mesh_path, {3: replacement}, mesh_path)
+
+    assert tabulate_files_incremental(paths, incrementalDir, jobs=1) == 1
+    assert tabulate_files_incremental(paths, incrementalDir, jobs=1) == 0
+
+    fullDir = str(tmp_path / 'full')
+    tabulate_files(paths, fullDir, jobs=1)
+    tables = read_tables(fullDir)
+    assert len(tables) == len(tabulate.TABLES)
+    assert read_tables(incrementalDir) == tables
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from maxis_mesh.max_file import MaxFile, OFFSET_OBJECT_SIGNATURE, LENGTH_OBJECT_SIGNATURE
+from maxis_mesh.replace import count_object, replace_objects
+from maxis_mesh.synthetic import synthetic_object
+from maxis_mesh.validate import validate_mesh_file
+
+REPLACED_INDEX = 5
+
+
+def larger_replacement(maxFile, index):
+    # A random object with more vertices and faces than the one being replaced.
+    header = maxFile.object_header(index)
+    return synthetic_object(np.random.default_rng(2), 99, header.vertex_count + 10, header.face_count + 10)
+
+
+def test_replace_with_different_size(mesh_path, tmp_path):
+    outputPath = str(tmp_path / 'output.max')
+    with MaxFile(mesh_path) as source:
+        replacement = larger_replacement(source, REPLACED_INDEX)
+        sourceObjects = [bytes(source.object_bytes(i)) for i in range(source.object_count)]
+
+    replace_objects(mesh_path, {REPLACED_INDEX: replacement}, outputPath)
+
+    assert validate_mesh_file(outputPath) == []
+
+    with MaxFile(outputPath) as output:
+        assert output.object_count == len(sourceObjects)
+        assert output.declared_size == len(output.data)
+
+        # Untouched objects are unchanged (although the ones after the replaced object have moved).
+        for index, objectBytes in enumerate(sourceObjects):
+            if index != REPLACED_INDEX:
+                assert output.object_bytes(index) == objectBytes
+
+        # The replaced object keeps the original signature.
+        signature = slice(OFFSET_OBJECT_SIGNATURE, OFFSET_OBJECT_SIGNATURE + LENGTH_OBJECT_SIGNATURE)
+        replaced = bytes(output.object_bytes(REPLACED_INDEX))
+        assert replaced[signature] == sourceObjects[REPLACED_INDEX][signature]
+        assert replaced[:signature.start] + replaced[signature.stop:] == replacement[:signature.start] + replacement[signature.stop:]
+
+        # Both geometry tables have each object's address and counts, and the first entry has the totals.
+        counts = [count_object(output.object_bytes(i)) for i in range(output.object_count)]
+        for index, (renderedVertexCount, faceCount, vertexCount) in enumerate(counts):
+            for entry in (output.geom_table_entry(index), output.duplicate_geom_table_entry(index)):
+                assert entry.address == output.object_offsets[index]
+                assert (entry.rendered_vertex_count, entry.face_count, entry.unique_vertex_count) == \
+                    (renderedVertexCount, faceCount, vertexCount)
+        totals = output.totals
+        assert [totals.rendered_vertex_count, totals.face_count, totals.unique_vertex_count] == np.sum(counts, axis=0).tolist()
+
+
+def test_replace_in_place(mesh_path):
+    with MaxFile(mesh_path) as source:
+        replacement = larger_replacement(source, 0)
+        size = len(source.data)
+
+    replace_objects(mesh_path, {0: replacement}, mesh_path)
+
+    assert validate_mesh_file(mesh_path) == []
+    with MaxFile(mesh_path) as output:
+        assert len(output.data) > size
+
+
+def test_invalid_replacement(mesh_path, tmp_path):
+    outputPath = tmp_path / 'output.max'
+    with MaxFile(mesh_path) as source:
+        truncated = larger_replacement(source, REPLACED_INDEX)[:-1]
+
+    with pytest.raises(ValueError, match="Invalid replacement for mesh 5"):
+        replace_objects(mesh_path, {REPLACED_INDEX: truncated}, str(outputPath))
+    assert not outputPath.exists()